@@ -20,10 +20,12 @@ vc_wrapper_v2 = None
 
 
 def load_v2_models(args):
-    from hydra.utils import instantiate
     from omegaconf import DictConfig
+    from modules.model_registry import MODEL_REGISTRY
+    from modules.v2.vc_wrapper import instantiate_wrapper
     cfg = DictConfig(yaml.safe_load(open("configs/v2/vc_wrapper.yaml", "r")))
-    vc_wrapper = instantiate(cfg)
+    # shares CAMPPlus with the V1 wrapper; models are built on first use once placed on the device
+    vc_wrapper = instantiate_wrapper(cfg, registry=MODEL_REGISTRY)
     vc_wrapper.load_checkpoints()
     vc_wrapper.to(device)
     vc_wrapper.eval()
@@ -54,7 +56,7 @@ def convert_voice_v1_wrapper(source_audio_path, target_audio_path, diffusion_ste
     global vc_wrapper_v1
     from seed_vc_wrapper import SeedVCWrapper
     if vc_wrapper_v1 is None:
-        vc_wrapper_v1 = SeedVCWrapper()
+        vc_wrapper_v1 = SeedVCWrapper(capabilities=())  # models load with the first conversion that needs them
 
     # Use yield from to properly handle the generator
     yield from vc_wrapper_v1.convert_voice(
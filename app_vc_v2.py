@@ -2,6 +2,8 @@ import gradio as gr
 import torch
 import yaml
 
+from modules.compile_cache import configure_inductor
+
 if torch.cuda.is_available():
     device = torch.device("cuda")
 elif torch.backends.mps.is_available():
@@ -23,12 +25,7 @@ def load_models(args):
     vc_wrapper.setup_ar_caches(max_batch_size=1, max_seq_len=4096, dtype=dtype, device=device)
 
     if args.compile:
-        torch._inductor.config.coordinate_descent_tuning = True
-        torch._inductor.config.triton.unique_kernel_names = True
-
-        if hasattr(torch._inductor.config, "fx_graph_cache"):
-            # Experimental feature to reduce compilation times, will be on by default in future
-            torch._inductor.config.fx_graph_cache = True
+        configure_inductor()
         vc_wrapper.compile_ar()
         # vc_wrapper.compile_cfm()
 
@@ -0,0 +1,307 @@
+"""
+Convert many sources to many target voices in one run with the V2 model.
+
+Items come from a manifest (CSV with a header row, or JSONL) with the columns source,
+target and optionally output plus per-item overrides of diffusion_steps,
+intelligibility_cfg_rate, similarity_cfg_rate and convert_style (and top_p, temperature,
+repetition_penalty, length_adjust for style conversion), or from the cross product of
+--sources and --targets globs.
+
+Models load once. Each target's prompt features are computed once (modules/v2/batch.py)
+and the work is sorted by target and source length, so the CFM and vocoder run on
+padded batches of similar length. Every finished item is appended to progress.jsonl in
+the output directory; running the same command again skips the items already done.
+Style conversion (--convert-style / convert_style=true) runs item by item through the
+AR model, with the models still loaded only once.
+
+Example:
+    python batch_inference_v2.py --sources "dub/src/*.wav" --targets "dub/voices/*.wav" --output ./output/dub
+    python batch_inference_v2.py --manifest jobs.csv --output ./output/jobs --batch-size 16
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import time
+from collections import defaultdict
+
+from modules.commons import str2bool
+
+ITEM_FIELDS = {
+    "diffusion_steps": int,
+    "intelligibility_cfg_rate": float,
+    "similarity_cfg_rate": float,
+    "convert_style": str2bool,
+    "length_adjust": float,
+    "top_p": float,
+    "temperature": float,
+    "repetition_penalty": float,
+}
+PROGRESS_FILE = "progress.jsonl"
+
+
+def _stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def read_items(args):
+    """Work items as dicts with source, target, output and every ITEM_FIELDS key."""
+    if args.manifest:
+        with open(args.manifest, "r", newline="") as f:
+            if args.manifest.endswith(".jsonl"):
+                rows = [json.loads(line) for line in f if line.strip()]
+            else:
+                rows = list(csv.DictReader(f))
+        base = os.path.dirname(os.path.abspath(args.manifest))
+    else:
+        sources = sorted(path for pattern in args.sources for path in glob.glob(pattern, recursive=True))
+        targets = sorted(path for pattern in args.targets for path in glob.glob(pattern, recursive=True))
+        rows = [{"source": source, "target": target} for target in targets for source in sources]
+        base = os.getcwd()
+
+    items, seen = [], set()
+    for row in rows:
+        if not row.get("source") or not row.get("target"):
+            raise SystemExit(f"manifest row without source or target: {row}")
+        item = {"source": os.path.join(base, row["source"]), "target": os.path.join(base, row["target"])}
+        for key, cast in ITEM_FIELDS.items():
+            value = row.get(key)
+            item[key] = getattr(args, key) if value in (None, "") else cast(value) if isinstance(value, str) else value
+        output = row.get("output") or f"{_stem(item['source'])}_{_stem(item['target'])}.wav"
+        if output in seen:
+            raise SystemExit(f"two items write {output}; give them distinct output names")
+        seen.add(output)
+        item["output"] = output
+        items.append(item)
+    return items
+
+
+def read_progress(output_dir):
+    """Outputs finished by earlier runs (and still on disk)."""
+    done = set()
+    path = os.path.join(output_dir, PROGRESS_FILE)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line of an interrupted run
+                if "error" not in record and os.path.exists(os.path.join(output_dir, record["output"])):
+                    done.add(record["output"])
+    return done
+
+
+class ProgressLog:
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.file = open(os.path.join(output_dir, PROGRESS_FILE), "a")
+        self.converted = 0
+        self.failed = 0
+        self.audio_seconds = 0.0
+
+    def write_output(self, item, sr, wave, seconds):
+        import soundfile as sf
+
+        path = os.path.join(self.output_dir, item["output"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".part"
+        sf.write(tmp_path, wave, sr, format="WAV")
+        os.replace(tmp_path, path)  # never leave a truncated output behind
+        self.converted += 1
+        self.audio_seconds += len(wave) / sr
+        self.record(item, audio_seconds=round(len(wave) / sr, 3), seconds=round(seconds, 3))
+
+    def record(self, item, **fields):
+        if "error" in fields:
+            self.failed += 1
+        record = {"output": item["output"], "source": item["source"], "target": item["target"], **fields}
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def _duration(path):
+    import soundfile as sf
+
+    try:
+        return sf.info(path).duration
+    except RuntimeError:
+        return 0.0  # formats soundfile cannot parse are loaded by librosa later
+
+
+def convert_timbre_items(wrapper, items, progress, args, device, dtype):
+    import librosa
+
+    from modules.v2.batch import TargetCache, convert_segments, extract_conditions, plan_batches, segment_bounds, \
+        stitch_segments
+
+    cache = TargetCache(wrapper, device, dtype, capacity=args.target_cache)
+    groups = defaultdict(list)
+    for item in items:
+        groups[(item["target"], item["diffusion_steps"], item["intelligibility_cfg_rate"],
+                item["similarity_cfg_rate"])].append(item)
+    max_context = wrapper.sr // wrapper.hop_size * wrapper.dit_max_context_len
+    overlap_wave_len = wrapper.overlap_frame_len * wrapper.hop_size
+    for (target, diffusion_steps, intelligibility_cfg_rate, similarity_cfg_rate), group in groups.items():
+        try:
+            prompt = cache.get(target)
+        except Exception as e:
+            print(f"Skipping {len(group)} items of {target}: {type(e).__name__}: {e}")
+            for item in group:
+                progress.record(item, error=f"{type(e).__name__}: {e}")
+            continue
+        window = max_context - prompt.mel_len
+        group.sort(key=lambda item: _duration(item["source"]))
+        for block_start in range(0, len(group), args.block_items):
+            start = time.perf_counter()
+            block, waves = [], []
+            for item in group[block_start:block_start + args.block_items]:
+                try:
+                    waves.append(librosa.load(item["source"], sr=wrapper.sr)[0])
+                    block.append(item)
+                except Exception as e:
+                    print(f"Skipping {item['source']}: {type(e).__name__}: {e}")
+                    progress.record(item, error=f"{type(e).__name__}: {e}")
+            if not block:
+                continue
+            try:
+                conditions = extract_conditions(wrapper, waves, device, dtype)
+            except Exception as e:
+                print(f"Skipping {len(block)} items of {target}: {type(e).__name__}: {e}")
+                for item in block:
+                    progress.record(item, error=f"{type(e).__name__}: {e}")
+                continue
+            # independent DiT windows of every source, batched by length
+            segments = [
+                (i, condition[:, seg_start:seg_end])
+                for i, condition in enumerate(conditions)
+                for seg_start, seg_end in segment_bounds(condition.size(1), window, wrapper.overlap_frame_len)
+            ]
+            outputs = [None] * len(segments)
+            errors = {}  # block index -> error of the first failed batch holding one of its segments
+            lengths = [prompt.mel_len + segment.size(1) for _, segment in segments]
+            for batch in plan_batches(lengths, args.batch_size, args.batch_frames):
+                try:
+                    batch_waves = convert_segments(
+                        wrapper, prompt, [segments[j][1] for j in batch], diffusion_steps=diffusion_steps,
+                        intelligibility_cfg_rate=intelligibility_cfg_rate, similarity_cfg_rate=similarity_cfg_rate,
+                        device=device,
+                    )
+                except Exception as e:
+                    print(f"Batch of {len(batch)} segments of {target} failed: {type(e).__name__}: {e}")
+                    for j in batch:
+                        errors.setdefault(segments[j][0], f"{type(e).__name__}: {e}")
+                    continue
+                for j, wave in zip(batch, batch_waves):
+                    outputs[j] = wave
+            seconds = (time.perf_counter() - start) / len(block)
+            for i, item in enumerate(block):
+                if i in errors:
+                    progress.record(item, error=errors[i])
+                    continue
+                item_waves = [wave for (owner, _), wave in zip(segments, outputs) if owner == i]
+                wave = stitch_segments(item_waves, overlap_wave_len, wrapper.crossfade)
+                progress.write_output(item, wrapper.sr, wave, seconds)
+            print(f"{target}: {min(block_start + args.block_items, len(group))}/{len(group)} done")
+    print(f"Target prompts computed {cache.misses} times, reused {cache.hits} times")
+
+
+def convert_style_items(wrapper, items, progress, device, dtype):
+    for item in items:
+        start = time.perf_counter()
+        try:
+            generator = wrapper.convert_voice_with_streaming(
+                source_audio_path=item["source"],
+                target_audio_path=item["target"],
+                diffusion_steps=item["diffusion_steps"],
+                length_adjust=item["length_adjust"],
+                intelligebility_cfg_rate=item["intelligibility_cfg_rate"],
+                similarity_cfg_rate=item["similarity_cfg_rate"],
+                top_p=item["top_p"],
+                temperature=item["temperature"],
+                repetition_penalty=item["repetition_penalty"],
+                convert_style=True,
+                device=device,
+                dtype=dtype,
+                stream_output=True,
+            )
+            for _, full_audio in generator:
+                pass
+        except Exception as e:
+            print(f"Failed {item['source']} -> {item['target']}: {type(e).__name__}: {e}")
+            progress.record(item, error=f"{type(e).__name__}: {e}")
+            continue
+        sr, wave = full_audio
+        progress.write_output(item, sr, wave, time.perf_counter() - start)
+
+
+def main(args):
+    from inference_v2 import device, dtype, load_v2_models
+
+    os.makedirs(args.output, exist_ok=True)
+    items = read_items(args)
+    done = set() if args.restart else read_progress(args.output)
+    pending = [item for item in items if item["output"] not in done]
+    print(f"{len(items)} items, {len(items) - len(pending)} already converted, {len(pending)} to go")
+    if not pending:
+        return
+
+    start = time.perf_counter()
+    wrapper = load_v2_models(args)
+    print(f"Loaded models in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    progress = ProgressLog(args.output)
+    try:
+        timbre_items = [item for item in pending if not item["convert_style"]]
+        style_items = [item for item in pending if item["convert_style"]]
+        if timbre_items:
+            convert_timbre_items(wrapper, timbre_items, progress, args, device, dtype)
+        if style_items:
+            convert_style_items(wrapper, style_items, progress, device, dtype)
+    finally:
+        progress.close()
+    elapsed = time.perf_counter() - start
+    print(f"Converted {progress.converted} items ({progress.audio_seconds:.1f}s of audio) in {elapsed:.2f}s, "
+          f"RTF {elapsed / max(progress.audio_seconds, 1e-6):.3f}, {progress.failed} failed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch voice conversion with the V2 model")
+    parser.add_argument("--manifest", type=str, default=None,
+                        help="CSV (with header) or JSONL of source, target[, output, per-item parameters]")
+    parser.add_argument("--sources", type=str, nargs="+", default=[], help="Source audio globs")
+    parser.add_argument("--targets", type=str, nargs="+", default=[], help="Target voice globs")
+    parser.add_argument("--output", type=str, default="./output/batch", help="Output directory")
+    parser.add_argument("--restart", action="store_true", help="Ignore progress.jsonl and convert everything again")
+    parser.add_argument("--batch-size", type=int, default=8, help="Max segments per CFM / vocoder batch")
+    parser.add_argument("--batch-frames", type=int, default=16384,
+                        help="Max mel frames per batch after padding (prompt included)")
+    parser.add_argument("--block-items", type=int, default=64, help="Sources loaded and batched together")
+    parser.add_argument("--target-cache", type=int, default=64, help="Target voices whose prompt features are kept")
+
+    # defaults of the per-item parameters
+    parser.add_argument("--diffusion-steps", type=int, default=30)
+    parser.add_argument("--length-adjust", type=float, default=1.0)
+    parser.add_argument("--intelligibility-cfg-rate", type=float, default=0.7)
+    parser.add_argument("--similarity-cfg-rate", type=float, default=0.7)
+    parser.add_argument("--top-p", type=float, default=0.9)
+    parser.add_argument("--temperature", type=float, default=1.0)
+    parser.add_argument("--repetition-penalty", type=float, default=1.0)
+    parser.add_argument("--convert-style", type=str2bool, default=False)
+
+    # models, as in inference_v2.py
+    parser.add_argument("--compile", type=str2bool, default=False)
+    parser.add_argument("--compile-cache", type=str, default=None)
+    parser.add_argument("--ar-checkpoint-path", type=str, default=None)
+    parser.add_argument("--cfm-checkpoint-path", type=str, default=None)
+    parser.add_argument("--bundle-path", type=str, default=None)
+
+    args = parser.parse_args()
+    if not args.manifest and not (args.sources and args.targets):
+        parser.error("pass --manifest, or both --sources and --targets")
+    main(args)
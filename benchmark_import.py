@@ -0,0 +1,127 @@
+"""
+Cold import-time benchmark for the service module and the CLI entry points.
+
+Imports every target in a fresh interpreter with `python -X importtime`, repeats that a
+few times and reports the median wall-clock import time together with the slowest
+top-level dependencies as JSON. Passing a previous report as --baseline compares against
+it and exits non-zero when a target got slower than --max-regression allows, so the
+numbers can be tracked in CI.
+
+Example:
+    python benchmark_import.py --repeats 5 --output import_times.json
+    python benchmark_import.py --baseline import_times.json --max-regression 0.2
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+DEFAULT_TARGETS = ["services.vc_service", "svc_backend", "inference_v2"]
+
+
+def parse_importtime(stderr):
+    """Return {module: (self_us, cumulative_us, depth)} from `-X importtime` output."""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.rstrip()
+        # nesting is encoded as indentation; top-level imports have a single leading space
+        depth = (len(name) - len(name.lstrip())) // 2
+        timings.setdefault(name.strip(), (int(self_us), int(cumulative_us), depth))
+    return timings
+
+
+def import_once(target, python=sys.executable):
+    """Wall-clock seconds of a fresh interpreter importing `target` and its importtime table."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    start = time.perf_counter()
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {target}" if target else "pass"],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {target} failed:\n{result.stderr[-2000:]}")
+    return wall, parse_importtime(result.stderr)
+
+
+def benchmark(target, repeats, top, startup):
+    walls = []
+    timings = {}
+    for _ in range(repeats):
+        wall, timings = import_once(target)
+        walls.append(wall)
+    # report the heaviest packages imported directly or one level below the target
+    heaviest = sorted(
+        (
+            (name, cumulative)
+            for name, (_, cumulative, depth) in timings.items()
+            if depth <= 1 and name != target and name not in startup
+        ),
+        key=lambda item: item[1],
+        reverse=True,
+    )[:top]
+    return {
+        "wall_seconds": round(statistics.median(walls), 4),
+        "wall_seconds_all": [round(wall, 4) for wall in walls],
+        "import_seconds": round(timings[target][1] / 1e6, 4) if target in timings else None,
+        "modules": len(timings),
+        "heaviest": {name: round(cumulative / 1e6, 4) for name, cumulative in heaviest},
+    }
+
+
+def compare(report, baseline, max_regression):
+    failures = []
+    for target, result in report["targets"].items():
+        before = baseline.get("targets", {}).get(target)
+        if before is None:
+            continue
+        ratio = result["wall_seconds"] / before["wall_seconds"] - 1.0
+        result["regression"] = round(ratio, 4)
+        if ratio > max_regression:
+            failures.append(f"{target}: {before['wall_seconds']:.3f}s -> {result['wall_seconds']:.3f}s (+{ratio:.0%})")
+    return failures
+
+
+def main(args):
+    # modules the bare interpreter imports anyway (site, encodings, ...) are not charged to a target
+    startup_wall, startup = import_once(None)
+    report = {
+        "python": sys.version.split()[0],
+        "repeats": args.repeats,
+        "interpreter_seconds": round(startup_wall, 4),
+        "targets": {target: benchmark(target, args.repeats, args.top, startup) for target in args.targets},
+    }
+    failures = []
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            failures = compare(report, json.load(f), args.max_regression)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    for failure in failures:
+        print(f"import time regression: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold import-time benchmark for the service and CLI modules")
+    parser.add_argument("targets", nargs="*", default=DEFAULT_TARGETS, help="Modules to import (default: %(default)s)")
+    parser.add_argument("--repeats", type=int, default=3, help="Fresh interpreters per target; the median is reported")
+    parser.add_argument("--top", type=int, default=10, help="Number of heaviest dependencies listed per target")
+    parser.add_argument("--output", type=str, default=None, help="Also write the JSON report to this file")
+    parser.add_argument("--baseline", type=str, default=None, help="Previous report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="Allowed relative slowdown against the baseline before exiting with status 1")
+    sys.exit(main(parser.parse_args()))
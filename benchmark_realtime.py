@@ -0,0 +1,169 @@
+"""
+Offline latency / real-time-factor benchmark for block-wise voice conversion.
+
+Replays a WAV file through RealtimeConverter block by block, exactly as the
+real-time GUI would feed it, and reports per-stage and per-block timings as JSON.
+Runs on CPU, CUDA and MPS. Stages are timed by the converter's Profiler spans (CUDA
+events on CUDA, so no synchronize between stages); blocks are timed wall-clock with the
+device synchronized around each one. On MPS the stage numbers cover only the host side.
+
+Example:
+    python benchmark_realtime.py --source examples/source/source_s1.wav \
+        --target examples/reference/s1p1.wav --block-time 0.25 --diffusion-steps 10
+"""
+import argparse
+import json
+import time
+
+import librosa
+import numpy as np
+import torch
+
+from modules.commons import str2bool
+from modules.profiling import Profiler
+from services.realtime_converter import RealtimeConfig, RealtimeConverter, load_realtime_models
+
+STAGES = ["vad", "resample", "semantic_fn", "cfm", "vocoder", "resample_out", "sola"]
+
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    elif device.type == "mps":
+        torch.mps.synchronize()
+
+
+def percentiles(values_ms):
+    values = np.asarray(values_ms, dtype=np.float64)
+    if values.size == 0:
+        return None
+    return {
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+    }
+
+
+def run_benchmark(converter, source_wav, warmup_blocks=2, max_blocks=None):
+    """Needs a converter built with an enabled Profiler; its histograms are reset after warmup."""
+    profiler = converter.profiler
+    block_frame = converter.block_frame
+    num_blocks = int(np.ceil(len(source_wav) / block_frame))
+    source_wav = np.pad(source_wav, (0, num_blocks * block_frame - len(source_wav)))
+    if max_blocks is not None:
+        num_blocks = min(num_blocks, warmup_blocks + max_blocks)
+
+    block_ms = 1000.0 * block_frame / converter.samplerate
+    totals = []
+    warmup = {}
+    for i in range(num_blocks):
+        if i == warmup_blocks:
+            # the first block also computes the reference prompt; keep it out of the statistics
+            prompt = profiler.summary().get("prompt")
+            if prompt is not None:
+                warmup["prompt_ms"] = prompt["mean_ms"]
+            profiler.reset()
+        block = source_wav[i * block_frame:(i + 1) * block_frame]
+        synchronize(converter.device)
+        start = time.perf_counter()
+        converter.process_block(block)
+        synchronize(converter.device)
+        elapsed_ms = 1000.0 * (time.perf_counter() - start)
+        if i < warmup_blocks:
+            warmup[f"block_{i}_ms"] = elapsed_ms
+        else:
+            totals.append(elapsed_ms)
+
+    stages = profiler.summary() if totals else {}
+    misses = int(sum(t > block_ms for t in totals))
+    total_stats = percentiles(totals)
+    return {
+        "blocks": len(totals),
+        "block_ms": block_ms,
+        "warmup": warmup,
+        "total_ms": total_stats,
+        "stages_ms": {
+            name: {key[:-3]: stages[name][key] for key in ("mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms")}
+            for name in STAGES if name in stages
+        },
+        "rtf_mean": total_stats["mean"] / block_ms if total_stats else None,
+        "rtf_p99": total_stats["p99"] / block_ms if total_stats else None,
+        "deadline_misses": misses,
+        "deadline_met": bool(totals) and misses == 0,
+    }
+
+
+def main(args):
+    if args.device:
+        device = torch.device(args.device)
+    elif torch.cuda.is_available():
+        device = torch.device("cuda")
+    elif torch.backends.mps.is_available():
+        device = torch.device("mps")
+    else:
+        device = torch.device("cpu")
+
+    model_set = load_realtime_models(args.checkpoint_path, args.config_path, device=device)
+    vad_model = None
+    if args.vad:
+        from funasr import AutoModel
+        vad_model = AutoModel(model="fsmn-vad", model_revision="v2.0.4")
+
+    config = RealtimeConfig(
+        block_time=args.block_time,
+        crossfade_time=args.crossfade_time,
+        extra_time_ce=args.extra_time_ce,
+        extra_time=args.extra_time,
+        extra_time_right=args.extra_time_right,
+        diffusion_steps=args.diffusion_steps,
+        inference_cfg_rate=args.inference_cfg_rate,
+        max_prompt_length=args.max_prompt_length,
+        samplerate=args.samplerate,
+        fp16=args.fp16 and device.type != "cpu",
+    )
+    profiler = Profiler(enabled=True, device=device)
+    converter = RealtimeConverter(model_set, device, config, vad_model=vad_model, profiler=profiler)
+    converter.set_reference(args.target)
+    source_wav = librosa.load(args.source, sr=converter.samplerate)[0]
+
+    report = {
+        "device": str(device),
+        "torch": torch.__version__,
+        "source": args.source,
+        "target": args.target,
+        "samplerate": converter.samplerate,
+        "config": {k: getattr(config, k) for k in config.__dataclass_fields__},
+    }
+    report.update(run_benchmark(converter, source_wav, args.warmup_blocks, args.max_blocks))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency / RTF benchmark for real-time voice conversion")
+    parser.add_argument("--source", type=str, required=True, help="WAV file replayed as the input stream")
+    parser.add_argument("--target", type=str, required=True, help="Reference voice")
+    parser.add_argument("--checkpoint-path", type=str, default=None)
+    parser.add_argument("--config-path", type=str, default=None)
+    parser.add_argument("--device", type=str, default=None, help="cpu, cuda, cuda:N or mps (default: auto)")
+    parser.add_argument("--fp16", type=str2bool, nargs="?", const=True, default=True)
+    parser.add_argument("--vad", type=str2bool, nargs="?", const=True, default=False, help="Run FunASR VAD per block")
+    parser.add_argument("--block-time", type=float, default=0.25)
+    parser.add_argument("--crossfade-time", type=float, default=0.05)
+    parser.add_argument("--extra-time-ce", type=float, default=2.5)
+    parser.add_argument("--extra-time", type=float, default=0.5)
+    parser.add_argument("--extra-time-right", type=float, default=2.0)
+    parser.add_argument("--diffusion-steps", type=int, default=10)
+    parser.add_argument("--inference-cfg-rate", type=float, default=0.7)
+    parser.add_argument("--max-prompt-length", type=float, default=3.0)
+    parser.add_argument("--samplerate", type=int, default=None, help="I/O sample rate (default: model rate)")
+    parser.add_argument("--warmup-blocks", type=int, default=2)
+    parser.add_argument("--max-blocks", type=int, default=None)
+    parser.add_argument("--output", type=str, default=None, help="Also write the JSON report to this file")
+    main(parser.parse_args())
@@ -0,0 +1,67 @@
+"""
+Convert the V2 checkpoints into one safetensors bundle for fast cold starts.
+
+Loads VoiceConversionWrapper the usual way (Hydra instantiate + torch.load of the CFM,
+AR, AstralQuantizer and CAMPPlus checkpoints, BigVGAN and HuBERT from their pretrained
+directories) and writes every tensor plus the config to a single file. Services then
+start from the bundle with modules.v2.bundle.load_bundle, which memory-maps it and
+assigns tensors to a meta-device skeleton instead of initialising and copying.
+
+Example:
+    python convert_bundle.py --output checkpoints/seed_vc_v2.safetensors --verify
+    python inference_v2.py --bundle-path checkpoints/seed_vc_v2.safetensors ...
+"""
+import argparse
+import os
+import time
+
+import torch
+import yaml
+from hydra.utils import instantiate
+from omegaconf import DictConfig
+
+from modules.v2.bundle import load_bundle, named_tensors, save_bundle
+
+
+def main(args):
+    cfg = DictConfig(yaml.safe_load(open(args.config_path, "r")))
+    start = time.perf_counter()
+    wrapper = instantiate(cfg)
+    wrapper.load_checkpoints(ar_checkpoint_path=args.ar_checkpoint_path, cfm_checkpoint_path=args.cfm_checkpoint_path)
+    wrapper.eval()
+    print(f"Loaded checkpoints in {time.perf_counter() - start:.2f}s")
+
+    metadata = {
+        "cfm_checkpoint": os.path.basename(args.cfm_checkpoint_path or "default"),
+        "ar_checkpoint": os.path.basename(args.ar_checkpoint_path or "default"),
+        "torch": torch.__version__,
+    }
+    n_tensors, n_aliases = save_bundle(wrapper, cfg, args.output, metadata=metadata)
+    size_mb = os.path.getsize(args.output) / 2 ** 20
+    print(f"Wrote {args.output}: {n_tensors} tensors, {n_aliases} aliases, {size_mb:.1f} MiB")
+
+    if args.verify:
+        start = time.perf_counter()
+        bundled = load_bundle(args.output)
+        print(f"Loaded bundle in {time.perf_counter() - start:.2f}s")
+        reference = dict(named_tensors(wrapper))
+        loaded = dict(named_tensors(bundled))
+        mismatched = [
+            name for name, tensor in reference.items()
+            if name not in loaded or not torch.equal(tensor.detach().cpu(), loaded[name])
+        ]
+        if mismatched:
+            raise SystemExit(f"{len(mismatched)} tensors differ after round trip, e.g. {', '.join(mismatched[:5])}")
+        print(f"Verified {len(reference)} tensors")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write the V2 model checkpoints as one safetensors bundle")
+    parser.add_argument("--output", type=str, default="checkpoints/seed_vc_v2.safetensors")
+    parser.add_argument("--config-path", type=str, default="configs/v2/vc_wrapper.yaml")
+    parser.add_argument("--ar-checkpoint-path", type=str, default=None,
+                        help="Custom AR checkpoint (default: download from the hub)")
+    parser.add_argument("--cfm-checkpoint-path", type=str, default=None,
+                        help="Custom CFM checkpoint (default: download from the hub)")
+    parser.add_argument("--verify", action="store_true", help="Reload the bundle and compare every tensor")
+    main(parser.parse_args())
@@ -2,144 +2,232 @@
 """
 Script to download all required models for local use.
 This script downloads models from HuggingFace Hub and organizes them in the local directory structure.
+
+Files are fetched concurrently straight from the Hub's resolve endpoint. Interrupted
+downloads are resumed from their `.part` file with an HTTP Range request. Every file is
+checked against the SHA256 the Hub publishes for LFS files, and the hashes are recorded in
+one manifest per MODEL_MAPPING entry (models/.manifests/<repo>.sha256, `sha256sum -c`
+format). `--verify` re-hashes a models directory against those manifests in parallel, so a
+node can refuse to start on a truncated or corrupted checkpoint.
 """
 
 import os
+import json
+import time
+import hashlib
 import argparse
-from huggingface_hub import hf_hub_download, snapshot_download
-from local_model_loader import MODEL_MAPPING, LOCAL_MODELS_DIR
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
 
-def download_single_file(repo_id, filename, local_path):
-    """Download a single file from HuggingFace Hub."""
-    print(f"Downloading {filename} from {repo_id}...")
-    try:
-        downloaded_path = hf_hub_download(
-            repo_id=repo_id,
-            filename=filename,
-            cache_dir="./temp_cache"
-        )
-        
-        # Create target directory
-        target_dir = os.path.dirname(local_path)
-        os.makedirs(target_dir, exist_ok=True)
-        
-        # Copy file to target location
-        import shutil
-        shutil.copy2(downloaded_path, local_path)
-        print(f"✓ Downloaded to {local_path}")
-        return True
-    except (FileNotFoundError, ConnectionError, RuntimeError) as e:
-        print(f"✗ Failed to download {filename}: {e}")
-        return False
-
-def download_whisper_model(model_name, local_dir):
-    """Download Whisper model and its files."""
-    print(f"Downloading Whisper model {model_name}...")
-    try:
-        # Download the entire model directory
-        snapshot_path = snapshot_download(
-            repo_id=model_name,
-            cache_dir="./temp_cache"
-        )
-        
-        # Copy to local directory
-        import shutil
-        if os.path.exists(local_dir):
-            shutil.rmtree(local_dir)
-        shutil.copytree(snapshot_path, local_dir)
-        print(f"✓ Downloaded Whisper model to {local_dir}")
-        return True
-    except (FileNotFoundError, ConnectionError, RuntimeError) as e:
-        print(f"✗ Failed to download Whisper model {model_name}: {e}")
-        return False
-
-def download_bigvgan_model(model_name, local_dir):
-    """Download BigVGAN model."""
-    print(f"Downloading BigVGAN model {model_name}...")
-    try:
-        # Download the entire model directory
-        snapshot_path = snapshot_download(
-            repo_id=model_name,
-            cache_dir="./temp_cache"
-        )
-        
-        # Copy to local directory
-        import shutil
-        if os.path.exists(local_dir):
-            shutil.rmtree(local_dir)
-        shutil.copytree(snapshot_path, local_dir)
-        print(f"✓ Downloaded BigVGAN model to {local_dir}")
-        return True
-    except (FileNotFoundError, ConnectionError, RuntimeError) as e:
-        print(f"✗ Failed to download BigVGAN model {model_name}: {e}")
-        return False
-
-def download_models(selected_models=None):
-    """Download all required models."""
-    print("Starting model download process...")
-    print("=" * 60)
-    
-    # Create models directory
-    os.makedirs(LOCAL_MODELS_DIR, exist_ok=True)
-    
-    success_count = 0
-    total_count = 0
-    
-    # Download models from MODEL_MAPPING
-    for repo_id, files in MODEL_MAPPING.items():
+from local_model_loader import MODEL_MAPPING, LOCAL_MODELS_DIR, manifest_path
+
+DEFAULT_ENDPOINT = os.environ.get("HF_ENDPOINT", "https://huggingface.co")
+DEFAULT_WORKERS = 8
+CHUNK_SIZE = 1 << 20
+# repository metadata that is never needed locally
+SKIPPED_FILES = (".gitattributes",)
+
+
+@dataclass
+class DownloadTask:
+    repo_id: str
+    filename: str  # path inside the repository
+    local_path: str  # path relative to the models directory
+    sha256: Optional[str] = None  # published by the Hub for LFS files
+    size: Optional[int] = None
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_manifest(path):
+    """{local_path: sha256} from a `sha256sum` style manifest; empty if there is none."""
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line:
+                digest, local_path = line.split("  ", 1)
+                entries[local_path] = digest
+    return entries
+
+
+def write_manifest(path, entries):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for local_path in sorted(entries):
+            f.write(f"{entries[local_path]}  {local_path}\n")
+    os.replace(tmp_path, path)
+
+
+def _open(url, token=None, headers=None):
+    request = urllib.request.Request(url, headers=dict(headers or {}))
+    if token:
+        request.add_header("Authorization", f"Bearer {token}")
+    return urllib.request.urlopen(request, timeout=60)
+
+
+def list_repo_files(repo_id, endpoint=DEFAULT_ENDPOINT, revision="main", token=None):
+    """{filename: (sha256, size)} of a model repository; sha256/size are None for non-LFS files."""
+    url = f"{endpoint}/api/models/{repo_id}/revision/{urllib.parse.quote(revision, safe='')}?blobs=true"
+    with _open(url, token) as response:
+        info = json.load(response)
+    files = {}
+    for sibling in info.get("siblings", []):
+        lfs = sibling.get("lfs") or {}
+        files[sibling["rfilename"]] = (lfs.get("sha256"), lfs.get("size", sibling.get("size")))
+    return files
+
+
+def plan_downloads(selected_models=None, endpoint=DEFAULT_ENDPOINT, revision="main", token=None,
+                   mapping=MODEL_MAPPING):
+    """Expand MODEL_MAPPING into one DownloadTask per file."""
+    tasks = []
+    for repo_id, files in mapping.items():
+        if selected_models is not None and repo_id not in selected_models:
+            continue
+        remote = list_repo_files(repo_id, endpoint, revision, token)
         if isinstance(files, dict):
             # Repository with multiple files
             for filename, local_path in files.items():
-                if selected_models is None or repo_id in selected_models:
-                    total_count += 1
-                    full_local_path = os.path.join(LOCAL_MODELS_DIR, local_path)
-                    if download_single_file(repo_id, filename, full_local_path):
-                        success_count += 1
+                if filename not in remote:
+                    raise FileNotFoundError(f"{filename} not found in {repo_id}")
+                tasks.append(DownloadTask(repo_id, filename, local_path, *remote[filename]))
         else:
-            # Single directory (for Whisper, BigVGAN, etc.)
-            if selected_models is None or repo_id in selected_models:
-                total_count += 1
-                local_dir = os.path.join(LOCAL_MODELS_DIR, files)
-                
-                if "whisper" in repo_id:
-                    if download_whisper_model(repo_id, local_dir):
-                        success_count += 1
-                elif "bigvgan" in repo_id:
-                    if download_bigvgan_model(repo_id, local_dir):
-                        success_count += 1
-                else:
-                    # For other models, try to download the entire repository
-                    try:
-                        snapshot_path = snapshot_download(
-                            repo_id=repo_id,
-                            cache_dir="./temp_cache"
-                        )
-                        import shutil
-                        if os.path.exists(local_dir):
-                            shutil.rmtree(local_dir)
-                        shutil.copytree(snapshot_path, local_dir)
-                        print(f"✓ Downloaded {repo_id} to {local_dir}")
-                        success_count += 1
-                    except (FileNotFoundError, ConnectionError, RuntimeError) as e:
-                        print(f"✗ Failed to download {repo_id}: {e}")
-    
-    print("\n" + "=" * 60)
-    print(f"Download completed: {success_count}/{total_count} models downloaded successfully")
-    
-    # Clean up temp cache
+            # Whole repository into one directory (Whisper, BigVGAN, ...)
+            for filename, (sha256, size) in sorted(remote.items()):
+                if os.path.basename(filename) in SKIPPED_FILES:
+                    continue
+                tasks.append(DownloadTask(repo_id, filename, f"{files}/{filename}", sha256, size))
+    return tasks
+
+
+def download_file(task, models_dir=LOCAL_MODELS_DIR, endpoint=DEFAULT_ENDPOINT, revision="main", token=None,
+                  known_sha256=None):
+    """
+    Download one file, resuming a previous partial download. Returns (status, sha256) with
+    status "cached" or "downloaded"; raises if the content does not match the Hub's SHA256.
+    """
+    target = os.path.join(models_dir, task.local_path)
+    expected = task.sha256 or known_sha256
+    if os.path.exists(target) and known_sha256 is not None and (task.sha256 in (None, known_sha256)):
+        # recorded in the manifest by an earlier verified download; --verify re-hashes it
+        if task.size is None or os.path.getsize(target) == task.size:
+            return "cached", known_sha256
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    part = target + ".part"
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    if task.size is not None and offset > task.size:
+        offset = 0
+    url = f"{endpoint}/{task.repo_id}/resolve/{urllib.parse.quote(revision, safe='')}/" \
+          f"{urllib.parse.quote(task.filename)}"
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
     try:
-        import shutil
-        if os.path.exists("./temp_cache"):
-            shutil.rmtree("./temp_cache")
-        print("Cleaned up temporary cache")
-    except OSError:
-        pass
+        response = _open(url, token, headers)
+    except urllib.error.HTTPError as e:
+        if e.code != 416:  # 416: the partial file is already complete
+            raise
+        response = None
+    if response is not None:
+        with response:
+            # a server that ignores Range answers 200 with the whole file
+            mode = "ab" if response.status == 206 else "wb"
+            with open(part, mode) as f:
+                for block in iter(lambda: response.read(CHUNK_SIZE), b""):
+                    f.write(block)
+
+    digest = sha256_file(part)
+    if expected is not None and digest != expected:
+        os.remove(part)
+        raise ValueError(f"SHA256 mismatch for {task.repo_id}/{task.filename}: expected {expected}, got {digest}")
+    os.replace(part, target)
+    return "downloaded", digest
+
+
+def download_models(selected_models=None, workers=DEFAULT_WORKERS, endpoint=DEFAULT_ENDPOINT, revision="main",
+                    token=None, models_dir=LOCAL_MODELS_DIR, mapping=MODEL_MAPPING):
+    """Download all required models. Returns (succeeded, total)."""
+    print("Starting model download process...")
+    print("=" * 60)
+    start = time.perf_counter()
+    os.makedirs(models_dir, exist_ok=True)
+
+    tasks = plan_downloads(selected_models, endpoint, revision, token, mapping)
+    manifests = {repo_id: read_manifest(manifest_path(repo_id, models_dir)) for repo_id in {t.repo_id for t in tasks}}
+
+    def run(task):
+        try:
+            return task, *download_file(task, models_dir, endpoint, revision, token,
+                                        manifests[task.repo_id].get(task.local_path))
+        except (OSError, ValueError) as e:
+            return task, "failed", e
+
+    success_count = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for task, status, result in pool.map(run, tasks):
+            if status == "failed":
+                print(f"✗ Failed to download {task.repo_id}/{task.filename}: {result}")
+                continue
+            success_count += 1
+            manifests[task.repo_id][task.local_path] = result
+            print(f"✓ {task.repo_id}/{task.filename} -> {task.local_path} ({status})")
+
+    for repo_id, entries in manifests.items():
+        write_manifest(manifest_path(repo_id, models_dir), entries)
+
+    print("\n" + "=" * 60)
+    print(f"Download completed: {success_count}/{len(tasks)} files in {time.perf_counter() - start:.1f}s")
+    return success_count, len(tasks)
+
+
+def verify_models(selected_models=None, workers=DEFAULT_WORKERS, models_dir=LOCAL_MODELS_DIR,
+                  mapping=MODEL_MAPPING) -> Dict[str, List[str]]:
+    """
+    Re-hash every file recorded in the manifests. Returns {"ok": [...], "missing": [...],
+    "corrupt": [...], "unverified": [...]}; "unverified" lists entries without a manifest.
+    """
+    checks = []
+    report = {"ok": [], "missing": [], "corrupt": [], "unverified": []}
+    for repo_id in mapping:
+        if selected_models is not None and repo_id not in selected_models:
+            continue
+        entries = read_manifest(manifest_path(repo_id, models_dir))
+        if not entries:
+            report["unverified"].append(repo_id)
+        checks.extend(entries.items())
+
+    def check(item):
+        local_path, expected = item
+        path = os.path.join(models_dir, local_path)
+        if not os.path.exists(path):
+            return "missing", local_path
+        return ("ok" if sha256_file(path) == expected else "corrupt"), local_path
+
+    # hashlib releases the GIL on large buffers, so threads hash files in parallel
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for status, local_path in pool.map(check, checks):
+            report[status].append(local_path)
+    return report
+
 
 def list_required_models():
     """List all required models."""
     print("Required models for local loading:")
     print("=" * 50)
-    
+
     for repo_id, files in MODEL_MAPPING.items():
         if isinstance(files, dict):
             print(f"\n{repo_id}:")
@@ -154,14 +242,34 @@ def main():
     parser.add_argument("--list", action="store_true", help="List all required models")
     parser.add_argument("--models", nargs="+", help="Download specific models only")
     parser.add_argument("--all", action="store_true", help="Download all models")
-    
+    parser.add_argument("--verify", action="store_true",
+                        help="Check the models directory against the SHA256 manifests instead of downloading")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Parallel downloads / hash checks")
+    parser.add_argument("--endpoint", type=str, default=DEFAULT_ENDPOINT, help="HuggingFace Hub endpoint or mirror")
+    parser.add_argument("--revision", type=str, default="main")
+    parser.add_argument("--models-dir", type=str, default=LOCAL_MODELS_DIR)
+
     args = parser.parse_args()
-    
+    token = os.environ.get("HF_TOKEN")
+    selected_models = args.models if args.models else None
+
     if args.list:
         list_required_models()
+    elif args.verify:
+        report = verify_models(selected_models, args.workers, args.models_dir)
+        for status in ("missing", "corrupt"):
+            for local_path in report[status]:
+                print(f"✗ {status}: {local_path}")
+        for repo_id in report["unverified"]:
+            print(f"? no manifest for {repo_id}")
+        print(f"Verified {len(report['ok'])} files, {len(report['missing']) + len(report['corrupt'])} problems")
+        if report["missing"] or report["corrupt"]:
+            raise SystemExit(1)
     elif args.all or args.models:
-        selected_models = args.models if args.models else None
-        download_models(selected_models)
+        succeeded, total = download_models(selected_models, args.workers, args.endpoint, args.revision, token,
+                                           args.models_dir)
+        if succeeded != total:
+            raise SystemExit(1)
     else:
         print("Use --list to see required models, --all to download all, or --models <repo_id> to download specific models")
         print("Example: python download_models.py --models Plachta/Seed-VC funasr/campplus")
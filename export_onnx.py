@@ -0,0 +1,91 @@
+"""
+Export the V2 timbre conversion pipeline to ONNX for CPU-only deployments.
+
+Loads VoiceConversionWrapper on CPU in float32 (from a bundle or the usual checkpoints)
+and writes one graph per network stage with dynamic time axes - content extractor,
+length regulator, CAMPPlus, DiT estimator and BigVGAN - plus runtime.json, which
+modules.v2.onnx_runtime.OnnxVoiceConversion needs to run them with onnxruntime and no
+torch. Style conversion (the AR model) is not exported and stays PyTorch-only.
+
+Example:
+    python export_onnx.py --output-dir checkpoints/onnx --verify
+    python export_onnx.py --output-dir checkpoints/onnx --stages estimator vocoder
+    python export_onnx.py --output-dir checkpoints/onnx --source examples/source/source_s1.wav \\
+        --target examples/reference/s1p1.wav --output converted.wav
+"""
+import argparse
+import time
+
+import torch
+
+from modules.v2.onnx_export import DEFAULT_OPSET, STAGES, export_stages, verify_stages
+
+
+def load_wrapper(args):
+    if args.bundle_path:
+        from modules.v2.bundle import load_bundle
+
+        return load_bundle(args.bundle_path, capabilities=("timbre",))
+    import yaml
+    from hydra.utils import instantiate
+    from omegaconf import DictConfig
+
+    cfg = DictConfig(yaml.safe_load(open(args.config_path, "r")))
+    wrapper = instantiate(cfg)
+    wrapper.load_checkpoints(ar_checkpoint_path=args.ar_checkpoint_path, cfm_checkpoint_path=args.cfm_checkpoint_path)
+    return wrapper
+
+
+@torch.no_grad()
+def main(args):
+    start = time.perf_counter()
+    wrapper = load_wrapper(args).eval().float()
+    print(f"Loaded model in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    manifest = export_stages(wrapper, args.output_dir, stages=args.stages, opset=args.opset)
+    print(f"Exported {', '.join(args.stages)} to {args.output_dir} in {time.perf_counter() - start:.2f}s")
+
+    if args.verify:
+        errors = verify_stages(wrapper, args.output_dir, stages=args.stages)
+        for stage, error in errors.items():
+            print(f"  {stage:<18} max abs diff {error:.2e}")
+        failed = [stage for stage, error in errors.items() if error > args.tolerance]
+        if failed:
+            raise SystemExit(f"onnxruntime output differs from PyTorch by more than {args.tolerance} in {', '.join(failed)}")
+
+    if args.source and args.target:
+        missing = [stage for stage in STAGES if stage not in manifest["stages"]]
+        if missing:
+            raise SystemExit(f"Cannot run the runtime without {', '.join(missing)}")
+        import soundfile as sf
+        from modules.v2.onnx_runtime import OnnxVoiceConversion
+
+        runtime = OnnxVoiceConversion(args.output_dir, num_threads=args.num_threads)
+        start = time.perf_counter()
+        sr, wave = runtime.convert_voice(args.source, args.target, diffusion_steps=args.diffusion_steps)
+        elapsed = time.perf_counter() - start
+        sf.write(args.output, wave, sr)
+        print(f"Converted {len(wave) / sr:.2f}s of audio in {elapsed:.2f}s with onnxruntime, wrote {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the V2 timbre pipeline to ONNX")
+    parser.add_argument("--output-dir", type=str, default="checkpoints/onnx")
+    parser.add_argument("--stages", type=str, nargs="+", choices=STAGES, default=list(STAGES),
+                        help="Stages to (re-)export; other stages already in the directory are kept")
+    parser.add_argument("--opset", type=int, default=DEFAULT_OPSET)
+    parser.add_argument("--verify", action="store_true",
+                        help="Compare onnxruntime and PyTorch outputs of every exported stage")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="Max abs diff accepted by --verify")
+    parser.add_argument("--config-path", type=str, default="configs/v2/vc_wrapper.yaml")
+    parser.add_argument("--ar-checkpoint-path", type=str, default=None)
+    parser.add_argument("--cfm-checkpoint-path", type=str, default=None)
+    parser.add_argument("--bundle-path", type=str, default=None,
+                        help="Load from a safetensors bundle written by convert_bundle.py")
+    parser.add_argument("--source", type=str, default=None, help="Convert this file with the exported runtime")
+    parser.add_argument("--target", type=str, default=None, help="Reference voice for --source")
+    parser.add_argument("--output", type=str, default="converted_onnx.wav")
+    parser.add_argument("--diffusion-steps", type=int, default=30)
+    parser.add_argument("--num-threads", type=int, default=None, help="onnxruntime intra-op threads")
+    main(parser.parse_args())
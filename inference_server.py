@@ -0,0 +1,54 @@
+"""
+Run the V2 models in a dedicated inference worker process behind a Unix socket.
+
+Builds VCService (configured by the usual SEED_VC_* environment variables), runs the
+startup warmup and then serves sessions to the web tier over the socket, see
+services/inference_rpc.py. The socket appears only once the worker is ready, which is
+what the web tier waits for. svc_backend starts these workers itself with
+SEED_VC_INFERENCE_WORKERS=N, or connects to ones started separately with
+SEED_VC_INFERENCE_SOCKETS.
+
+Example:
+    python inference_server.py --socket /run/seed-vc/inference-0.sock
+    SEED_VC_INFERENCE_SOCKETS=/run/seed-vc/inference-0.sock python svc_backend.py
+"""
+import argparse
+import signal
+import time
+
+from services.inference_rpc import InferenceServer
+from services.vc_service import VCService
+from services.warmup import WarmupConfig, run_warmup
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main(args):
+    start = time.perf_counter()
+    service = VCService(voice_root=args.voice_root, bundle_path=args.bundle_path)
+    warmup = WarmupConfig.from_env()
+    if warmup.enabled:
+        run_warmup(service, warmup)
+    service.metrics.ready.set(1)
+    server = InferenceServer(service, args.socket)
+    print(f"Inference worker ready in {time.perf_counter() - start:.2f}s, serving on {args.socket}")
+    # SIGTERM from the web tier stops the worker like Ctrl-C
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve VCService to the web tier over a Unix socket")
+    parser.add_argument("--socket", type=str, required=True, help="Unix socket path to listen on")
+    parser.add_argument("--voice-root", type=str, default="examples/reference")
+    parser.add_argument("--bundle-path", type=str, default=None,
+                        help="Load from a safetensors bundle (default: SEED_VC_BUNDLE or the checkpoints)")
+    main(parser.parse_args())
@@ -1,10 +1,10 @@
 import os
 import argparse
+import json
 import torch
-import yaml
-import soundfile as sf
 import time
 from modules.commons import str2bool
+from modules.compile_cache import CompileCache, configure_inductor
 
 # Set up device and torch configurations
 if torch.cuda.is_available():
@@ -22,24 +22,30 @@ vc_wrapper_v2 = None
 
 def load_v2_models(args):
     """Load V2 models using the wrapper from app.py"""
-    from hydra.utils import instantiate
-    from omegaconf import DictConfig
-    cfg = DictConfig(yaml.safe_load(open("configs/v2/vc_wrapper.yaml", "r")))
-    vc_wrapper = instantiate(cfg)
-    vc_wrapper.load_checkpoints(ar_checkpoint_path=args.ar_checkpoint_path,
-                                cfm_checkpoint_path=args.cfm_checkpoint_path)
+    if args.bundle_path is not None:
+        from modules.v2.bundle import load_bundle, read_bundle_metadata
+        vc_wrapper = load_bundle(args.bundle_path)
+        model_config = json.loads(read_bundle_metadata(args.bundle_path)["config"])
+    else:
+        import yaml
+        from hydra.utils import instantiate
+        from omegaconf import DictConfig, OmegaConf
+        cfg = DictConfig(yaml.safe_load(open("configs/v2/vc_wrapper.yaml", "r")))
+        vc_wrapper = instantiate(cfg)
+        vc_wrapper.load_checkpoints(ar_checkpoint_path=args.ar_checkpoint_path,
+                                    cfm_checkpoint_path=args.cfm_checkpoint_path)
+        model_config = OmegaConf.to_container(cfg, resolve=True)
     vc_wrapper.to(device)
     vc_wrapper.eval()
 
     vc_wrapper.setup_ar_caches(max_batch_size=1, max_seq_len=4096, dtype=dtype, device=device)
 
     if args.compile:
-        torch._inductor.config.coordinate_descent_tuning = True
-        torch._inductor.config.triton.unique_kernel_names = True
-
-        if hasattr(torch._inductor.config, "fx_graph_cache"):
-            # Experimental feature to reduce compilation times, will be on by default in future
-            torch._inductor.config.fx_graph_cache = True
+        if args.compile_cache is not None:
+            # reuse compiled kernels across runs, see modules/compile_cache.py
+            CompileCache.for_model(args.compile_cache, model_config, device, dtype).activate()
+        else:
+            configure_inductor()
         vc_wrapper.compile_ar()
         # vc_wrapper.compile_cfm()
 
@@ -77,6 +83,8 @@ def convert_voice_v2(source_audio_path, target_audio_path, args):
 
 
 def main(args):
+    import soundfile as sf
+
     # Create output directory if it doesn't exist
     os.makedirs(args.output, exist_ok=True)
 
@@ -139,6 +147,10 @@ if __name__ == "__main__":
                         help="Path to custom checkpoint file")
     parser.add_argument("--cfm-checkpoint-path", type=str, default=None,
                         help="Path to custom checkpoint file")
+    parser.add_argument("--bundle-path", type=str, default=None,
+                        help="safetensors bundle from convert_bundle.py (replaces both checkpoint paths)")
+    parser.add_argument("--compile-cache", type=str, default=None,
+                        help="Directory keeping torch.compile artifacts across runs (used with --compile)")
 
     args = parser.parse_args()
     main(args)
\ No newline at end of file
@@ -54,6 +54,10 @@ MODEL_MAPPING = {
     "nvidia/bigvgan_v2_44khz_128band_512x": "bigvgan/v2_44khz_128band_512x",
 }
 
+def manifest_path(repo_id, models_dir=LOCAL_MODELS_DIR):
+    """SHA256 manifest of a MODEL_MAPPING entry, written by download_models.py."""
+    return os.path.join(models_dir, ".manifests", repo_id.replace("/", "__") + ".sha256")
+
 def load_local_model(repo_id, model_filename="pytorch_model.bin", config_filename=None):
     """
     Load model from local directory instead of HuggingFace Hub.
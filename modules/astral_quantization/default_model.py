@@ -1,5 +1,33 @@
+from typing import Optional
+
 import torch
-from transformers import AutoTokenizer, AutoModel, Wav2Vec2FeatureExtractor
+
+
+def normalize_ssl_inputs(waves_16k, wave_16k_lens, do_normalize=True, padding_value=0.0, eps=1e-7):
+    """
+    Batched, on-device equivalent of
+    Wav2Vec2FeatureExtractor(waves, padding=True, return_attention_mask=True, return_tensors='pt').
+
+    Args:
+        waves_16k: (B, T) padded 16 kHz waveforms
+        wave_16k_lens: valid length of each waveform, (B,) tensor or list of ints
+    Returns:
+        input_values: (B, T_max) zero-mean unit-variance inputs, padded with padding_value
+        attention_mask: (B, T_max) int32 mask, 1 for valid samples
+    """
+    wave_16k_lens = torch.as_tensor(wave_16k_lens, device=waves_16k.device).long().reshape(-1)
+    max_len = int(wave_16k_lens.max())
+    input_values = waves_16k[:, :max_len].float()
+    mask = torch.arange(max_len, device=waves_16k.device)[None, :] < wave_16k_lens[:, None]
+    if do_normalize:
+        weights = mask.float()
+        lens = wave_16k_lens[:, None].float()
+        mean = (input_values * weights).sum(-1, keepdim=True) / lens
+        var = (((input_values - mean) * weights) ** 2).sum(-1, keepdim=True) / lens
+        input_values = (input_values - mean) / torch.sqrt(var + eps)
+    input_values = input_values.masked_fill(~mask, padding_value)
+    return input_values, mask.to(torch.int32)
+
 
 class AstralQuantizer(torch.nn.Module):
     def __init__(
@@ -10,22 +38,49 @@ class AstralQuantizer(torch.nn.Module):
             encoder: torch.nn.Module,
             quantizer: torch.nn.Module,
             skip_ssl: bool = False,
+            load_ssl_weights: bool = True,
+            load_tokenizer: bool = True,
+            ssl_do_normalize: Optional[bool] = None,
+            ssl_padding_value: float = 0.0,
     ):
+        """
+        The tokenizer is not used for inference, pass load_tokenizer=False to skip it.
+        Giving ssl_do_normalize (and ssl_padding_value) skips the Wav2Vec2FeatureExtractor,
+        whose preprocessing settings are the only thing inference takes from it.
+        """
+        # transformers is imported here so that importing this module stays cheap
+        from transformers import AutoConfig, AutoModel
+
         super().__init__()
         self.encoder = encoder
         self.quantizer = quantizer
         self.tokenizer_name = tokenizer_name
-        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+        if load_tokenizer:
+            from transformers import AutoTokenizer
+            self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+        else:
+            self.tokenizer = None
 
         # Load SSL model from Huggingface
         self.ssl_model_name = ssl_model_name
         self.ssl_output_layer = ssl_output_layer
-        self.ssl_feature_extractor = Wav2Vec2FeatureExtractor.from_pretrained(ssl_model_name)
+        if ssl_do_normalize is None:
+            from transformers import Wav2Vec2FeatureExtractor
+            self.ssl_feature_extractor = Wav2Vec2FeatureExtractor.from_pretrained(ssl_model_name)
+            ssl_do_normalize = self.ssl_feature_extractor.do_normalize
+            ssl_padding_value = self.ssl_feature_extractor.padding_value
+        else:
+            self.ssl_feature_extractor = None
+        self.ssl_do_normalize = ssl_do_normalize
+        self.ssl_padding_value = ssl_padding_value
 
         if skip_ssl:  # in case the same SSL model has been loaded somewhere else
             self.ssl_model = None
         else:
-            self.ssl_model = AutoModel.from_pretrained(ssl_model_name).eval()
+            if load_ssl_weights:
+                self.ssl_model = AutoModel.from_pretrained(ssl_model_name).eval()
+            else:  # architecture only, weights are assigned afterwards (see modules.v2.bundle)
+                self.ssl_model = AutoModel.from_config(AutoConfig.from_pretrained(ssl_model_name)).eval()
             self.ssl_model.encoder.layers = self.ssl_model.encoder.layers[:ssl_output_layer]
             self.ssl_model.encoder.layer_norm = torch.nn.Identity()
 
@@ -43,31 +98,38 @@ class AstralQuantizer(torch.nn.Module):
         if self.asr_decoder is not None:
             self.asr_decoder.load_state_dict(params['predictor'], strict=False)
 
-    def forward(self, waves_16k, wave_16k_lens, ssl_model=None):
+    def extract_ssl_features(self, waves_16k, wave_16k_lens, ssl_model=None):
+        """
+        Run the SSL model on a padded batch of 16 kHz waveforms.
+        Returns hidden states of shape (B, C, T) and the valid frame count of each item,
+        which can be shared by several quantizers through `encode_ssl_features`.
+        """
         ssl_fn = self.ssl_model if self.ssl_model else ssl_model
         assert ssl_fn is not None, "In case in-class SSL model loading is skipped, external ssl_model must be provided"
-        waves_16k_input_list = [
-            waves_16k[bib, :wave_16k_lens[bib]].cpu().numpy()
-            for bib in range(len(waves_16k))
-        ]
-        alt_inputs = self.ssl_feature_extractor(
-            waves_16k_input_list,
-            return_tensors='pt',
-            return_attention_mask=True,
-            padding=True,
-            sampling_rate=16000
-        ).to(waves_16k.device)
-        feature_lens = alt_inputs.data['attention_mask'].sum(-1) // 320  # frame rate of hubert is 50 Hz
+        input_values, attention_mask = normalize_ssl_inputs(
+            waves_16k,
+            wave_16k_lens,
+            do_normalize=self.ssl_do_normalize,
+            padding_value=self.ssl_padding_value,
+        )
+        feature_lens = attention_mask.sum(-1) // 320  # frame rate of hubert is 50 Hz
 
         outputs = ssl_fn(
-            alt_inputs.input_values,
-            attention_mask=alt_inputs.attention_mask,
+            input_values,
+            attention_mask=attention_mask,
         )
         last_hidden_states = outputs.last_hidden_state
         last_hidden_states = last_hidden_states[:, :feature_lens.max(), :]
         feature_lens = feature_lens.clamp(max=last_hidden_states.size(1))
         last_hidden_states = last_hidden_states.transpose(1, 2)
+        return last_hidden_states, feature_lens
+
+    def encode_ssl_features(self, last_hidden_states, feature_lens):
         x_hidden = self.encoder(last_hidden_states, feature_lens)
         x_hidden = x_hidden.transpose(1, 2)
         x_quantized, indices = self.quantizer(x_hidden)[:2]
-        return x_quantized, indices, feature_lens
\ No newline at end of file
+        return x_quantized, indices, feature_lens
+
+    def forward(self, waves_16k, wave_16k_lens, ssl_model=None):
+        last_hidden_states, feature_lens = self.extract_ssl_features(waves_16k, wave_16k_lens, ssl_model=ssl_model)
+        return self.encode_ssl_features(last_hidden_states, feature_lens)
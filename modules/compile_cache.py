@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import time
+
+import torch
+
+# Persistent torch.compile artifacts.
+#
+# Inductor can keep its FX graph cache, autotuning results and the compiled Triton kernels
+# on disk; with a warm cache a restart only pays for Dynamo tracing instead of minutes of
+# code generation and autotuning. A CompileCache is one directory per
+# (torch version, device, dtype, model) combination, so a cache built for one model or
+# torch build is never picked up by another, and a directory produced by
+# warm_compile_cache.py can be shipped with a replica image.
+
+MANIFEST_NAME = "manifest.json"
+
+
+def configure_inductor():
+    """Inductor settings shared by every compile_ar / compile_cfm caller."""
+    import torch._inductor.config as inductor_config
+
+    inductor_config.coordinate_descent_tuning = True
+    inductor_config.triton.unique_kernel_names = True
+    if hasattr(inductor_config, "fx_graph_cache"):
+        inductor_config.fx_graph_cache = True
+    if hasattr(inductor_config, "autotune_local_cache"):
+        inductor_config.autotune_local_cache = True
+    try:
+        import torch._functorch.config as functorch_config
+    except ImportError:
+        return
+    if hasattr(functorch_config, "enable_autograd_cache"):
+        functorch_config.enable_autograd_cache = True
+
+
+def model_hash(config):
+    """Short digest of a (JSON serialisable) model config."""
+    payload = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _device_tag(device):
+    device = torch.device(device)
+    if device.type != "cuda":
+        return device.type
+    index = device.index if device.index is not None else torch.cuda.current_device()
+    major, minor = torch.cuda.get_device_capability(index)
+    # kernels are specific to the CUDA toolkit and the compute capability they were built for
+    return f"cuda{torch.version.cuda}-sm{major}{minor}"
+
+
+def cache_key(config, device, dtype):
+    dtype = str(dtype).replace("torch.", "")
+    return f"torch{torch.__version__}-{_device_tag(device)}-{dtype}-{model_hash(config)}".replace("+", "_")
+
+
+class CompileCache:
+    def __init__(self, root, key):
+        self.root = root
+        self.key = key
+        self.path = os.path.join(root, key)
+
+    @classmethod
+    def for_model(cls, root, config, device, dtype):
+        return cls(root, cache_key(config, device, dtype))
+
+    def activate(self):
+        """Point inductor and Triton at this cache; call before the first torch.compile runs."""
+        os.makedirs(self.path, exist_ok=True)
+        os.environ["TORCHINDUCTOR_CACHE_DIR"] = os.path.join(self.path, "inductor")
+        os.environ["TRITON_CACHE_DIR"] = os.path.join(self.path, "triton")
+        configure_inductor()
+        return self
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.path, MANIFEST_NAME)
+
+    @property
+    def is_warm(self):
+        return os.path.isfile(self.manifest_path)
+
+    def read_manifest(self):
+        with open(self.manifest_path, "r") as f:
+            return json.load(f)
+
+    def write_manifest(self, **info):
+        """Record what the cache was warmed with; its presence marks the cache as warm."""
+        manifest = {"key": self.key, "torch": torch.__version__, "created": time.time(), **info}
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+        return manifest
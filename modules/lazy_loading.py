@@ -0,0 +1,75 @@
+import threading
+
+# On-demand loading of model components for the wrappers.
+#
+# A wrapper registers one loader per component group ("ar", "bigvgan_44k", ...) and
+# declares which groups each capability ("timbre", "style", "svc", ...) needs. Groups are
+# built the first time a capability that needs them is used, eagerly for the capabilities
+# a deployment declares up front, or on a background thread via `prefetch`. Groups without
+# a registered loader count as loaded, so eager construction needs no special casing.
+
+
+class LazyComponents:
+    """
+    Args:
+        capabilities: capability -> tuple of groups it needs
+        loaders: group -> callable that builds the group and installs it on the wrapper
+    """
+
+    def __init__(self, capabilities, loaders=None):
+        self.capabilities = capabilities
+        self._loaders = dict(loaders or {})
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def register(self, group, loader):
+        with self._guard:
+            self._loaders[group] = loader
+
+    def groups_for(self, capabilities):
+        groups = []
+        for capability in capabilities:
+            if capability not in self.capabilities:
+                raise ValueError(f"unknown capability {capability!r}, expected one of {', '.join(self.capabilities)}")
+            groups.extend(group for group in self.capabilities[capability] if group not in groups)
+        return groups
+
+    @property
+    def pending(self):
+        return set(self._loaders)
+
+    def is_loaded(self, group):
+        return group not in self._loaders
+
+    def load(self, group):
+        """Build `group` once; concurrent callers wait for the first one. A failed load stays pending."""
+        if group not in self._loaders:
+            return
+        with self._guard:
+            lock = self._locks.setdefault(group, threading.Lock())
+        with lock:
+            loader = self._loaders.get(group)
+            if loader is None:
+                return
+            loader()
+            with self._guard:
+                del self._loaders[group]
+
+    def ensure(self, *capabilities):
+        for group in self.groups_for(capabilities):
+            self.load(group)
+
+    def prefetch(self, capabilities):
+        """Load the groups of `capabilities` on a daemon thread; errors resurface on first use."""
+        groups = [group for group in self.groups_for(capabilities) if not self.is_loaded(group)]
+
+        def run():
+            for group in groups:
+                try:
+                    self.load(group)
+                except Exception as e:
+                    print(f"Background loading of {group} failed: {e}")
+
+        thread = threading.Thread(target=run, name="component-prefetch", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,104 @@
+import copy
+import threading
+
+# Process-wide registry of loaded models, shared between wrappers.
+#
+# Models are keyed by (class, checkpoint, dtype, device). The first `acquire` of a key
+# runs its loader; later ones return the same instance and only bump a reference count.
+# `release` drops a reference and forgets the model when the last one is gone, so its
+# memory is freed once the callers drop their own references.
+#
+# Shared models are put in eval mode with gradients off and must be treated as read-only:
+# never move, cast or fine-tune a model obtained from the registry in place. A caller
+# that needs per-instance attributes on a shared module (a profiler, a compiled
+# submodule) sets them on a `private_view` of it instead.
+
+
+def model_key(cls, checkpoint, dtype, device):
+    """
+    Registry key. `cls` is a class or its dotted name, `checkpoint` anything identifying the
+    weights (path, repo/file, ...); pass a concrete device such as "cuda:0", not "cuda".
+    """
+    if isinstance(cls, type):
+        cls = f"{cls.__module__}.{cls.__qualname__}"
+    return (cls, str(checkpoint), str(dtype), str(device))
+
+
+def private_view(module):
+    """
+    Shallow copy of a torch module with its own attribute and submodule tables. Parameters,
+    buffers and submodules are still the shared ones, but setting an attribute or replacing
+    a submodule on the view leaves the original untouched.
+    """
+    view = copy.copy(module)
+    view._parameters = module._parameters.copy()
+    view._buffers = module._buffers.copy()
+    view._modules = module._modules.copy()
+    return view
+
+
+def _freeze(model):
+    if hasattr(model, "eval"):
+        model.eval()
+    if hasattr(model, "requires_grad_"):
+        model.requires_grad_(False)
+    return model
+
+
+class _Entry:
+    def __init__(self):
+        self.model = None
+        self.refs = 0
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, loader):
+        """Return the model for `key`, loading it with loader() if no one holds it yet."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+            entry.refs += 1
+        try:
+            # loading happens outside the registry lock; only callers of the same key wait
+            with entry.lock:
+                if entry.model is None:
+                    entry.model = _freeze(loader())
+        except BaseException:
+            self._unref(key, entry)
+            raise
+        return entry.model
+
+    def release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            raise KeyError(f"{key} is not held in the model registry")
+        self._unref(key, entry)
+
+    def _unref(self, key, entry):
+        with self._lock:
+            entry.refs -= 1
+            if entry.refs == 0 and self._entries.get(key) is entry:
+                del self._entries[key]
+
+    def refcount(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.refs if entry is not None else 0
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+MODEL_REGISTRY = ModelRegistry()
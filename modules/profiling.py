@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import nullcontext
+
+import torch
+
+# Named-span timing for the inference pipeline. A disabled Profiler hands out one shared
+# no-op context manager, so instrumented code pays a single attribute lookup and call.
+# On CUDA, spans record a pair of events and are resolved lazily (no synchronize on the
+# hot path); everywhere else they use perf_counter.
+
+DEFAULT_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+_NULL_SPAN = nullcontext()
+
+
+class Histogram:
+    """Cumulative bucket counts plus a window of recent samples for percentiles, in milliseconds."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS, window=1024):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def percentile(self, q):
+        if not self.recent:
+            return 0.0
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.sum / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": max(self.recent) if self.recent else 0.0,
+        }
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "start", "start_event")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        if self.profiler.use_cuda_events:
+            self.start_event = torch.cuda.Event(enable_timing=True)
+            self.start_event.record()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        profiler = self.profiler
+        if profiler.use_cuda_events:
+            end_event = torch.cuda.Event(enable_timing=True)
+            end_event.record()
+            profiler._defer(self.name, self.start, self.start_event, end_event)
+        else:
+            profiler._record(self.name, self.start, time.perf_counter() - self.start)
+        return False
+
+
+class Profiler:
+    """
+    Collects named spans into per-name histograms and a bounded Chrome trace buffer.
+
+    Usage:
+        profiler = Profiler(enabled=True, device=device)
+        with profiler.span("vocoder"):
+            ...
+        profiler.summary()                       # {name: {count, mean_ms, p50_ms, ...}}
+        profiler.export_chrome_trace("trace.json")  # open in chrome://tracing or Perfetto
+    """
+
+    def __init__(self, enabled=False, device=None, max_trace_events=100000, max_pending=256):
+        self.enabled = enabled
+        self.device = torch.device(device) if device is not None else torch.device("cpu")
+        self.use_cuda_events = self.device.type == "cuda" and torch.cuda.is_available()
+        self.max_pending = max_pending
+        self.histograms = {}
+        self._trace = deque(maxlen=max_trace_events)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    @classmethod
+    def from_env(cls, device=None, var="SEED_VC_PROFILE"):
+        """Enabled when the environment variable is set to 1/true/yes."""
+        return cls(enabled=os.environ.get(var, "").lower() in ("1", "true", "yes"), device=device)
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def _record(self, name, start, duration):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(duration * 1000.0)
+            self._trace.append((name, start, duration, threading.get_ident()))
+
+    def _defer(self, name, start, start_event, end_event):
+        with self._lock:
+            self._pending.append((name, start, threading.get_ident(), start_event, end_event))
+            overflow = len(self._pending) > self.max_pending
+        if overflow:
+            self._resolve(block=False)
+
+    def _resolve(self, block=True):
+        """Turn recorded CUDA event pairs into durations; without block, only finished ones."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        unfinished = []
+        for name, start, tid, start_event, end_event in pending:
+            if block:
+                end_event.synchronize()
+            elif not end_event.query():
+                unfinished.append((name, start, tid, start_event, end_event))
+                continue
+            duration = start_event.elapsed_time(end_event) / 1000.0
+            with self._lock:
+                histogram = self.histograms.get(name)
+                if histogram is None:
+                    histogram = self.histograms[name] = Histogram()
+                histogram.observe(duration * 1000.0)
+                self._trace.append((name, start, duration, tid))
+        if unfinished:
+            with self._lock:
+                self._pending = unfinished + self._pending
+
+    def summary(self):
+        self._resolve()
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in self.histograms.items()}
+
+    def chrome_trace(self):
+        """Return recorded spans as a Chrome trace event dict (complete "X" events, microseconds)."""
+        self._resolve()
+        pid = os.getpid()
+        with self._lock:
+            events = [
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": (start - self._origin) * 1e6,
+                    "dur": duration * 1e6,
+                    "pid": pid,
+                    "tid": tid,
+                }
+                for name, start, duration, tid in self._trace
+            ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def reset(self):
+        self._resolve()
+        with self._lock:
+            self.histograms = {}
+            self._trace.clear()
+            self._origin = time.perf_counter()
+
+
+NULL_PROFILER = Profiler(enabled=False)
@@ -0,0 +1,128 @@
+import math
+
+import torch
+import torch.nn.functional as F
+
+# Band-limited (windowed sinc) polyphase resampling on the model device.
+# The kernel math mirrors torchaudio.functional.resample (sinc_interp_hann), but
+# kernels are built once per (orig_sr, target_sr, device, dtype) and reused, and a
+# streaming variant carries filter state across blocks so that concatenated
+# streaming output equals resampling the whole signal at once.
+
+LOWPASS_FILTER_WIDTH = 6
+ROLLOFF = 0.99
+
+resample_kernels = {}
+
+
+def get_resample_kernel(orig_sr, target_sr, device=torch.device("cpu"), dtype=torch.float32):
+    """
+    Return (kernel, width, orig, new) for resampling orig_sr -> target_sr.
+
+    orig/new are the sample rates reduced by their gcd; kernel has shape
+    (new, 1, 2 * width + orig) and is applied with conv1d(stride=orig).
+    """
+    device = torch.device(device)
+    key = (int(orig_sr), int(target_sr), str(device), dtype)
+    if key not in resample_kernels:
+        gcd = math.gcd(int(orig_sr), int(target_sr))
+        orig, new = int(orig_sr) // gcd, int(target_sr) // gcd
+        base_freq = min(orig, new) * ROLLOFF
+        width = math.ceil(LOWPASS_FILTER_WIDTH * orig / base_freq)
+        idx = torch.arange(-width, width + orig, dtype=torch.float64)[None, None] / orig
+        t = torch.arange(0, -new, -1, dtype=torch.float64)[:, None, None] / new + idx
+        t *= base_freq
+        t = t.clamp_(-LOWPASS_FILTER_WIDTH, LOWPASS_FILTER_WIDTH)
+        window = torch.cos(t * math.pi / LOWPASS_FILTER_WIDTH / 2) ** 2
+        t *= math.pi
+        scale = base_freq / orig
+        kernel = torch.where(t == 0, torch.tensor(1.0, dtype=torch.float64), t.sin() / t)
+        kernel = kernel * window * scale
+        resample_kernels[key] = (kernel.to(device=device, dtype=dtype), width, orig, new)
+    return resample_kernels[key]
+
+
+def resample(waveform, orig_sr, target_sr):
+    """
+    Resample a (..., T) tensor on its own device using a cached kernel.
+    """
+    if orig_sr == target_sr:
+        return waveform
+    kernel, width, orig, new = get_resample_kernel(orig_sr, target_sr, waveform.device, waveform.dtype)
+    shape = waveform.size()
+    length = shape[-1]
+    waveform = waveform.reshape(-1, length)
+    padded = F.pad(waveform, (width, width + orig))
+    resampled = F.conv1d(padded[:, None], kernel, stride=orig)
+    resampled = resampled.transpose(1, 2).reshape(waveform.size(0), -1)
+    target_length = math.ceil(new * length / orig)
+    return resampled[..., :target_length].reshape(shape[:-1] + (target_length,))
+
+
+class StreamingResampler:
+    """
+    Stateful mono resampler for block-wise input.
+
+    Each call to `process` returns every output sample that is fully determined by
+    the input seen so far; `flush` emits the tail. The output is delayed by
+    `latency` input samples relative to the input stream.
+    """
+
+    def __init__(self, orig_sr, target_sr, device=torch.device("cpu"), dtype=torch.float32):
+        self.orig_sr = int(orig_sr)
+        self.target_sr = int(target_sr)
+        self.device = torch.device(device)
+        self.dtype = dtype
+        self.kernel, self.width, self._orig, self._new = get_resample_kernel(
+            self.orig_sr, self.target_sr, self.device, self.dtype
+        )
+        self.reset()
+
+    @property
+    def latency(self):
+        if self.orig_sr == self.target_sr:
+            return 0
+        return self.width + self._orig
+
+    def reset(self):
+        self._buffer = torch.zeros(self.width, device=self.device, dtype=self.dtype)
+        self._received = 0
+        self._emitted = 0
+
+    def _empty(self):
+        return torch.zeros(0, device=self.device, dtype=self.dtype)
+
+    def _drain(self):
+        span = 2 * self.width + self._orig
+        if self._buffer.numel() < span:
+            return self._empty()
+        n_frames = (self._buffer.numel() - span) // self._orig + 1
+        used = (n_frames - 1) * self._orig + span
+        out = F.conv1d(self._buffer[None, None, :used], self.kernel, stride=self._orig)
+        out = out[0].t().reshape(-1)
+        self._buffer = self._buffer[n_frames * self._orig:]
+        self._emitted += out.numel()
+        return out
+
+    def process(self, chunk):
+        """Feed a 1-D block (tensor or array) and return the resampled samples available so far."""
+        chunk = torch.as_tensor(chunk).to(device=self.device, dtype=self.dtype).reshape(-1)
+        if self.orig_sr == self.target_sr:
+            return chunk
+        self._received += chunk.numel()
+        self._buffer = torch.cat([self._buffer, chunk])
+        return self._drain()
+
+    def flush(self):
+        """Emit the remaining samples and reset the carried state."""
+        if self.orig_sr == self.target_sr:
+            return self._empty()
+        emitted = self._emitted
+        total = math.ceil(self._new * self._received / self._orig)
+        self._buffer = torch.cat([
+            self._buffer,
+            torch.zeros(self.width + self._orig, device=self.device, dtype=self.dtype),
+        ])
+        out = self._drain()[:max(0, total - emitted)]
+        self.reset()
+        return out
@@ -0,0 +1,271 @@
+import io
+import queue
+import struct
+import threading
+
+import numpy as np
+
+# Persistent per-stream audio encoders for the chunked streaming outputs of the wrappers.
+# Each encoder keeps its codec state across chunks, so a stream is one continuous MP3 /
+# Ogg-Opus / WAV byte stream instead of one independent file per chunk, and nothing
+# spawns an ffmpeg process per chunk. ThreadedStreamEncoder moves encoding off the
+# inference thread.
+#
+# Backends, in order of preference:
+#   mp3:  lameenc (in-process LAME) -> PyAV -> pydub (ffmpeg per chunk, previous behaviour)
+#   opus: PyAV (Ogg container)
+#   wav, pcm: no dependency
+
+try:
+    import lameenc
+except ImportError:
+    lameenc = None
+
+try:
+    import av
+except ImportError:
+    av = None
+
+
+def parse_bitrate(bitrate):
+    """Accept 320000, "320k" or "320000" and return bits per second."""
+    if isinstance(bitrate, str):
+        bitrate = bitrate.strip().lower()
+        if bitrate.endswith("k"):
+            return int(float(bitrate[:-1]) * 1000)
+        return int(bitrate)
+    return int(bitrate)
+
+
+class StreamEncoder:
+    """Encodes successive mono int16 chunks of one stream; `flush` ends the stream."""
+
+    format = None
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+
+    def encode(self, pcm):
+        raise NotImplementedError
+
+    def flush(self):
+        return b""
+
+
+class PCMStreamEncoder(StreamEncoder):
+    format = "pcm"
+
+    def encode(self, pcm):
+        return pcm.astype(np.int16).tobytes()
+
+
+class WAVStreamEncoder(StreamEncoder):
+    """WAV with the header written up front; sizes are set to the streaming sentinel 0xFFFFFFFF."""
+
+    format = "wav"
+
+    def __init__(self, sample_rate):
+        super().__init__(sample_rate)
+        self._header_sent = False
+
+    def _header(self):
+        byte_rate = self.sample_rate * 2
+        return (
+            b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, self.sample_rate, byte_rate, 2, 16)
+            + b"data" + struct.pack("<I", 0xFFFFFFFF)
+        )
+
+    def encode(self, pcm):
+        data = pcm.astype(np.int16).tobytes()
+        if not self._header_sent:
+            self._header_sent = True
+            data = self._header() + data
+        return data
+
+
+class LameMP3StreamEncoder(StreamEncoder):
+    format = "mp3"
+
+    def __init__(self, sample_rate, bitrate="320k"):
+        super().__init__(sample_rate)
+        self._encoder = lameenc.Encoder()
+        self._encoder.set_bit_rate(parse_bitrate(bitrate) // 1000)
+        self._encoder.set_in_sample_rate(sample_rate)
+        self._encoder.set_channels(1)
+        self._encoder.set_quality(2)
+
+    def encode(self, pcm):
+        return bytes(self._encoder.encode(pcm.astype(np.int16).tobytes()))
+
+    def flush(self):
+        return bytes(self._encoder.flush())
+
+
+class _ByteSink(io.RawIOBase):
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class PyAVStreamEncoder(StreamEncoder):
+    """Any FFmpeg codec/container through PyAV, muxed into an in-memory sink."""
+
+    def __init__(self, sample_rate, codec, container, bitrate=None, codec_rate=None, format_name=None):
+        super().__init__(sample_rate)
+        self.format = format_name or container
+        self._sink = _ByteSink()
+        self._container = av.open(self._sink, mode="w", format=container)
+        self._stream = self._container.add_stream(codec, rate=codec_rate or sample_rate)
+        self._stream.layout = "mono"
+        if bitrate is not None:
+            self._stream.bit_rate = parse_bitrate(bitrate)
+
+    def _mux(self, frame):
+        for packet in self._stream.encode(frame):
+            self._container.mux(packet)
+
+    def encode(self, pcm):
+        frame = av.AudioFrame.from_ndarray(pcm.astype(np.int16).reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate = self.sample_rate
+        self._mux(frame)
+        return self._sink.take()
+
+    def flush(self):
+        self._mux(None)
+        self._container.close()
+        return self._sink.take()
+
+
+class PydubMP3ChunkEncoder(StreamEncoder):
+    """Fallback: every chunk is exported as a standalone MP3 through ffmpeg."""
+
+    format = "mp3"
+
+    def __init__(self, sample_rate, bitrate="320k"):
+        super().__init__(sample_rate)
+        self.bitrate = bitrate if isinstance(bitrate, str) else f"{parse_bitrate(bitrate) // 1000}k"
+
+    def encode(self, pcm):
+        from pydub import AudioSegment
+
+        pcm = pcm.astype(np.int16)
+        return AudioSegment(
+            pcm.tobytes(), frame_rate=self.sample_rate,
+            sample_width=pcm.dtype.itemsize, channels=1
+        ).export(format="mp3", bitrate=self.bitrate).read()
+
+
+_FINISH = object()
+
+
+def _encode_worker(encoder, jobs, results):
+    # Holds no reference to the ThreadedStreamEncoder so an abandoned stream can be collected.
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        try:
+            if job is _FINISH:
+                results.put(encoder.flush())
+                return
+            results.put(encoder.encode(job))
+        except Exception as e:
+            results.put(e)
+            return
+
+
+class ThreadedStreamEncoder:
+    """
+    Runs a StreamEncoder on a background thread.
+
+    `write` only enqueues the chunk; `read` returns whatever has been encoded so far
+    (or waits for every submitted chunk with block=True); `finish` flushes the encoder
+    and returns the remaining bytes.
+    """
+
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self.format = encoder.format
+        self.sample_rate = encoder.sample_rate
+        self.bytes_emitted = 0
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        self._pending = 0
+        self._closed = False
+        self._thread = threading.Thread(
+            target=_encode_worker, args=(encoder, self._jobs, self._results), name="stream-encoder", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, pcm):
+        self._jobs.put(np.ascontiguousarray(pcm, dtype=np.int16))
+        self._pending += 1
+
+    def read(self, block=False):
+        chunks = []
+        while self._pending:
+            try:
+                item = self._results.get(block=block)
+            except queue.Empty:
+                break
+            self._pending -= 1
+            if isinstance(item, Exception):
+                self.close()
+                raise item
+            chunks.append(item)
+        data = b"".join(chunks)
+        self.bytes_emitted += len(data)
+        return data
+
+    def finish(self):
+        self._jobs.put(_FINISH)
+        self._pending += 1
+        data = self.read(block=True)
+        self._closed = True
+        self._thread.join()
+        return data
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._jobs.put(None)
+
+    def __del__(self):
+        self.close()
+
+
+def create_stream_encoder(format, sample_rate, bitrate="320k", threaded=True):
+    """Create a persistent encoder for one output stream; format is mp3, opus, wav or pcm."""
+    if format == "mp3":
+        if lameenc is not None:
+            encoder = LameMP3StreamEncoder(sample_rate, bitrate)
+        elif av is not None:
+            encoder = PyAVStreamEncoder(sample_rate, "libmp3lame", "mp3", bitrate=bitrate)
+        else:
+            encoder = PydubMP3ChunkEncoder(sample_rate, bitrate)
+    elif format == "opus":
+        if av is None:
+            raise ImportError("opus stream output requires PyAV (pip install av)")
+        bitrate = min(parse_bitrate(bitrate), 256000)  # libopus maximum per channel
+        encoder = PyAVStreamEncoder(sample_rate, "libopus", "ogg", bitrate=bitrate, codec_rate=48000,
+                                    format_name="opus")
+    elif format == "wav":
+        encoder = WAVStreamEncoder(sample_rate)
+    elif format == "pcm":
+        encoder = PCMStreamEncoder(sample_rate)
+    else:
+        raise ValueError(f"Unsupported stream format: {format}")
+    return ThreadedStreamEncoder(encoder) if threaded else encoder
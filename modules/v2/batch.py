@@ -0,0 +1,181 @@
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+from modules.resample import resample
+
+# Batched timbre conversion for offline jobs with many sources and targets.
+#
+# VoiceConversionWrapper.convert_voice_with_streaming converts one pair at a time and
+# recomputes the target's prompt features for every call. Here the prompt features of
+# each target (mel, length-regulated content, CAMPPlus style) are computed once and kept
+# in an LRU cache, the content of several sources is extracted in one padded SSL pass, and
+# the CFM / vocoder run on padded batches of segments. A segment is one DiT context window
+# of one source; windows are cut exactly like the streaming conversion (overlap_frame_len
+# frames of overlap, crossfaded when stitched), so a source of any length splits into
+# independent segments that batch with every other source of the same target.
+
+
+class TargetPrompt:
+    """Prompt features of one reference voice, reused by every source converted to it."""
+
+    def __init__(self, mel, condition, style):
+        self.mel = mel  # (1, n_mels, T)
+        self.condition = condition  # (1, T, D) length-regulated content
+        self.style = style  # (1, style_dim)
+
+    @property
+    def mel_len(self):
+        return self.mel.size(2)
+
+
+class TargetCache:
+    """LRU cache of TargetPrompt by target path."""
+
+    def __init__(self, wrapper, device, dtype, capacity=64):
+        self.wrapper = wrapper
+        self.device = device
+        self.dtype = dtype
+        self.capacity = capacity
+        self.prompts = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        prompt = self.prompts.get(path)
+        if prompt is not None:
+            self.prompts.move_to_end(path)
+            self.hits += 1
+            return prompt
+        self.misses += 1
+        prompt = self.prompts[path] = self._compute(path)
+        if len(self.prompts) > self.capacity:
+            self.prompts.popitem(last=False)
+        return prompt
+
+    @torch.inference_mode()
+    def _compute(self, path):
+        import librosa
+
+        wrapper = self.wrapper
+        wave = librosa.load(path, sr=wrapper.sr)[0]
+        wave = wave[:wrapper.sr * (wrapper.dit_max_context_len - 5)]  # same 25 s limit as the wrapper
+        wave = torch.tensor(wave).unsqueeze(0).float().to(self.device)
+        wave_16k = resample(wave, wrapper.sr, 16000)
+        mel = wrapper.mel_fn(wave)
+        with torch.autocast(device_type=self.device.type, dtype=self.dtype):
+            indices, _ = wrapper._process_content_features(wave_16k, narrow=False)
+            style = wrapper.compute_style(wave_16k)
+            condition, _ = wrapper.cfm_length_regulator(indices, ylens=torch.LongTensor([mel.size(2)]).to(self.device))
+        return TargetPrompt(mel, condition, style)
+
+
+def segment_bounds(num_frames, window, overlap):
+    """[(start, end), ...] of the DiT windows convert_voice_with_streaming uses for num_frames frames."""
+    bounds, start = [], 0
+    while True:
+        end = min(start + window, num_frames)
+        bounds.append((start, end))
+        if start + window >= num_frames:
+            return bounds
+        start = end - overlap
+
+
+def stitch_segments(waves, overlap_wave_len, crossfade):
+    """Join the vocoded segments of one source the way _stream_wave_chunks does."""
+    if len(waves) == 1:
+        return waves[0]
+    parts, previous = [], None
+    for i, wave in enumerate(waves):
+        last = i == len(waves) - 1
+        body = wave if last else wave[:-overlap_wave_len]
+        parts.append(body if previous is None else crossfade(previous, body.copy(), overlap_wave_len))
+        previous = wave[-overlap_wave_len:]
+    return np.concatenate(parts)
+
+
+def plan_batches(lengths, max_batch_size, max_batch_frames):
+    """
+    Group indices into batches of similar length: sorted by length, each batch holds at most
+    max_batch_size items and max_batch_frames frames after padding to its longest item.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches, current = [], []
+    for index in order:
+        # sorted ascending, so the new item is the longest of the batch
+        if current and (len(current) >= max_batch_size or (len(current) + 1) * lengths[index] > max_batch_frames):
+            batches.append(current)
+            current = []
+        current.append(index)
+    if current:
+        batches.append(current)
+    return batches
+
+
+@torch.inference_mode()
+def extract_conditions(wrapper, waves, device, dtype, max_batch_seconds=120):
+    """
+    CFM conditions (1, T_mel, D) of several sources. Sources up to 30 s share padded SSL
+    passes of at most max_batch_seconds of audio; longer ones use the wrapper's windowing.
+    """
+    waves = [torch.tensor(wave).unsqueeze(0).float().to(device) for wave in waves]
+    mel_lens = [wrapper.mel_fn(wave).size(2) for wave in waves]
+    waves_16k = [resample(wave, wrapper.sr, 16000) for wave in waves]
+    indices = [None] * len(waves)
+    short = [i for i, wave in enumerate(waves_16k) if wave.size(-1) <= 16000 * 30]
+    with torch.autocast(device_type=device.type, dtype=dtype):
+        lengths = [waves_16k[i].size(-1) for i in short]
+        for batch in plan_batches(lengths, len(short), 16000 * max_batch_seconds):
+            wide, _ = wrapper.extract_content([waves_16k[short[j]] for j in batch], narrow=False)
+            for j, content in zip(batch, wide):
+                indices[short[j]] = content
+        for i, wave_16k in enumerate(waves_16k):
+            if indices[i] is None:
+                indices[i], _ = wrapper._process_content_features(wave_16k, narrow=False)
+        conditions = [
+            wrapper.cfm_length_regulator(content, ylens=torch.LongTensor([mel_len]).to(device))[0]
+            for content, mel_len in zip(indices, mel_lens)
+        ]
+    return conditions
+
+
+@torch.inference_mode()
+def convert_segments(
+        wrapper,
+        prompt,
+        conditions,
+        diffusion_steps=30,
+        intelligibility_cfg_rate=0.7,
+        similarity_cfg_rate=0.7,
+        device=torch.device("cpu"),
+):
+    """
+    Run CFM + vocoder on a batch of source conditions (1, T_i, D) that all use `prompt`.
+    Returns one float32 waveform per condition.
+    """
+    batch_size = len(conditions)
+    lengths = [prompt.mel_len + condition.size(1) for condition in conditions]
+    total = max(lengths)
+    if wrapper.dit_compiled:
+        total = max(total, wrapper.compile_len)  # compiled DiT expects the fixed length
+    cat_condition = torch.cat([
+        torch.nn.functional.pad(torch.cat([prompt.condition, condition], dim=1), (0, 0, 0, total - length))
+        for condition, length in zip(conditions, lengths)
+    ])
+    with torch.autocast(device_type=device.type, dtype=torch.float32):  # same as the streaming path
+        vc_mel = wrapper.cfm.inference(
+            cat_condition,
+            torch.LongTensor(lengths).to(device),
+            prompt.mel.expand(batch_size, -1, -1),
+            prompt.style.expand(batch_size, -1),
+            diffusion_steps,
+            inference_cfg_rate=[intelligibility_cfg_rate, similarity_cfg_rate],
+        )
+    mel_lens = [length - prompt.mel_len for length in lengths]
+    vc_mel = vc_mel[:, :, prompt.mel_len:prompt.mel_len + max(mel_lens)]
+    # fill the padding with silence (the floor of the log mel) rather than zeros
+    for i, mel_len in enumerate(mel_lens):
+        vc_mel[i, :, mel_len:] = float(np.log(1e-5))
+    waves = wrapper.vocoder(vc_mel.float()).squeeze(1).float().cpu().numpy()
+    return [wave[:mel_len * wrapper.hop_size] for wave, mel_len in zip(waves, mel_lens)]
@@ -0,0 +1,189 @@
+import json
+import os
+from functools import partial
+
+import torch
+from huggingface_hub import hf_hub_download
+from hydra.utils import instantiate
+from omegaconf import DictConfig, OmegaConf
+from safetensors import safe_open
+from safetensors.torch import save_file
+
+from modules.bigvgan.bigvgan import BigVGAN, load_hparams_from_json
+from modules.v2.vc_wrapper import CAPABILITIES, COMPONENT_GROUPS, deferred_groups
+
+# Consolidated safetensors bundle for VoiceConversionWrapper.
+#
+# A bundle holds every tensor of a fully loaded wrapper (CFM, AR, both AstralQuantizers
+# including the HuBERT layers they keep, CAMPPlus, BigVGAN) plus the Hydra config it was
+# built from. Loading builds the module tree on the meta device, so nothing is randomly
+# initialised or allocated, then assigns tensors straight out of the memory-mapped file:
+# no torch.load unpickling, no prefix-stripped copies, no load_state_dict copy. Pages are
+# only read when a tensor is first touched (or moved to the GPU).
+
+BUNDLE_FORMAT = "seed-vc-v2-bundle"
+BUNDLE_VERSION = "1"
+
+# KV caches are sized at run time by setup_ar_caches and never belong in a bundle
+_SKIP_SUFFIXES = (".k_cache", ".v_cache")
+
+
+def named_tensors(module):
+    """Every parameter and buffer, including non-persistent buffers and tied duplicates."""
+    for name, param in module.named_parameters(remove_duplicate=False):
+        yield name, param
+    for name, buffer in module.named_buffers(remove_duplicate=False):
+        if not name.endswith(_SKIP_SUFFIXES):
+            yield name, buffer
+
+
+def _has_weight_norm(module):
+    return any(name.endswith("weight_g") for name, _ in module.named_parameters())
+
+
+def save_bundle(wrapper, cfg, path, metadata=None):
+    """
+    Write a loaded wrapper and the config it was instantiated from to a single
+    .safetensors file. Tensors that share storage are stored once and recorded as aliases.
+    """
+    tensors, aliases, seen = {}, {}, {}
+    for name, tensor in named_tensors(wrapper):
+        tensor = tensor.detach()
+        key = (
+            tensor.untyped_storage().data_ptr(), tensor.storage_offset(),
+            tuple(tensor.shape), tuple(tensor.stride()), tensor.dtype,
+        )
+        if key in seen:
+            aliases[name] = seen[key]
+            continue
+        seen[key] = name
+        # clone so that partially overlapping views do not trip safetensors' shared-memory check
+        tensors[name] = tensor.to("cpu").contiguous().clone()
+
+    header = {
+        "format": BUNDLE_FORMAT,
+        "version": BUNDLE_VERSION,
+        "config": json.dumps(OmegaConf.to_container(cfg, resolve=True)),
+        "aliases": json.dumps(aliases),
+        "vocoder_weight_norm": "1" if _has_weight_norm(wrapper.vocoder) else "0",
+    }
+    header.update(metadata or {})
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    save_file(tensors, path, metadata=header)
+    return len(tensors), len(aliases)
+
+
+def read_bundle_metadata(path):
+    with safe_open(path, framework="pt", device="cpu") as f:
+        metadata = f.metadata() or {}
+    if metadata.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"{path} is not a Seed-VC v2 bundle")
+    if metadata.get("version") != BUNDLE_VERSION:
+        raise ValueError(f"{path} has bundle version {metadata.get('version')}, expected {BUNDLE_VERSION}")
+    return metadata
+
+
+def build_bigvgan(pretrained_model_name_or_path, use_cuda_kernel=False):
+    """BigVGAN built from its config.json only; the generator weights come from the bundle."""
+    if os.path.isdir(pretrained_model_name_or_path):
+        config_file = os.path.join(pretrained_model_name_or_path, "config.json")
+    else:
+        config_file = hf_hub_download(repo_id=pretrained_model_name_or_path, filename="config.json")
+    return BigVGAN(load_hparams_from_json(config_file), use_cuda_kernel=use_cuda_kernel)
+
+
+def _skeleton_config(cfg):
+    cfg = OmegaConf.create(OmegaConf.to_container(cfg, resolve=True))
+    for name in ("content_extractor_narrow", "content_extractor_wide"):
+        cfg[name]["load_ssl_weights"] = False
+    cfg.vocoder["_target_"] = f"{__name__}.build_bigvgan"
+    return cfg
+
+
+def build_skeleton(cfg, exclude=()):
+    """Instantiate the wrapper on the meta device without reading any weights; `exclude` submodules are left None."""
+    cfg = _skeleton_config(cfg)
+    for name in exclude:
+        cfg[name] = None
+    with torch.device("meta"):
+        return instantiate(cfg)
+
+
+def _assign(root, name, tensor, parameters):
+    module_name, _, attr = name.rpartition(".")
+    module = root.get_submodule(module_name)
+    if attr in module._parameters:
+        # reuse the Parameter of the alias source so tied weights stay one object
+        param = parameters.get(id(tensor))
+        if param is None:
+            param = parameters[id(tensor)] = torch.nn.Parameter(tensor, requires_grad=False)
+        module._parameters[attr] = param
+    elif attr in module._buffers:
+        module._buffers[attr] = tensor
+    else:
+        raise KeyError(f"bundle tensor {name} has no matching parameter or buffer")
+
+
+def _assign_from_bundle(root, path, metadata, names):
+    """Assign the tensors of top-level submodules `names` from the bundle to `root`."""
+    def wanted(key):
+        return key.split(".", 1)[0] in names
+
+    tensors = {}
+    parameters = {}
+    with safe_open(path, framework="pt", device="cpu") as f:
+        for name in filter(wanted, f.keys()):
+            tensors[name] = f.get_tensor(name)
+            _assign(root, name, tensors[name], parameters)
+        for name, source in json.loads(metadata["aliases"]).items():
+            if wanted(name):
+                if source not in tensors:
+                    tensors[source] = f.get_tensor(source)
+                _assign(root, name, tensors[source], parameters)
+
+    missing = [name for name, tensor in named_tensors(root) if tensor.is_meta and wanted(name)]
+    if missing:
+        raise RuntimeError(f"{path} does not cover {len(missing)} tensors, e.g. {', '.join(missing[:5])}")
+
+
+def _load_group(path, metadata, cfg, names):
+    holder = torch.nn.Module()
+    with torch.device("meta"):
+        for name in names:
+            setattr(holder, name, instantiate(cfg[name]))
+    if "vocoder" in names and metadata["vocoder_weight_norm"] == "0":
+        holder.vocoder.remove_weight_norm()
+    _assign_from_bundle(holder, path, metadata, names)
+    return dict(holder.named_children())
+
+
+def load_bundle(path, device="cpu", capabilities=None, registry=None):
+    """
+    Build a VoiceConversionWrapper from a bundle written by save_bundle.
+
+    Tensors stay backed by the memory-mapped file on CPU; pass `device` to move the
+    wrapper afterwards (which reads each tensor exactly once). Component groups that
+    `capabilities` do not need are read from the bundle on first use. With a `registry`,
+    groups other than the AR model are shared with every other wrapper loaded from the
+    same bundle onto the same device.
+    """
+    metadata = read_bundle_metadata(path)
+    cfg = DictConfig(json.loads(metadata["config"]))
+    deferred = list(COMPONENT_GROUPS) if registry is not None else deferred_groups(capabilities)
+    excluded = [name for group in deferred for name in COMPONENT_GROUPS[group]]
+    wrapper = build_skeleton(cfg, exclude=excluded)
+    if "vocoder" not in excluded and metadata["vocoder_weight_norm"] == "0":
+        wrapper.vocoder.remove_weight_norm()
+    _assign_from_bundle(wrapper, path, metadata, {name for name, _ in wrapper.named_children()})
+
+    skeleton_cfg = _skeleton_config(cfg)
+    wrapper.registry = registry
+    for group in deferred:
+        names = COMPONENT_GROUPS[group]
+        source = (cfg[names[0]]["_target_"], f"{os.path.abspath(path)}:{group}")
+        wrapper.defer(group, partial(_load_group, path, metadata, skeleton_cfg, names), source)
+    if torch.device(device).type != "cpu":
+        wrapper.to(device)
+    if registry is not None:
+        wrapper.ensure_capability(*(capabilities if capabilities is not None else CAPABILITIES))
+    return wrapper
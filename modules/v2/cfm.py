@@ -1,6 +1,8 @@
 import torch
 from tqdm import tqdm
 
+from modules.profiling import NULL_PROFILER
+
 class CFM(torch.nn.Module):
     def __init__(
         self,
@@ -11,6 +13,7 @@ class CFM(torch.nn.Module):
         self.estimator = estimator
         self.in_channels = estimator.in_channels
         self.criterion = torch.nn.L1Loss()
+        self.profiler = NULL_PROFILER
 
     @torch.inference_mode()
     def inference(self,
@@ -49,9 +52,11 @@ class CFM(torch.nn.Module):
         return self.solve_euler(z, x_lens, prompt, mu, style, t_span, inference_cfg_rate, random_voice)
     def solve_euler(self, x, x_lens, prompt, mu, style, t_span, inference_cfg_rate=[0.5, 0.5], random_voice=False,):
         """
-        Fixed euler solver for ODEs.
+        Fixed euler solver for ODEs. Inputs may hold several items; the guidance passes of a
+        batch of B run as one estimator call of 2B or 3B rows.
         Args:
             x (torch.Tensor): random noise
+                shape: (batch_size, n_feats, mel_timesteps)
             t_span (torch.Tensor): n_timesteps interpolated
                 shape: (n_timesteps + 1,)
             mu (torch.Tensor): output of encoder
@@ -67,6 +72,7 @@ class CFM(torch.nn.Module):
             amo_sampling (bool, optional): AMO sampling. Defaults to False.
         """
         t, _, dt = t_span[0], t_span[-1], t_span[1] - t_span[0]
+        B = x.size(0)
 
         # apply prompt
         prompt_len = prompt.size(-1)
@@ -74,60 +80,61 @@ class CFM(torch.nn.Module):
         prompt_x[..., :prompt_len] = prompt[..., :prompt_len]
         x[..., :prompt_len] = 0
         for step in tqdm(range(1, len(t_span))):
-            if random_voice:
-                cfg_dphi_dt = self.estimator(
-                    torch.cat([x, x], dim=0),
-                    torch.cat([torch.zeros_like(prompt_x), torch.zeros_like(prompt_x)], dim=0),
-                    torch.cat([x_lens, x_lens], dim=0),
-                    torch.cat([t.unsqueeze(0), t.unsqueeze(0)], dim=0),
-                    torch.cat([torch.zeros_like(style), torch.zeros_like(style)], dim=0),
-                    torch.cat([mu, torch.zeros_like(mu)], dim=0),
-                )
-                cond_txt, uncond = cfg_dphi_dt[0:1], cfg_dphi_dt[1:2]
-                dphi_dt = ((1.0 + inference_cfg_rate[0]) * cond_txt - inference_cfg_rate[0] * uncond)
-            elif all(i == 0 for i in inference_cfg_rate):
-                dphi_dt = self.estimator(x, prompt_x, x_lens, t.unsqueeze(0), style, mu)
-            elif inference_cfg_rate[0] == 0:
-                # Classifier-Free Guidance inference introduced in VoiceBox
-                cfg_dphi_dt = self.estimator(
-                    torch.cat([x, x], dim=0),
-                    torch.cat([prompt_x, torch.zeros_like(prompt_x)], dim=0),
-                    torch.cat([x_lens, x_lens], dim=0),
-                    torch.cat([t.unsqueeze(0), t.unsqueeze(0)], dim=0),
-                    torch.cat([style, torch.zeros_like(style)], dim=0),
-                    torch.cat([mu, mu], dim=0),
-                )
-                cond_txt_spk, cond_txt = cfg_dphi_dt[0:1], cfg_dphi_dt[1:2]
-                dphi_dt = ((1.0 + inference_cfg_rate[1]) * cond_txt_spk - inference_cfg_rate[1] * cond_txt)
-            elif inference_cfg_rate[1] == 0:
-                cfg_dphi_dt = self.estimator(
-                    torch.cat([x, x], dim=0),
-                    torch.cat([prompt_x, torch.zeros_like(prompt_x)], dim=0),
-                    torch.cat([x_lens, x_lens], dim=0),
-                    torch.cat([t.unsqueeze(0), t.unsqueeze(0)], dim=0),
-                    torch.cat([style, torch.zeros_like(style)], dim=0),
-                    torch.cat([mu, torch.zeros_like(mu)], dim=0),
-                )
-                cond_txt_spk, uncond = cfg_dphi_dt[0:1], cfg_dphi_dt[1:2]
-                dphi_dt = ((1.0 + inference_cfg_rate[0]) * cond_txt_spk - inference_cfg_rate[0] * uncond)
-            else:
-                # Multi-condition Classifier-Free Guidance inference introduced in MegaTTS3
-                cfg_dphi_dt = self.estimator(
-                    torch.cat([x, x, x], dim=0),
-                    torch.cat([prompt_x, torch.zeros_like(prompt_x), torch.zeros_like(prompt_x)], dim=0),
-                    torch.cat([x_lens, x_lens, x_lens], dim=0),
-                    torch.cat([t.unsqueeze(0), t.unsqueeze(0), t.unsqueeze(0)], dim=0),
-                    torch.cat([style, torch.zeros_like(style), torch.zeros_like(style)], dim=0),
-                    torch.cat([mu, mu, torch.zeros_like(mu)], dim=0),
-                )
-                cond_txt_spk, cond_txt, uncond = cfg_dphi_dt[0:1], cfg_dphi_dt[1:2], cfg_dphi_dt[2:3]
-                dphi_dt = (1.0 + inference_cfg_rate[0] + inference_cfg_rate[1]) * cond_txt_spk - \
-                    inference_cfg_rate[0] * uncond - inference_cfg_rate[1] * cond_txt
-            x = x + dt * dphi_dt
-            t = t + dt
-            if step < len(t_span) - 1:
-                dt = t_span[step + 1] - t
-            x[:, :, :prompt_len] = 0
+            with self.profiler.span("cfm_step"):
+                if random_voice:
+                    cfg_dphi_dt = self.estimator(
+                        torch.cat([x, x], dim=0),
+                        torch.cat([torch.zeros_like(prompt_x), torch.zeros_like(prompt_x)], dim=0),
+                        torch.cat([x_lens, x_lens], dim=0),
+                        torch.cat([t.expand(B), t.expand(B)], dim=0),
+                        torch.cat([torch.zeros_like(style), torch.zeros_like(style)], dim=0),
+                        torch.cat([mu, torch.zeros_like(mu)], dim=0),
+                    )
+                    cond_txt, uncond = cfg_dphi_dt.chunk(2, dim=0)
+                    dphi_dt = ((1.0 + inference_cfg_rate[0]) * cond_txt - inference_cfg_rate[0] * uncond)
+                elif all(i == 0 for i in inference_cfg_rate):
+                    dphi_dt = self.estimator(x, prompt_x, x_lens, t.expand(B), style, mu)
+                elif inference_cfg_rate[0] == 0:
+                    # Classifier-Free Guidance inference introduced in VoiceBox
+                    cfg_dphi_dt = self.estimator(
+                        torch.cat([x, x], dim=0),
+                        torch.cat([prompt_x, torch.zeros_like(prompt_x)], dim=0),
+                        torch.cat([x_lens, x_lens], dim=0),
+                        torch.cat([t.expand(B), t.expand(B)], dim=0),
+                        torch.cat([style, torch.zeros_like(style)], dim=0),
+                        torch.cat([mu, mu], dim=0),
+                    )
+                    cond_txt_spk, cond_txt = cfg_dphi_dt.chunk(2, dim=0)
+                    dphi_dt = ((1.0 + inference_cfg_rate[1]) * cond_txt_spk - inference_cfg_rate[1] * cond_txt)
+                elif inference_cfg_rate[1] == 0:
+                    cfg_dphi_dt = self.estimator(
+                        torch.cat([x, x], dim=0),
+                        torch.cat([prompt_x, torch.zeros_like(prompt_x)], dim=0),
+                        torch.cat([x_lens, x_lens], dim=0),
+                        torch.cat([t.expand(B), t.expand(B)], dim=0),
+                        torch.cat([style, torch.zeros_like(style)], dim=0),
+                        torch.cat([mu, torch.zeros_like(mu)], dim=0),
+                    )
+                    cond_txt_spk, uncond = cfg_dphi_dt.chunk(2, dim=0)
+                    dphi_dt = ((1.0 + inference_cfg_rate[0]) * cond_txt_spk - inference_cfg_rate[0] * uncond)
+                else:
+                    # Multi-condition Classifier-Free Guidance inference introduced in MegaTTS3
+                    cfg_dphi_dt = self.estimator(
+                        torch.cat([x, x, x], dim=0),
+                        torch.cat([prompt_x, torch.zeros_like(prompt_x), torch.zeros_like(prompt_x)], dim=0),
+                        torch.cat([x_lens, x_lens, x_lens], dim=0),
+                        torch.cat([t.expand(B), t.expand(B), t.expand(B)], dim=0),
+                        torch.cat([style, torch.zeros_like(style), torch.zeros_like(style)], dim=0),
+                        torch.cat([mu, mu, torch.zeros_like(mu)], dim=0),
+                    )
+                    cond_txt_spk, cond_txt, uncond = cfg_dphi_dt.chunk(3, dim=0)
+                    dphi_dt = (1.0 + inference_cfg_rate[0] + inference_cfg_rate[1]) * cond_txt_spk - \
+                        inference_cfg_rate[0] * uncond - inference_cfg_rate[1] * cond_txt
+                x = x + dt * dphi_dt
+                t = t + dt
+                if step < len(t_span) - 1:
+                    dt = t_span[step + 1] - t
+                x[:, :, :prompt_len] = 0
 
         return x
 
@@ -0,0 +1,205 @@
+import copy
+import json
+import os
+
+import torch
+
+from modules.v2.onnx_manifest import RUNTIME_FORMAT, RUNTIME_MANIFEST, RUNTIME_VERSION, STAGES
+
+# ONNX export of the V2 timbre conversion pipeline.
+#
+# Every stage of VoiceConversionWrapper that runs a network on the timbre path becomes its
+# own graph with dynamic batch / time axes:
+#
+#   content           HuBERT layers + ConvNeXt encoder + BSQ quantizer of content_extractor_wide
+#   length_regulator  cfm_length_regulator, content indices -> CFM condition at mel frame rate
+#   style             CAMPPlus on 16 kHz kaldi fbank features
+#   estimator         the DiT velocity estimator; the Euler loop and CFG mixing stay outside
+#   vocoder           BigVGAN, weight norm folded in
+#
+# The feature front-ends (SSL input normalisation, kaldi fbank, mel spectrogram) are plain
+# signal processing and are reimplemented in numpy by modules.v2.onnx_runtime, which reads
+# the `runtime.json` written next to the graphs. The AR style-conversion path (sampling
+# loop over a KV cache) is not exported.
+
+DEFAULT_OPSET = 17
+
+
+class ContentStage(torch.nn.Module):
+    """Normalised 16 kHz waveform -> wide content indices, for one unpadded waveform."""
+
+    def __init__(self, content_extractor):
+        super().__init__()
+        self.ssl_model = content_extractor.ssl_model
+        self.encoder = content_extractor.encoder
+        self.quantizer = content_extractor.quantizer
+
+    def forward(self, input_values):
+        # without padding the attention mask is all ones, which is what None means to HuBERT
+        hidden = self.ssl_model(input_values).last_hidden_state.transpose(1, 2)
+        lens = torch.ones_like(hidden[:, 0, 0], dtype=torch.long) * hidden.size(2)
+        x_hidden = self.encoder(hidden, lens).transpose(1, 2)
+        return self.quantizer(x_hidden)[1]
+
+
+class LengthRegulatorStage(torch.nn.Module):
+    def __init__(self, length_regulator):
+        super().__init__()
+        self.length_regulator = length_regulator
+
+    def forward(self, indices, ylens):
+        return self.length_regulator(indices, ylens=ylens)[0]
+
+
+class StyleStage(torch.nn.Module):
+    def __init__(self, style_encoder):
+        super().__init__()
+        self.style_encoder = style_encoder
+
+    def forward(self, fbank, fbank_lens):
+        return self.style_encoder(fbank, fbank_lens)
+
+
+class EstimatorStage(torch.nn.Module):
+    def __init__(self, estimator):
+        super().__init__()
+        self.estimator = estimator
+
+    def forward(self, x, prompt_x, x_lens, t, style, cond):
+        return self.estimator(x, prompt_x, x_lens, t, style, cond)
+
+
+def _example_inputs(wrapper, stage, frames=200):
+    """Inputs of a representative size; the exported axes stay dynamic."""
+    regulator = wrapper.cfm_length_regulator
+    content_frames = frames // 2
+    if stage == "content":
+        return (torch.randn(1, 16000 * 3),)
+    if stage == "length_regulator":
+        indices = torch.randint(0, regulator.embedding.num_embeddings, (1, content_frames))
+        return indices, torch.LongTensor([frames])
+    if stage == "style":
+        return torch.randn(1, 2 * frames, 80), torch.LongTensor([frames])
+    if stage == "estimator":
+        estimator = wrapper.cfm.estimator
+        # batch of 2, as classifier-free guidance runs it
+        x = torch.randn(2, estimator.in_channels, frames)
+        return (
+            x,
+            torch.randn_like(x),
+            torch.LongTensor([frames, frames]),
+            torch.rand(2),
+            torch.randn(2, estimator.style_in.in_features),
+            torch.randn(2, frames, estimator.content_dim),
+        )
+    if stage == "vocoder":
+        return (torch.randn(1, wrapper.cfm.estimator.in_channels, frames),)
+    raise ValueError(f"unknown stage {stage}")
+
+
+_STAGE_IO = {
+    "content": (["input_values"], ["indices"], {"input_values": {1: "samples"}, "indices": {1: "frames"}}),
+    "length_regulator": (
+        ["indices", "ylens"], ["cond"], {"indices": {1: "frames"}, "cond": {1: "mel_frames"}},
+    ),
+    "style": (["fbank", "fbank_lens"], ["style"], {"fbank": {1: "fbank_frames"}}),
+    "estimator": (
+        ["x", "prompt_x", "x_lens", "t", "style", "cond"],
+        ["dphi_dt"],
+        {
+            "x": {0: "batch", 2: "mel_frames"},
+            "prompt_x": {0: "batch", 2: "mel_frames"},
+            "x_lens": {0: "batch"},
+            "t": {0: "batch"},
+            "style": {0: "batch"},
+            "cond": {0: "batch", 1: "mel_frames"},
+            "dphi_dt": {0: "batch", 2: "mel_frames"},
+        },
+    ),
+    "vocoder": (["mel"], ["wave"], {"mel": {2: "mel_frames"}, "wave": {2: "samples"}}),
+}
+
+
+def stage_module(wrapper, stage):
+    if stage == "content":
+        return ContentStage(wrapper.content_extractor_wide)
+    if stage == "length_regulator":
+        return LengthRegulatorStage(wrapper.cfm_length_regulator)
+    if stage == "style":
+        return StyleStage(wrapper.style_encoder)
+    if stage == "estimator":
+        return EstimatorStage(wrapper.cfm.estimator)
+    if stage == "vocoder":
+        vocoder = copy.deepcopy(wrapper.vocoder)
+        if any(name.endswith("weight_g") for name, _ in vocoder.named_parameters()):
+            vocoder.remove_weight_norm()
+        return vocoder
+    raise ValueError(f"unknown stage {stage}")
+
+
+def runtime_manifest(wrapper, files):
+    extractor = wrapper.content_extractor_wide
+    return {
+        "format": RUNTIME_FORMAT,
+        "version": RUNTIME_VERSION,
+        "sr": wrapper.sr,
+        "hop_size": wrapper.hop_size,
+        "mel": dict(wrapper.mel_fn.keywords),
+        "ssl": {"do_normalize": bool(extractor.ssl_do_normalize), "padding_value": float(extractor.ssl_padding_value)},
+        "in_channels": wrapper.cfm.estimator.in_channels,
+        "dit_max_context_len": wrapper.dit_max_context_len,
+        "overlap_frame_len": wrapper.overlap_frame_len,
+        "stages": files,
+    }
+
+
+@torch.no_grad()
+def export_stages(wrapper, output_dir, stages=STAGES, opset=DEFAULT_OPSET):
+    """
+    Export `stages` of a fully loaded wrapper (on CPU, float32) to `output_dir`; returns the
+    runtime manifest, which is also written as runtime.json.
+    """
+    wrapper.ensure_capability("timbre")
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, RUNTIME_MANIFEST)
+    files = {}
+    if os.path.exists(manifest_path):
+        # keep stages exported by an earlier run
+        with open(manifest_path, "r") as f:
+            files.update(json.load(f).get("stages", {}))
+    for stage in stages:
+        module = stage_module(wrapper, stage).eval().float().cpu()
+        input_names, output_names, dynamic_axes = _STAGE_IO[stage]
+        filename = f"{stage}.onnx"
+        torch.onnx.export(
+            module,
+            _example_inputs(wrapper, stage),
+            os.path.join(output_dir, filename),
+            input_names=input_names,
+            output_names=output_names,
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+        files[stage] = filename
+    manifest = runtime_manifest(wrapper, files)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+@torch.no_grad()
+def verify_stages(wrapper, output_dir, stages=STAGES):
+    """Max absolute difference between PyTorch and onnxruntime outputs of every stage."""
+    import onnxruntime as ort
+
+    errors = {}
+    for stage in stages:
+        module = stage_module(wrapper, stage).eval().float().cpu()
+        inputs = _example_inputs(wrapper, stage, frames=173)  # a length the export did not see
+        expected = module(*inputs)
+        session = ort.InferenceSession(os.path.join(output_dir, f"{stage}.onnx"), providers=["CPUExecutionProvider"])
+        feed = {name: tensor.numpy() for name, tensor in zip(_STAGE_IO[stage][0], inputs)}
+        actual = session.run(None, feed)[0]
+        errors[stage] = float((expected.float() - torch.from_numpy(actual).float()).abs().max())
+    return errors
@@ -0,0 +1,8 @@
+# Layout of an ONNX export directory, shared by modules.v2.onnx_export (which writes it
+# with torch) and modules.v2.onnx_runtime (which reads it without torch). Keep this module
+# free of torch imports.
+
+RUNTIME_FORMAT = "seed-vc-v2-onnx"
+RUNTIME_VERSION = 1
+RUNTIME_MANIFEST = "runtime.json"
+STAGES = ("content", "length_regulator", "style", "estimator", "vocoder")
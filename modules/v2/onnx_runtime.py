@@ -0,0 +1,281 @@
+import json
+import os
+
+import numpy as np
+
+from modules.v2.onnx_manifest import RUNTIME_FORMAT, RUNTIME_MANIFEST, RUNTIME_VERSION
+
+# onnxruntime counterpart of VoiceConversionWrapper's timbre conversion.
+#
+# Runs the graphs written by export_onnx.py (see modules.v2.onnx_export) on the CPU
+# execution provider, without torch, hydra or transformers. The feature front-ends are
+# numpy ports of the ones the wrapper uses: normalize_ssl_inputs for the SSL model,
+# torchaudio's kaldi fbank for CAMPPlus and modules.audio.mel_spectrogram for the prompt
+# mel. Inputs are bound with IO binding so onnxruntime reads the numpy buffers in place,
+# and the estimator writes every diffusion step into one preallocated output buffer.
+
+
+def normalize_ssl_inputs(wave_16k, do_normalize=True, eps=1e-7):
+    """numpy version of default_model.normalize_ssl_inputs for a single unpadded waveform."""
+    wave_16k = wave_16k.astype(np.float32)
+    if do_normalize:
+        wave_16k = (wave_16k - wave_16k.mean()) / np.sqrt(wave_16k.var() + eps)
+    return wave_16k[None].astype(np.float32)
+
+
+def _kaldi_mel_banks(num_bins, padded_window_size, sample_frequency, low_freq=20.0, high_freq=0.0):
+    def mel_scale(freq):
+        return 1127.0 * np.log(1.0 + freq / 700.0)
+
+    num_fft_bins = padded_window_size // 2
+    nyquist = 0.5 * sample_frequency
+    if high_freq <= 0.0:
+        high_freq += nyquist
+    fft_bin_width = sample_frequency / padded_window_size
+    mel_low, mel_high = mel_scale(low_freq), mel_scale(high_freq)
+    mel_delta = (mel_high - mel_low) / (num_bins + 1)
+    bin_index = np.arange(num_bins, dtype=np.float64)[:, None]
+    left = mel_low + bin_index * mel_delta
+    center = mel_low + (bin_index + 1.0) * mel_delta
+    right = mel_low + (bin_index + 2.0) * mel_delta
+    mel = mel_scale(fft_bin_width * np.arange(num_fft_bins, dtype=np.float64))[None, :]
+    up_slope = (mel - left) / (center - left)
+    down_slope = (right - mel) / (right - center)
+    banks = np.maximum(0.0, np.minimum(up_slope, down_slope))
+    # no weight on the Nyquist bin
+    return np.pad(banks, ((0, 0), (0, 1)))
+
+
+def kaldi_fbank(wave_16k, num_mel_bins=80, sample_frequency=16000, frame_length_ms=25.0, frame_shift_ms=10.0,
+                preemphasis=0.97):
+    """
+    numpy port of torchaudio.compliance.kaldi.fbank with the settings compute_style uses
+    (dither=0, povey window, snip_edges, log power mel energies).
+    """
+    wave = wave_16k.astype(np.float64).reshape(-1)
+    window_size = int(sample_frequency * frame_length_ms * 0.001)
+    window_shift = int(sample_frequency * frame_shift_ms * 0.001)
+    padded_window_size = 1 << (window_size - 1).bit_length()
+    if wave.size < window_size:
+        return np.zeros((0, num_mel_bins), dtype=np.float32)
+    num_frames = 1 + (wave.size - window_size) // window_shift
+    starts = np.arange(num_frames)[:, None] * window_shift
+    frames = wave[starts + np.arange(window_size)[None, :]]
+    frames = frames - frames.mean(axis=1, keepdims=True)
+    previous = np.concatenate([frames[:, :1], frames[:, :-1]], axis=1)
+    frames = frames - preemphasis * previous
+    window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(window_size) / (window_size - 1))) ** 0.85
+    frames = np.pad(frames * window, ((0, 0), (0, padded_window_size - window_size)))
+    power = np.abs(np.fft.rfft(frames, axis=1)) ** 2
+    banks = _kaldi_mel_banks(num_mel_bins, padded_window_size, sample_frequency)
+    energies = power @ banks.T
+    return np.log(np.maximum(energies, np.finfo(np.float32).eps)).astype(np.float32)
+
+
+class MelSpectrogram:
+    """numpy version of modules.audio.mel_spectrogram (center=False, reflect padding, log magnitude)."""
+
+    def __init__(self, n_fft, num_mels, sampling_rate, hop_size, win_size, fmin, fmax, center=False):
+        from librosa.filters import mel as librosa_mel_fn
+
+        self.n_fft = n_fft
+        self.hop_size = hop_size
+        self.win_size = win_size
+        self.mel_basis = librosa_mel_fn(sr=sampling_rate, n_fft=n_fft, n_mels=num_mels, fmin=fmin, fmax=fmax)
+        # torch.hann_window is periodic
+        window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(win_size) / win_size)
+        offset = (n_fft - win_size) // 2
+        self.window = np.pad(window, (offset, n_fft - win_size - offset))
+
+    def __call__(self, wave):
+        pad = (self.n_fft - self.hop_size) // 2
+        wave = np.pad(wave.astype(np.float64).reshape(-1), (pad, pad), mode="reflect")
+        num_frames = 1 + (wave.size - self.n_fft) // self.hop_size
+        starts = np.arange(num_frames)[:, None] * self.hop_size
+        frames = wave[starts + np.arange(self.n_fft)[None, :]] * self.window
+        spec = np.sqrt(np.abs(np.fft.rfft(frames, axis=1)) ** 2 + 1e-9)
+        mel = self.mel_basis @ spec.T
+        return np.log(np.maximum(mel, 1e-5)).astype(np.float32)[None]  # (1, num_mels, frames)
+
+
+def crossfade(chunk1, chunk2, overlap):
+    fade_out = np.cos(np.linspace(0, np.pi / 2, overlap)) ** 2
+    fade_in = np.cos(np.linspace(np.pi / 2, 0, overlap)) ** 2
+    n = min(len(chunk2), overlap)
+    chunk2[:n] = chunk2[:n] * fade_in[:n] + (chunk1[-overlap:] * fade_out)[:n]
+    return chunk2
+
+
+class OnnxVoiceConversion:
+    """Timbre conversion with the exported graphs in `model_dir` (the output of export_onnx.py)."""
+
+    def __init__(self, model_dir, num_threads=None, seed=None):
+        import onnxruntime as ort
+
+        with open(os.path.join(model_dir, RUNTIME_MANIFEST), "r") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != RUNTIME_FORMAT or manifest.get("version") != RUNTIME_VERSION:
+            raise ValueError(f"{model_dir} does not hold a version {RUNTIME_VERSION} Seed-VC v2 ONNX export")
+        self.manifest = manifest
+        self.sr = manifest["sr"]
+        self.hop_size = manifest["hop_size"]
+        self.dit_max_context_len = manifest["dit_max_context_len"]
+        self.overlap_frame_len = manifest["overlap_frame_len"]
+        self.mel_fn = MelSpectrogram(**manifest["mel"])
+        self.rng = np.random.default_rng(seed)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        self._ort = ort
+        self.sessions = {
+            stage: ort.InferenceSession(os.path.join(model_dir, filename), options, providers=["CPUExecutionProvider"])
+            for stage, filename in manifest["stages"].items()
+        }
+
+    def run(self, stage, output=None, **inputs):
+        """Run one stage; inputs are read in place and `output` (an OrtValue) receives the result if given."""
+        session = self.sessions[stage]
+        binding = session.io_binding()
+        for name, value in inputs.items():
+            binding.bind_cpu_input(name, np.ascontiguousarray(value))
+        output_name = session.get_outputs()[0].name
+        if output is None:
+            binding.bind_output(output_name, "cpu")
+        else:
+            binding.bind_ortvalue_output(output_name, output)
+        session.run_with_iobinding(binding)
+        return output.numpy() if output is not None else binding.copy_outputs_to_cpu()[0]
+
+    def extract_content(self, wave_16k):
+        """Wide content indices (1, T'); audio over 30 s runs in overlapped windows like the wrapper."""
+        do_normalize = self.manifest["ssl"]["do_normalize"]
+        window, overlap = 16000 * 30, 16000 * 5
+        if wave_16k.size <= window:
+            return self.run("content", input_values=normalize_ssl_inputs(wave_16k, do_normalize))
+        # same windows and overlap trimming as modules.windowing
+        hop = window - overlap
+        bounds = [(0, window)]
+        start = hop
+        while start + overlap < wave_16k.size:
+            bounds.append((start, min(start + window, wave_16k.size)))
+            start += hop
+        pieces = []
+        for i, (start, end) in enumerate(bounds):
+            indices = self.run("content", input_values=normalize_ssl_inputs(wave_16k[start:end], do_normalize))
+            pieces.append(indices if i == 0 else indices[:, 50 * 5:])
+        return np.concatenate(pieces, axis=1)
+
+    def compute_style(self, wave_16k):
+        fbank = kaldi_fbank(wave_16k)
+        fbank = fbank - fbank.mean(axis=0, keepdims=True)
+        return self.run("style", fbank=fbank[None], fbank_lens=np.array([fbank.shape[0] // 2], dtype=np.int64))
+
+    def length_regulate(self, indices, mel_len):
+        return self.run("length_regulator", indices=indices.astype(np.int64), ylens=np.array([mel_len], dtype=np.int64))
+
+    def cfm_inference(self, mu, x_len, prompt, style, n_timesteps, inference_cfg_rate=(0.7, 0.7)):
+        """numpy port of CFM.inference / solve_euler, the estimator being the only graph."""
+        B, T = mu.shape[0], mu.shape[1]
+        in_channels = self.manifest["in_channels"]
+        x = self.rng.standard_normal((B, in_channels, T)).astype(np.float32)
+        t_span = np.linspace(0, 1, n_timesteps + 1, dtype=np.float32)
+        t_span = t_span - (np.cos(np.pi / 2 * t_span) - 1 + t_span)
+        t, dt = t_span[0], t_span[1] - t_span[0]
+
+        prompt_len = prompt.shape[-1]
+        prompt_x = np.zeros_like(x)
+        prompt_x[..., :prompt_len] = prompt[..., :prompt_len]
+        x[..., :prompt_len] = 0
+        x_lens = np.array([x_len], dtype=np.int64)
+        rate_intelligibility, rate_similarity = inference_cfg_rate
+        zeros_prompt, zeros_style, zeros_mu = np.zeros_like(prompt_x), np.zeros_like(style), np.zeros_like(mu)
+        # the same guidance batches as CFM.solve_euler
+        if rate_intelligibility == 0 and rate_similarity == 0:
+            prompt_in, style_in, mu_in = [prompt_x], [style], [mu]
+        elif rate_intelligibility == 0:
+            prompt_in, style_in, mu_in = [prompt_x, zeros_prompt], [style, zeros_style], [mu, mu]
+        elif rate_similarity == 0:
+            prompt_in, style_in, mu_in = [prompt_x, zeros_prompt], [style, zeros_style], [mu, zeros_mu]
+        else:
+            prompt_in = [prompt_x, zeros_prompt, zeros_prompt]
+            style_in = [style, zeros_style, zeros_style]
+            mu_in = [mu, mu, zeros_mu]
+        prompt_in, style_in, mu_in = np.concatenate(prompt_in), np.concatenate(style_in), np.concatenate(mu_in)
+        batch = mu_in.shape[0]
+        lens_in = np.repeat(x_lens, batch)
+        output = self._ort.OrtValue.ortvalue_from_shape_and_type((batch, in_channels, T), np.float32, "cpu")
+        for step in range(1, len(t_span)):
+            dphi = self.run(
+                "estimator", output=output,
+                x=np.concatenate([x] * batch), prompt_x=prompt_in, x_lens=lens_in,
+                t=np.full((batch,), t, dtype=np.float32), style=style_in, cond=mu_in,
+            )
+            if batch == 1:
+                dphi_dt = dphi
+            elif batch == 2 and rate_intelligibility == 0:
+                dphi_dt = (1.0 + rate_similarity) * dphi[0:1] - rate_similarity * dphi[1:2]
+            elif batch == 2:
+                dphi_dt = (1.0 + rate_intelligibility) * dphi[0:1] - rate_intelligibility * dphi[1:2]
+            else:
+                dphi_dt = (1.0 + rate_intelligibility + rate_similarity) * dphi[0:1] \
+                    - rate_intelligibility * dphi[2:3] - rate_similarity * dphi[1:2]
+            x = x + dt * dphi_dt
+            t = t + dt
+            if step < len(t_span) - 1:
+                dt = t_span[step + 1] - t
+            x[:, :, :prompt_len] = 0
+        return x
+
+    def convert_voice(
+            self,
+            source_audio_path: str,
+            target_audio_path: str,
+            diffusion_steps: int = 30,
+            intelligebility_cfg_rate: float = 0.7,
+            similarity_cfg_rate: float = 0.7,
+    ):
+        """
+        Mirrors VoiceConversionWrapper.convert_voice_with_streaming(convert_style=False,
+        stream_output=False): chunked CFM over the source with the target as prompt.
+        Returns (sr, wave).
+        """
+        import librosa
+
+        source_wave = librosa.load(source_audio_path, sr=self.sr)[0]
+        target_wave = librosa.load(target_audio_path, sr=self.sr)[0]
+        target_wave = target_wave[:self.sr * (self.dit_max_context_len - 5)]
+        source_wave_16k = librosa.resample(source_wave, orig_sr=self.sr, target_sr=16000)
+        target_wave_16k = librosa.resample(target_wave, orig_sr=self.sr, target_sr=16000)
+
+        source_mel_len = self.mel_fn(source_wave).shape[2]
+        target_mel = self.mel_fn(target_wave)
+        target_mel_len = target_mel.shape[2]
+
+        source_indices = self.extract_content(source_wave_16k)
+        target_indices = self.extract_content(target_wave_16k)
+        target_style = self.compute_style(target_wave_16k)
+        prompt_condition = self.length_regulate(target_indices, target_mel_len)
+        cond = self.length_regulate(source_indices, source_mel_len)
+
+        max_source_window = self.sr // self.hop_size * self.dit_max_context_len - target_mel_len
+        overlap_wave_len = self.overlap_frame_len * self.hop_size
+        chunks, previous_chunk, processed_frames = [], None, 0
+        while processed_frames < cond.shape[1]:
+            chunk_cond = cond[:, processed_frames:processed_frames + max_source_window]
+            is_last_chunk = processed_frames + max_source_window >= cond.shape[1]
+            cat_condition = np.concatenate([prompt_condition, chunk_cond], axis=1)
+            vc_mel = self.cfm_inference(
+                cat_condition, cat_condition.shape[1], target_mel, target_style, diffusion_steps,
+                inference_cfg_rate=(intelligebility_cfg_rate, similarity_cfg_rate),
+            )[:, :, target_mel_len:]
+            vc_wave = self.run("vocoder", mel=vc_mel.astype(np.float32)).reshape(-1)
+            if is_last_chunk:
+                chunks.append(vc_wave if previous_chunk is None else crossfade(previous_chunk, vc_wave, overlap_wave_len))
+                break
+            body = vc_wave[:-overlap_wave_len]
+            chunks.append(body if previous_chunk is None else crossfade(previous_chunk, body, overlap_wave_len))
+            previous_chunk = vc_wave[-overlap_wave_len:]
+            processed_frames += vc_mel.shape[2] - self.overlap_frame_len
+        return self.sr, np.concatenate(chunks)
@@ -1,9 +1,18 @@
+import json
+from functools import partial
+
 import torch
-import librosa
 import torchaudio
 import numpy as np
-from pydub import AudioSegment
+from hydra.utils import instantiate
+from omegaconf import OmegaConf
 from hf_utils import load_custom_model_from_hf
+from modules.lazy_loading import LazyComponents
+from modules.model_registry import model_key, private_view
+from modules.profiling import NULL_PROFILER
+from modules.resample import resample
+from modules.stream_encoders import create_stream_encoder
+from modules.windowing import stitch_windows, window_bounds
 
 DEFAULT_REPO_ID = "Plachta/Seed-VC"
 DEFAULT_CFM_CHECKPOINT = "v2/cfm_small.pth"
@@ -16,6 +25,54 @@ DEFAULT_CE_WIDE_CHECKPOINT = "bsq2048/bsq2048_light.pth"
 DEFAULT_SE_REPO_ID = "funasr/campplus"
 DEFAULT_SE_CHECKPOINT = "campplus_cn_common.bin"
 
+# Submodules that are built and loaded together
+COMPONENT_GROUPS = {
+    "cfm": ("cfm", "cfm_length_regulator"),
+    "ar": ("ar", "ar_length_regulator"),
+    "content_extractor_narrow": ("content_extractor_narrow",),
+    "content_extractor_wide": ("content_extractor_wide",),
+    "style_encoder": ("style_encoder",),
+    "vocoder": ("vocoder",),
+}
+# The AR group carries per-wrapper generation state (KV caches, compiled decode), so it is
+# never shared through a registry; see _install
+PRIVATE_GROUPS = ("ar",)
+# "timbre" is what convert_timbre needs, "style" adds the AR path of convert_voice
+CAPABILITIES = {
+    "timbre": ("cfm", "content_extractor_wide", "style_encoder", "vocoder"),
+    "style": ("cfm", "content_extractor_wide", "style_encoder", "vocoder", "ar", "content_extractor_narrow"),
+}
+
+
+def deferred_groups(capabilities=None):
+    """Component groups that none of `capabilities` needs (none when capabilities is None)."""
+    if capabilities is None:
+        return []
+    needed = LazyComponents(CAPABILITIES).groups_for(capabilities)
+    return [group for group in COMPONENT_GROUPS if group not in needed]
+
+
+def instantiate_wrapper(cfg, capabilities=None, registry=None):
+    """
+    Instantiate VoiceConversionWrapper from its Hydra config. Groups outside `capabilities`
+    are not built; they are instantiated and loaded the first time a capability needs them.
+
+    With a `registry` (see modules.model_registry) no group is built here: call
+    load_checkpoints and move the wrapper to its device first, then ensure_capability
+    builds each group once per process and shares it with other wrappers (all but the
+    PRIVATE_GROUPS, which every wrapper builds for itself).
+    """
+    deferred = list(COMPONENT_GROUPS) if registry is not None else deferred_groups(capabilities)
+    eager_cfg = OmegaConf.create(OmegaConf.to_container(cfg))
+    for group in deferred:
+        for name in COMPONENT_GROUPS[group]:
+            eager_cfg[name] = None
+    wrapper = instantiate(eager_cfg)
+    wrapper.registry = registry
+    wrapper.defer_from_config(cfg, deferred)
+    return wrapper
+
+
 class VoiceConversionWrapper(torch.nn.Module):
     def __init__(
             self,
@@ -46,11 +103,131 @@ class VoiceConversionWrapper(torch.nn.Module):
         # Set streaming parameters
         self.overlap_frame_len = 16
         self.bitrate = "320k"
+        self.stream_format = "mp3"  # mp3, opus, wav or pcm, see modules.stream_encoders
         self.compiled_decode_fn = None
         self.dit_compiled = False
         self.dit_max_context_len = 30  # in seconds
         self.ar_max_content_len = 1500  # in num of narrow tokens
         self.compile_len = 87 * self.dit_max_context_len
+        self.long_audio_batch_seconds = 120  # max audio per batched content extraction forward
+        self.profiler = NULL_PROFILER
+        # deferred component groups, see defer / ensure_capability
+        self.components = LazyComponents(CAPABILITIES)
+        self._checkpoint_paths = None
+        self._ar_cache_args = None
+        self._compile_ar_pending = False
+        self.registry = None  # ModelRegistry that deferred groups are shared through
+        self._shared_keys = []
+        self._shared_groups = set()
+        # follows .to() / .half() so deferred components are placed like the rest of the wrapper
+        self._placement = torch.empty(0, device="cpu")
+
+    def _apply(self, fn, *args, **kwargs):
+        self._placement = fn(self._placement)
+        return super()._apply(fn, *args, **kwargs)
+
+    def set_profiler(self, profiler):
+        """Record named spans (load, resample, content, ar, cfm, cfm_step, vocoder, encode) into profiler."""
+        self.profiler = profiler
+        if self.cfm is not None:
+            self.cfm.profiler = profiler
+
+    def defer(self, group, factory, source=None):
+        """
+        Build `group` on first use; factory() returns {attribute: module} with weights loaded.
+        `source` (or a callable returning it) is a (class, checkpoint) pair naming the weights;
+        with a registry, groups with a source are shared with every wrapper that names the same.
+        """
+        self.components.register(group, partial(self._install, group, factory, source))
+
+    def defer_from_config(self, cfg, groups):
+        """Defer `groups`, instantiating them from `cfg` and loading their checkpoints on first use."""
+        for group in groups:
+            self.defer(group, partial(self._build_group, cfg, group), partial(self._group_source, cfg, group))
+
+    def release_shared(self):
+        """Return shared groups to the registry; the wrapper must not be used afterwards."""
+        for key in self._shared_keys:
+            self.registry.release(key)
+        self._shared_keys = []
+        self._shared_groups = set()
+
+    def _group_source(self, cfg, group):
+        paths = self._checkpoint_paths or {}
+        checkpoint = {
+            "cfm": paths.get("cfm") or f"{DEFAULT_REPO_ID}/{DEFAULT_CFM_CHECKPOINT}",
+            "ar": paths.get("ar") or f"{DEFAULT_REPO_ID}/{DEFAULT_AR_CHECKPOINT}",
+            "content_extractor_narrow": f"{DEFAULT_CE_REPO_ID}/{DEFAULT_CE_NARROW_CHECKPOINT}",
+            "content_extractor_wide": f"{DEFAULT_CE_REPO_ID}/{DEFAULT_CE_WIDE_CHECKPOINT}",
+            "style_encoder": f"{DEFAULT_SE_REPO_ID}/{DEFAULT_SE_CHECKPOINT}",
+            "vocoder": "pretrained",
+        }[group]
+        if group != "style_encoder":
+            # the architecture (for the vocoder also the pretrained directory) lives in the
+            # config, so it is part of the identity. CAMPPlus is fixed by its checkpoint and
+            # keyed like SeedVCWrapper's, so the two share one instance.
+            config = {name: OmegaConf.to_container(cfg[name], resolve=True) for name in COMPONENT_GROUPS[group]}
+            checkpoint = f"{checkpoint}|{json.dumps(config, sort_keys=True)}"
+        target = cfg[COMPONENT_GROUPS[group][0]]["_target_"]
+        return target, checkpoint
+
+    def ensure_capability(self, *capabilities):
+        """Make sure every component needed by `capabilities` ("timbre", "style") is built."""
+        self.components.ensure(*capabilities)
+
+    def prefetch(self, capabilities):
+        """Build the components of `capabilities` on a background thread."""
+        return self.components.prefetch(capabilities)
+
+    def _build_group(self, cfg, group):
+        modules = {name: instantiate(cfg[name]) for name in COMPONENT_GROUPS[group]}
+        if self._checkpoint_paths is not None:
+            self._load_group_checkpoint(group, modules)
+        return modules
+
+    def _place(self, modules):
+        placed = {}
+        for name, module in modules.items():
+            module = module.to(self._placement.device)
+            if self._placement.dtype != torch.float32:
+                module = module.to(self._placement.dtype)
+            placed[name] = module
+        return placed
+
+    def _acquire_shared(self, group, factory, source):
+        names = COMPONENT_GROUPS[group]
+
+        def load():
+            modules = self._place(factory())
+            return modules[names[0]] if len(names) == 1 else torch.nn.ModuleDict(modules)
+
+        target, checkpoint = source() if callable(source) else source
+        key = model_key(target, checkpoint, self._placement.dtype, self._placement.device)
+        shared = self.registry.acquire(key, load)
+        self._shared_keys.append(key)
+        self._shared_groups.add(group)
+        return dict(shared.items()) if len(names) > 1 else {names[0]: shared}
+
+    def _install(self, group, factory, source=None):
+        with self.profiler.span("materialize"):
+            if self.registry is not None and source is not None and group not in PRIVATE_GROUPS:
+                # shared groups stay in eval mode and are never modified, see modules.model_registry
+                modules = self._acquire_shared(group, factory, source)
+            else:
+                modules = {name: module.train(self.training) for name, module in self._place(factory()).items()}
+            for name, module in modules.items():
+                setattr(self, name, module)
+            if group == "cfm":
+                if group in self._shared_groups:
+                    # per-wrapper attributes (profiler, compiled DiT) go on a view of the shared CFM
+                    self.cfm = private_view(self.cfm)
+                self.cfm.profiler = self.profiler
+            if group == "ar":
+                if self._ar_cache_args is not None:
+                    self.ar.setup_caches(**self._ar_cache_args)
+                if self._compile_ar_pending:
+                    self._compile_ar_pending = False
+                    self.compile_ar()
 
     def forward_cfm(self, content_indices_wide, content_lens, mels, mel_lens, style_vectors):
         device = content_indices_wide.device
@@ -86,12 +263,14 @@ class VoiceConversionWrapper(torch.nn.Module):
         """
         Forward pass for the model.
         """
+        self.ensure_capability("style" if forward_ar else "timbre")
         # extract wide content features as both AR and CFM models use them
         with torch.no_grad():
-            _, content_indices_wide, content_lens = self.content_extractor_wide(waves_16k, wave_lens_16k)
+            ssl_hidden, ssl_lens = self.content_extractor_wide.extract_ssl_features(waves_16k, wave_lens_16k)
+            _, content_indices_wide, content_lens = self.content_extractor_wide.encode_ssl_features(ssl_hidden, ssl_lens)
         if forward_ar:
-            # extract narrow content features for AR model
-            _, content_indices_narrow, _ = self.content_extractor_narrow(waves_16k, wave_lens_16k, ssl_model=self.content_extractor_wide.ssl_model)
+            # extract narrow content features for AR model from the same SSL hidden states
+            _, content_indices_narrow, _ = self.content_extractor_narrow.encode_ssl_features(ssl_hidden, ssl_lens)
             loss_ar = self.forward_ar(content_indices_narrow.clone(), content_indices_wide.clone(), content_lens)
         else:
             loss_ar = torch.tensor(0.0, device=waves_16k.device, dtype=waves_16k.dtype)
@@ -106,6 +285,9 @@ class VoiceConversionWrapper(torch.nn.Module):
         """
         Compile the AR model for inference.
         """
+        if not self.components.is_loaded("ar"):
+            self._compile_ar_pending = True
+            return
         self.compiled_decode_fn = torch.compile(
             self.ar.model.forward_generate,
             fullgraph=True,
@@ -114,6 +296,9 @@ class VoiceConversionWrapper(torch.nn.Module):
         )
 
     def compile_cfm(self):
+        if "cfm" in self._shared_groups:
+            # compile into this wrapper's own DiT shell, the shared estimator keeps its eager transformer
+            self.cfm.estimator = private_view(self.cfm.estimator)
         self.cfm.estimator.transformer = torch.compile(
             self.cfm.estimator.transformer,
             fullgraph=True,
@@ -163,8 +348,21 @@ class VoiceConversionWrapper(torch.nn.Module):
             chunk2[:overlap] = chunk2[:overlap] * fade_in + chunk1[-overlap:] * fade_out
         return chunk2
 
+    def _encode_stream_chunk(self, stream_encoder, wave_int16, is_last_chunk):
+        """Feed one chunk to the stream's encoder and return the bytes ready so far (None if none yet)."""
+        with self.profiler.span("encode"):
+            if stream_encoder is None:
+                encoder = create_stream_encoder(self.stream_format, self.sr, self.bitrate, threaded=False)
+                return encoder.encode(wave_int16) + encoder.flush()
+            stream_encoder.write(wave_int16)
+            if is_last_chunk:
+                return stream_encoder.finish()
+            # wait for the first chunk so playback starts promptly; later chunks encode in the background
+            return stream_encoder.read(block=stream_encoder.bytes_emitted == 0) or None
+
     def _stream_wave_chunks(self, vc_wave, processed_frames, vc_mel, overlap_wave_len, 
-                           generated_wave_chunks, previous_chunk, is_last_chunk, stream_output):
+                           generated_wave_chunks, previous_chunk, is_last_chunk, stream_output,
+                           stream_encoder=None):
         """
         Helper method to handle streaming wave chunks.
         
@@ -177,11 +375,12 @@ class VoiceConversionWrapper(torch.nn.Module):
             previous_chunk: Previous wave chunk for crossfading
             is_last_chunk: Whether this is the last chunk
             stream_output: Whether to stream the output
+            stream_encoder: Persistent encoder of this stream (see modules.stream_encoders)
             
         Returns:
             Tuple of (processed_frames, previous_chunk, should_break, mp3_bytes, full_audio)
             where should_break indicates if processing should stop
-            mp3_bytes is the MP3 bytes if streaming, None otherwise
+            mp3_bytes is the encoded bytes ready so far if streaming, None otherwise
             full_audio is the full audio if this is the last chunk, None otherwise
         """
         mp3_bytes = None
@@ -194,10 +393,7 @@ class VoiceConversionWrapper(torch.nn.Module):
 
                 if stream_output:
                     output_wave_int16 = (output_wave * 32768.0).astype(np.int16)
-                    mp3_bytes = AudioSegment(
-                        output_wave_int16.tobytes(), frame_rate=self.sr,
-                        sample_width=output_wave_int16.dtype.itemsize, channels=1
-                    ).export(format="mp3", bitrate=self.bitrate).read()
+                    mp3_bytes = self._encode_stream_chunk(stream_encoder, output_wave_int16, is_last_chunk)
                     full_audio = (self.sr, np.concatenate(generated_wave_chunks))
                 else:
                     return processed_frames, previous_chunk, True, None, np.concatenate(generated_wave_chunks)
@@ -211,10 +407,7 @@ class VoiceConversionWrapper(torch.nn.Module):
 
             if stream_output:
                 output_wave_int16 = (output_wave * 32768.0).astype(np.int16)
-                mp3_bytes = AudioSegment(
-                    output_wave_int16.tobytes(), frame_rate=self.sr,
-                    sample_width=output_wave_int16.dtype.itemsize, channels=1
-                ).export(format="mp3", bitrate=self.bitrate).read()
+                mp3_bytes = self._encode_stream_chunk(stream_encoder, output_wave_int16, is_last_chunk)
 
         elif is_last_chunk:
             output_wave = self.crossfade(previous_chunk.cpu().numpy(), vc_wave[0].cpu().numpy(), overlap_wave_len)
@@ -223,10 +416,7 @@ class VoiceConversionWrapper(torch.nn.Module):
 
             if stream_output:
                 output_wave_int16 = (output_wave * 32768.0).astype(np.int16)
-                mp3_bytes = AudioSegment(
-                    output_wave_int16.tobytes(), frame_rate=self.sr,
-                    sample_width=output_wave_int16.dtype.itemsize, channels=1
-                ).export(format="mp3", bitrate=self.bitrate).read()
+                mp3_bytes = self._encode_stream_chunk(stream_encoder, output_wave_int16, is_last_chunk)
                 full_audio = (self.sr, np.concatenate(generated_wave_chunks))
             else:
                 return processed_frames, previous_chunk, True, None, np.concatenate(generated_wave_chunks)
@@ -241,10 +431,7 @@ class VoiceConversionWrapper(torch.nn.Module):
 
             if stream_output:
                 output_wave_int16 = (output_wave * 32768.0).astype(np.int16)
-                mp3_bytes = AudioSegment(
-                    output_wave_int16.tobytes(), frame_rate=self.sr,
-                    sample_width=output_wave_int16.dtype.itemsize, channels=1
-                ).export(format="mp3", bitrate=self.bitrate).read()
+                mp3_bytes = self._encode_stream_chunk(stream_encoder, output_wave_int16, is_last_chunk)
                 
         return processed_frames, previous_chunk, False, mp3_bytes, full_audio
 
@@ -253,63 +440,71 @@ class VoiceConversionWrapper(torch.nn.Module):
             cfm_checkpoint_path = None,
             ar_checkpoint_path = None,
     ):
-        if cfm_checkpoint_path is None:
-            cfm_checkpoint_path = load_custom_model_from_hf(
-                repo_id=DEFAULT_REPO_ID,
-                model_filename=DEFAULT_CFM_CHECKPOINT,
-            )
-        else:
-            print(f"Loading CFM checkpoint from {cfm_checkpoint_path}...")
-        if ar_checkpoint_path is None:
-            ar_checkpoint_path = load_custom_model_from_hf(
-                repo_id=DEFAULT_REPO_ID,
-                model_filename=DEFAULT_AR_CHECKPOINT,
+        with self.profiler.span("load_checkpoints"):
+            self._load_checkpoints(cfm_checkpoint_path, ar_checkpoint_path)
+
+    def _load_checkpoints(self, cfm_checkpoint_path, ar_checkpoint_path):
+        # deferred groups load their checkpoint when they are built, see _build_group
+        self._checkpoint_paths = {"cfm": cfm_checkpoint_path, "ar": ar_checkpoint_path}
+        for group, names in COMPONENT_GROUPS.items():
+            if self.components.is_loaded(group):
+                self._load_group_checkpoint(group, {name: getattr(self, name) for name in names})
+
+    def _load_group_checkpoint(self, group, modules):
+        if group == "cfm":
+            cfm_checkpoint_path = self._checkpoint_paths["cfm"]
+            if cfm_checkpoint_path is None:
+                cfm_checkpoint_path = load_custom_model_from_hf(
+                    repo_id=DEFAULT_REPO_ID,
+                    model_filename=DEFAULT_CFM_CHECKPOINT,
+                )
+            else:
+                print(f"Loading CFM checkpoint from {cfm_checkpoint_path}...")
+            cfm_checkpoint = torch.load(cfm_checkpoint_path, map_location="cpu")
+            cfm_length_regulator_state_dict = self.strip_prefix(cfm_checkpoint["net"]['length_regulator'], "module.")
+            cfm_state_dict = self.strip_prefix(cfm_checkpoint["net"]['cfm'], "module.")
+            missing_keys, unexpected_keys = modules["cfm"].load_state_dict(cfm_state_dict, strict=False)
+            missing_keys, unexpected_keys = modules["cfm_length_regulator"].load_state_dict(cfm_length_regulator_state_dict, strict=False)
+        elif group == "ar":
+            ar_checkpoint_path = self._checkpoint_paths["ar"]
+            if ar_checkpoint_path is None:
+                ar_checkpoint_path = load_custom_model_from_hf(
+                    repo_id=DEFAULT_REPO_ID,
+                    model_filename=DEFAULT_AR_CHECKPOINT,
+                )
+            else:
+                print(f"Loading AR checkpoint from {ar_checkpoint_path}...")
+            ar_checkpoint = torch.load(ar_checkpoint_path, map_location="cpu")
+            ar_length_regulator_state_dict = self.strip_prefix(ar_checkpoint["net"]['length_regulator'], "module.")
+            ar_state_dict = self.strip_prefix(ar_checkpoint["net"]['ar'], "module.")
+            missing_keys, unexpected_keys = modules["ar"].load_state_dict(ar_state_dict, strict=False)
+            missing_keys, unexpected_keys = modules["ar_length_regulator"].load_state_dict(ar_length_regulator_state_dict, strict=False)
+        elif group in ("content_extractor_narrow", "content_extractor_wide"):
+            content_extractor_checkpoint_path = load_custom_model_from_hf(
+                repo_id=DEFAULT_CE_REPO_ID,
+                model_filename=DEFAULT_CE_NARROW_CHECKPOINT if group == "content_extractor_narrow" else DEFAULT_CE_WIDE_CHECKPOINT,
             )
-        else:
-            print(f"Loading AR checkpoint from {ar_checkpoint_path}...")
-        # cfm
-        cfm_checkpoint = torch.load(cfm_checkpoint_path, map_location="cpu")
-        cfm_length_regulator_state_dict = self.strip_prefix(cfm_checkpoint["net"]['length_regulator'], "module.")
-        cfm_state_dict = self.strip_prefix(cfm_checkpoint["net"]['cfm'], "module.")
-        missing_keys, unexpected_keys = self.cfm.load_state_dict(cfm_state_dict, strict=False)
-        missing_keys, unexpected_keys = self.cfm_length_regulator.load_state_dict(cfm_length_regulator_state_dict, strict=False)
-
-        # ar
-        ar_checkpoint = torch.load(ar_checkpoint_path, map_location="cpu")
-        ar_length_regulator_state_dict = self.strip_prefix(ar_checkpoint["net"]['length_regulator'], "module.")
-        ar_state_dict = self.strip_prefix(ar_checkpoint["net"]['ar'], "module.")
-        missing_keys, unexpected_keys = self.ar.load_state_dict(ar_state_dict, strict=False)
-        missing_keys, unexpected_keys = self.ar_length_regulator.load_state_dict(ar_length_regulator_state_dict, strict=False)
-
-        # content extractor
-        content_extractor_narrow_checkpoint_path = load_custom_model_from_hf(
-            repo_id=DEFAULT_CE_REPO_ID,
-            model_filename=DEFAULT_CE_NARROW_CHECKPOINT,
-        )
-        content_extractor_narrow_checkpoint = torch.load(content_extractor_narrow_checkpoint_path, map_location="cpu")
-        self.content_extractor_narrow.load_state_dict(
-            content_extractor_narrow_checkpoint, strict=False
-        )
-
-        content_extractor_wide_checkpoint_path = load_custom_model_from_hf(
-            repo_id=DEFAULT_CE_REPO_ID,
-            model_filename=DEFAULT_CE_WIDE_CHECKPOINT,
-        )
-        content_extractor_wide_checkpoint = torch.load(content_extractor_wide_checkpoint_path, map_location="cpu")
-        self.content_extractor_wide.load_state_dict(
-            content_extractor_wide_checkpoint, strict=False
-        )
-
-        # style encoder
-        style_encoder_checkpoint_path = load_custom_model_from_hf(DEFAULT_SE_REPO_ID, DEFAULT_SE_CHECKPOINT, config_filename=None)
-        style_encoder_checkpoint = torch.load(style_encoder_checkpoint_path, map_location="cpu")
-        self.style_encoder.load_state_dict(style_encoder_checkpoint, strict=False)
+            content_extractor_checkpoint = torch.load(content_extractor_checkpoint_path, map_location="cpu")
+            modules[group].load_state_dict(content_extractor_checkpoint, strict=False)
+        elif group == "style_encoder":
+            style_encoder_checkpoint_path = load_custom_model_from_hf(DEFAULT_SE_REPO_ID, DEFAULT_SE_CHECKPOINT, config_filename=None)
+            style_encoder_checkpoint = torch.load(style_encoder_checkpoint_path, map_location="cpu")
+            modules["style_encoder"].load_state_dict(style_encoder_checkpoint, strict=False)
+        # the vocoder is loaded by BigVGAN.from_pretrained when it is instantiated
 
     def setup_ar_caches(self, max_batch_size=1, max_seq_len=4096, dtype=torch.float32, device=torch.device("cpu")):
+        if not self.components.is_loaded("ar"):
+            # allocated when the AR model is built
+            self._ar_cache_args = dict(max_batch_size=max_batch_size, max_seq_len=max_seq_len, dtype=dtype, device=device)
+            return
         self.ar.setup_caches(max_batch_size=max_batch_size, max_seq_len=max_seq_len, dtype=dtype, device=device)
 
     @torch.no_grad()
     def compute_style(self, waves_16k: torch.Tensor, wave_lens_16k: torch.Tensor = None):
+        with self.profiler.span("style"):
+            return self._compute_style(waves_16k, wave_lens_16k)
+
+    def _compute_style(self, waves_16k, wave_lens_16k):
         if wave_lens_16k is None:
             wave_lens_16k = torch.tensor([waves_16k.size(-1)], dtype=torch.int32).to(waves_16k.device)
         feat_list = []
@@ -330,6 +525,34 @@ class VoiceConversionWrapper(torch.nn.Module):
         style = self.style_encoder(feat, feat_lens)
         return style
 
+    def extract_content(self, waves_16k: list, narrow: bool = True):
+        """
+        Extract wide (and optionally narrow) content indices for several waveforms at once.
+        The SSL model runs a single forward pass on the padded batch and both ConvNeXt
+        encoders / BSQ quantizers consume the shared hidden states. The encoders have no
+        length mask (GRN normalises over time, the depthwise convs reach into padding), so
+        they run on each item's unpadded hidden states.
+
+        Args:
+            waves_16k: list of (1, T) or (T,) 16 kHz waveforms on the same device
+            narrow: whether to also compute narrow content indices
+        Returns:
+            (wide_indices, narrow_indices): lists of (1, T') index tensors in input order;
+            narrow_indices is None when narrow is False
+        """
+        with self.profiler.span("content"):
+            waves = [wave.reshape(-1) for wave in waves_16k]
+            wave_lens = torch.LongTensor([wave.size(0) for wave in waves]).to(waves[0].device)
+            waves = torch.nn.utils.rnn.pad_sequence(waves, batch_first=True, padding_value=0)
+            ssl_hidden, feature_lens = self.content_extractor_wide.extract_ssl_features(waves, wave_lens)
+            wide_indices, narrow_indices = [], []
+            for bib in range(len(waves)):
+                hidden, lens = ssl_hidden[bib:bib + 1, :, :feature_lens[bib]], feature_lens[bib:bib + 1]
+                wide_indices.append(self.content_extractor_wide.encode_ssl_features(hidden, lens)[1])
+                if narrow:
+                    narrow_indices.append(self.content_extractor_narrow.encode_ssl_features(hidden, lens)[1])
+            return wide_indices, narrow_indices if narrow else None
+
     @torch.no_grad()
     @torch.inference_mode()
     def convert_timbre(
@@ -344,27 +567,30 @@ class VoiceConversionWrapper(torch.nn.Module):
             device: torch.device = torch.device("cpu"),
             dtype: torch.dtype = torch.float32,
     ):
-        source_wave = librosa.load(source_audio_path, sr=self.sr)[0]
-        target_wave = librosa.load(target_audio_path, sr=self.sr)[0]
-        source_wave_tensor = torch.tensor(source_wave).unsqueeze(0).to(device)
-        target_wave_tensor = torch.tensor(target_wave).unsqueeze(0).to(device)
+        self.ensure_capability("timbre")
+        with self.profiler.span("load"):
+            import librosa  # deferred, it pulls in numba and scipy
+            source_wave = librosa.load(source_audio_path, sr=self.sr)[0]
+            target_wave = librosa.load(target_audio_path, sr=self.sr)[0]
+            source_wave_tensor = torch.tensor(source_wave).unsqueeze(0).to(device)
+            target_wave_tensor = torch.tensor(target_wave).unsqueeze(0).to(device)
 
         # get 16khz audio
-        source_wave_16k = librosa.resample(source_wave, orig_sr=self.sr, target_sr=16000)
-        target_wave_16k = librosa.resample(target_wave, orig_sr=self.sr, target_sr=16000)
-        source_wave_16k_tensor = torch.tensor(source_wave_16k).unsqueeze(0).to(device)
-        target_wave_16k_tensor = torch.tensor(target_wave_16k).unsqueeze(0).to(device)
+        with self.profiler.span("resample"):
+            source_wave_16k_tensor = resample(source_wave_tensor, self.sr, 16000)
+            target_wave_16k_tensor = resample(target_wave_tensor, self.sr, 16000)
 
         # compute mel spectrogram
-        source_mel = self.mel_fn(source_wave_tensor)
-        target_mel = self.mel_fn(target_wave_tensor)
+        with self.profiler.span("mel"):
+            source_mel = self.mel_fn(source_wave_tensor)
+            target_mel = self.mel_fn(target_wave_tensor)
         source_mel_len = source_mel.size(2)
         target_mel_len = target_mel.size(2)
 
         with torch.autocast(device_type=device.type, dtype=dtype):
             # compute content features
-            _, source_content_indices, _ = self.content_extractor_wide(source_wave_16k_tensor, [source_wave_16k.size])
-            _, target_content_indices, _ = self.content_extractor_wide(target_wave_16k_tensor, [target_wave_16k.size])
+            (source_content_indices, target_content_indices), _ = self.extract_content(
+                [source_wave_16k_tensor, target_wave_16k_tensor], narrow=False)
 
             # compute style features
             target_style = self.compute_style(target_wave_16k_tensor)
@@ -375,16 +601,16 @@ class VoiceConversionWrapper(torch.nn.Module):
 
             cat_condition = torch.cat([prompt_condition, cond], dim=1)
             # generate mel spectrogram
-            vc_mel = self.cfm.inference(
-                cat_condition,
-                torch.LongTensor([cat_condition.size(1)]).to(device),
-                target_mel, target_style, diffusion_steps,
-                inference_cfg_rate=inference_cfg_rate,
-                sway_sampling=use_sway_sampling,
-                amo_sampling=use_amo_sampling,
-            )
+            with self.profiler.span("cfm"):
+                vc_mel = self.cfm.inference(
+                    cat_condition,
+                    torch.LongTensor([cat_condition.size(1)]).to(device),
+                    target_mel, target_style, diffusion_steps,
+                    inference_cfg_rate=[inference_cfg_rate, inference_cfg_rate],
+                )
         vc_mel = vc_mel[:, :, target_mel_len:]
-        vc_wave = self.vocoder(vc_mel.float()).squeeze()[None]
+        with self.profiler.span("vocoder"):
+            vc_wave = self.vocoder(vc_mel.float()).squeeze()[None]
         return vc_wave.cpu().numpy()
 
     @torch.no_grad()
@@ -404,39 +630,38 @@ class VoiceConversionWrapper(torch.nn.Module):
             device: torch.device = torch.device("cpu"),
             dtype: torch.dtype = torch.float32,
     ):
-        source_wave = librosa.load(source_audio_path, sr=self.sr)[0]
-        target_wave = librosa.load(target_audio_path, sr=self.sr)[0]
-        source_wave_tensor = torch.tensor(source_wave).unsqueeze(0).to(device)
-        target_wave_tensor = torch.tensor(target_wave).unsqueeze(0).to(device)
+        self.ensure_capability("style")
+        with self.profiler.span("load"):
+            import librosa  # deferred, it pulls in numba and scipy
+            source_wave = librosa.load(source_audio_path, sr=self.sr)[0]
+            target_wave = librosa.load(target_audio_path, sr=self.sr)[0]
+            source_wave_tensor = torch.tensor(source_wave).unsqueeze(0).to(device)
+            target_wave_tensor = torch.tensor(target_wave).unsqueeze(0).to(device)
 
         # get 16khz audio
-        source_wave_16k = librosa.resample(source_wave, orig_sr=self.sr, target_sr=16000)
-        target_wave_16k = librosa.resample(target_wave, orig_sr=self.sr, target_sr=16000)
-        source_wave_16k_tensor = torch.tensor(source_wave_16k).unsqueeze(0).to(device)
-        target_wave_16k_tensor = torch.tensor(target_wave_16k).unsqueeze(0).to(device)
+        with self.profiler.span("resample"):
+            source_wave_16k_tensor = resample(source_wave_tensor, self.sr, 16000)
+            target_wave_16k_tensor = resample(target_wave_tensor, self.sr, 16000)
 
         # compute mel spectrogram
-        source_mel = self.mel_fn(source_wave_tensor)
-        target_mel = self.mel_fn(target_wave_tensor)
+        with self.profiler.span("mel"):
+            source_mel = self.mel_fn(source_wave_tensor)
+            target_mel = self.mel_fn(target_wave_tensor)
         source_mel_len = source_mel.size(2)
         target_mel_len = target_mel.size(2)
 
         with torch.autocast(device_type=device.type, dtype=dtype):
-            # compute content features
-            _, source_content_indices, _ = self.content_extractor_wide(source_wave_16k_tensor, [source_wave_16k.size])
-            _, target_content_indices, _ = self.content_extractor_wide(target_wave_16k_tensor, [target_wave_16k.size])
-
-            _, source_narrow_indices, _ = self.content_extractor_narrow(source_wave_16k_tensor,
-                                                                         [source_wave_16k.size], ssl_model=self.content_extractor_wide.ssl_model)
-            _, target_narrow_indices, _ = self.content_extractor_narrow(target_wave_16k_tensor,
-                                                                         [target_wave_16k.size], ssl_model=self.content_extractor_wide.ssl_model)
+            # compute wide and narrow content features in one SSL pass over source + target
+            (source_content_indices, target_content_indices), (source_narrow_indices, target_narrow_indices) = \
+                self.extract_content([source_wave_16k_tensor, target_wave_16k_tensor], narrow=True)
 
             src_narrow_reduced, src_narrow_len = self.duration_reduction_func(source_narrow_indices[0], 1)
             tgt_narrow_reduced, tgt_narrow_len = self.duration_reduction_func(target_narrow_indices[0], 1)
 
             ar_cond = self.ar_length_regulator(torch.cat([tgt_narrow_reduced, src_narrow_reduced], dim=0)[None])[0]
 
-            ar_out = self.ar.generate(ar_cond, target_content_indices, top_p=top_p, temperature=temperature, repetition_penalty=repetition_penalty)
+            with self.profiler.span("ar"):
+                ar_out = self.ar.generate(ar_cond, target_content_indices, top_p=top_p, temperature=temperature, repetition_penalty=repetition_penalty)
             ar_out_mel_len = torch.LongTensor([int(source_mel_len / source_content_indices.size(-1) * ar_out.size(-1) * length_adjust)]).to(device)
             # compute style features
             target_style = self.compute_style(target_wave_16k_tensor)
@@ -447,48 +672,53 @@ class VoiceConversionWrapper(torch.nn.Module):
 
             cat_condition = torch.cat([prompt_condition, cond], dim=1)
             # generate mel spectrogram
-            vc_mel = self.cfm.inference(
-                cat_condition,
-                torch.LongTensor([cat_condition.size(1)]).to(device),
-                target_mel, target_style, diffusion_steps,
-                inference_cfg_rate=inference_cfg_rate,
-                sway_sampling=use_sway_sampling,
-                amo_sampling=use_amo_sampling,
-            )
+            with self.profiler.span("cfm"):
+                vc_mel = self.cfm.inference(
+                    cat_condition,
+                    torch.LongTensor([cat_condition.size(1)]).to(device),
+                    target_mel, target_style, diffusion_steps,
+                    inference_cfg_rate=[inference_cfg_rate, inference_cfg_rate],
+                )
         vc_mel = vc_mel[:, :, target_mel_len:]
-        vc_wave = self.vocoder(vc_mel.float()).squeeze()[None]
+        with self.profiler.span("vocoder"):
+            vc_wave = self.vocoder(vc_mel.float()).squeeze()[None]
         return vc_wave.cpu().numpy()
 
-    def _process_content_features(self, audio_16k_tensor, is_narrow=False):
-        """Process audio through Whisper model to extract features."""
-        content_extractor_fn = self.content_extractor_narrow if is_narrow else self.content_extractor_wide
-        if audio_16k_tensor.size(-1) <= 16000 * 30:
-            # Compute content features
-            _, content_indices, _ = content_extractor_fn(audio_16k_tensor, [audio_16k_tensor.size(-1)], ssl_model=self.content_extractor_wide.ssl_model)
-        else:
-            # Process long audio in chunks
-            overlapping_time = 5  # 5 seconds
-            features_list = []
-            buffer = None
-            traversed_time = 0
-            while traversed_time < audio_16k_tensor.size(-1):
-                if buffer is None:  # first chunk
-                    chunk = audio_16k_tensor[:, traversed_time:traversed_time + 16000 * 30]
-                else:
-                    chunk = torch.cat([
-                        buffer,
-                        audio_16k_tensor[:, traversed_time:traversed_time + 16000 * (30 - overlapping_time)]
-                    ], dim=-1)
-                _, chunk_content_indices, _ = content_extractor_fn(chunk, [chunk.size(-1)], ssl_model=self.content_extractor_wide.ssl_model)
-                if traversed_time == 0:
-                    features_list.append(chunk_content_indices)
-                else:
-                    features_list.append(chunk_content_indices[:, 50 * overlapping_time:])
-                buffer = chunk[:, -16000 * overlapping_time:]
-                traversed_time += 30 * 16000 if traversed_time == 0 else chunk.size(-1) - 16000 * overlapping_time
-            content_indices = torch.cat(features_list, dim=1)
+    def _process_content_features(self, audio_16k_tensor, narrow=False):
+        """
+        Extract wide (and optionally narrow) content indices, sharing one SSL pass per window.
+        Returns (wide_indices, narrow_indices); narrow_indices is None when narrow is False.
+        """
+        return self._process_content_features_batch([audio_16k_tensor], narrow=narrow)[0]
 
-        return content_indices
+    def _process_content_features_batch(self, waves_16k, narrow=False):
+        """
+        _process_content_features for several waveforms at once: the overlapped 30 s windows of
+        all of them (a waveform up to 30 s is one window) share padded SSL passes under the
+        long_audio_batch_seconds budget. Returns one (wide_indices, narrow_indices) per waveform.
+        """
+        overlapping_time = 5  # 5 seconds
+        windows, owners = [], []
+        for i, wave in enumerate(waves_16k):
+            wave = wave.reshape(-1)
+            for start, end in window_bounds(wave.size(0), 16000 * 30, 16000 * overlapping_time):
+                windows.append(wave[start:end])
+                owners.append(i)
+        windows_per_batch = max(1, self.long_audio_batch_seconds // 30)
+        wide_windows, narrow_windows = [], []
+        for i in range(0, len(windows), windows_per_batch):
+            wide, narrow_list = self.extract_content(windows[i:i + windows_per_batch], narrow=narrow)
+            wide_windows.extend(wide)
+            narrow_windows.extend(narrow_list if narrow else [None] * len(wide))
+        outputs = []
+        for i in range(len(waves_16k)):
+            wide = [feature for owner, feature in zip(owners, wide_windows) if owner == i]
+            narrow_features = [feature for owner, feature in zip(owners, narrow_windows) if owner == i]
+            outputs.append((
+                stitch_windows(wide, 50 * overlapping_time),
+                stitch_windows(narrow_features, 50 * overlapping_time) if narrow else None,
+            ))
+        return outputs
 
     @torch.no_grad()
     @torch.inference_mode()
@@ -531,24 +761,27 @@ class VoiceConversionWrapper(torch.nn.Module):
             If stream_output is False, returns the full audio as a numpy array
         """
         # Load audio
-        source_wave = librosa.load(source_audio_path, sr=self.sr)[0]
-        target_wave = librosa.load(target_audio_path, sr=self.sr)[0]
-        
-        # Limit target audio to 25 seconds
-        target_wave = target_wave[:self.sr * (self.dit_max_context_len - 5)]
-        
-        source_wave_tensor = torch.tensor(source_wave).unsqueeze(0).float().to(device)
-        target_wave_tensor = torch.tensor(target_wave).unsqueeze(0).float().to(device)
+        self.ensure_capability("style" if convert_style else "timbre")
+        with self.profiler.span("load"):
+            import librosa  # deferred, it pulls in numba and scipy
+            source_wave = librosa.load(source_audio_path, sr=self.sr)[0]
+            target_wave = librosa.load(target_audio_path, sr=self.sr)[0]
+
+            # Limit target audio to 25 seconds
+            target_wave = target_wave[:self.sr * (self.dit_max_context_len - 5)]
+
+            source_wave_tensor = torch.tensor(source_wave).unsqueeze(0).float().to(device)
+            target_wave_tensor = torch.tensor(target_wave).unsqueeze(0).float().to(device)
 
         # Resample to 16kHz for feature extraction
-        source_wave_16k = librosa.resample(source_wave, orig_sr=self.sr, target_sr=16000)
-        target_wave_16k = librosa.resample(target_wave, orig_sr=self.sr, target_sr=16000)
-        source_wave_16k_tensor = torch.tensor(source_wave_16k).unsqueeze(0).to(device)
-        target_wave_16k_tensor = torch.tensor(target_wave_16k).unsqueeze(0).to(device)
+        with self.profiler.span("resample"):
+            source_wave_16k_tensor = resample(source_wave_tensor, self.sr, 16000)
+            target_wave_16k_tensor = resample(target_wave_tensor, self.sr, 16000)
 
         # Compute mel spectrograms
-        source_mel = self.mel_fn(source_wave_tensor)
-        target_mel = self.mel_fn(target_wave_tensor)
+        with self.profiler.span("mel"):
+            source_mel = self.mel_fn(source_wave_tensor)
+            target_mel = self.mel_fn(target_wave_tensor)
         source_mel_len = source_mel.size(2)
         target_mel_len = target_mel.size(2)
         
@@ -557,22 +790,22 @@ class VoiceConversionWrapper(torch.nn.Module):
         overlap_wave_len = self.overlap_frame_len * self.hop_size
         
         with torch.autocast(device_type=device.type, dtype=dtype):
-            # Compute content features
-            source_content_indices = self._process_content_features(source_wave_16k_tensor, is_narrow=False)
-            target_content_indices = self._process_content_features(target_wave_16k_tensor, is_narrow=False)
+            # Compute content features of source and target in shared padded SSL passes
+            # narrow indices come from the same passes and are only needed for style conversion
+            (source_content_indices, source_narrow_indices), (target_content_indices, target_narrow_indices) = \
+                self._process_content_features_batch([source_wave_16k_tensor, target_wave_16k_tensor],
+                                                     narrow=convert_style)
             # Compute style features
             target_style = self.compute_style(target_wave_16k_tensor)
             prompt_condition, _, = self.cfm_length_regulator(target_content_indices,
                                                              ylens=torch.LongTensor([target_mel_len]).to(device))
 
         # prepare for streaming
+        stream_encoder = create_stream_encoder(self.stream_format, self.sr, self.bitrate) if stream_output else None
         generated_wave_chunks = []
         processed_frames = 0
         previous_chunk = None
         if convert_style:
-            with torch.autocast(device_type=device.type, dtype=dtype):
-                source_narrow_indices = self._process_content_features(source_wave_16k_tensor, is_narrow=True)
-                target_narrow_indices = self._process_content_features(target_wave_16k_tensor, is_narrow=True)
             src_narrow_reduced, src_narrow_len = self.duration_reduction_func(source_narrow_indices[0], 1)
             tgt_narrow_reduced, tgt_narrow_len = self.duration_reduction_func(target_narrow_indices[0], 1)
             # Process src_narrow_reduced in chunks of max 1000 tokens
@@ -583,18 +816,19 @@ class VoiceConversionWrapper(torch.nn.Module):
                 is_last_chunk = i + max_chunk_size >= len(src_narrow_reduced)
                 with torch.autocast(device_type=device.type, dtype=dtype):
                     chunk = src_narrow_reduced[i:i + max_chunk_size]
-                    if anonymization_only:
-                        chunk_ar_cond = self.ar_length_regulator(chunk[None])[0]
-                        chunk_ar_out = self.ar.generate(chunk_ar_cond, torch.zeros([1, 0]).long().to(device),
-                                                        compiled_decode_fn=self.compiled_decode_fn,
-                                                      top_p=top_p, temperature=temperature,
-                                                      repetition_penalty=repetition_penalty)
-                    else:
-                        # For each chunk, we need to include tgt_narrow_reduced as context
-                        chunk_ar_cond = self.ar_length_regulator(torch.cat([tgt_narrow_reduced, chunk], dim=0)[None])[0]
-                        chunk_ar_out = self.ar.generate(chunk_ar_cond, target_content_indices, compiled_decode_fn=self.compiled_decode_fn,
-                                                      top_p=top_p, temperature=temperature,
-                                                      repetition_penalty=repetition_penalty)
+                    with self.profiler.span("ar"):
+                        if anonymization_only:
+                            chunk_ar_cond = self.ar_length_regulator(chunk[None])[0]
+                            chunk_ar_out = self.ar.generate(chunk_ar_cond, torch.zeros([1, 0]).long().to(device),
+                                                            compiled_decode_fn=self.compiled_decode_fn,
+                                                          top_p=top_p, temperature=temperature,
+                                                          repetition_penalty=repetition_penalty)
+                        else:
+                            # For each chunk, we need to include tgt_narrow_reduced as context
+                            chunk_ar_cond = self.ar_length_regulator(torch.cat([tgt_narrow_reduced, chunk], dim=0)[None])[0]
+                            chunk_ar_out = self.ar.generate(chunk_ar_cond, target_content_indices, compiled_decode_fn=self.compiled_decode_fn,
+                                                          top_p=top_p, temperature=temperature,
+                                                          repetition_penalty=repetition_penalty)
                     chunkar_out_mel_len = torch.LongTensor([int(source_mel_len / source_content_indices.size(
                         -1) * chunk_ar_out.size(-1) * length_adjust)]).to(device)
                     # Length regulation
@@ -607,18 +841,20 @@ class VoiceConversionWrapper(torch.nn.Module):
                                                                 (0, 0, 0, self.compile_len - cat_condition.size(1),),
                                                                 value=0)
                     # Voice Conversion
-                    vc_mel = self.cfm.inference(
-                        cat_condition,
-                        torch.LongTensor([original_len]).to(device),
-                        target_mel, target_style, diffusion_steps,
-                        inference_cfg_rate=[intelligebility_cfg_rate, similarity_cfg_rate],
-                        random_voice=anonymization_only,
-                    )
+                    with self.profiler.span("cfm"):
+                        vc_mel = self.cfm.inference(
+                            cat_condition,
+                            torch.LongTensor([original_len]).to(device),
+                            target_mel, target_style, diffusion_steps,
+                            inference_cfg_rate=[intelligebility_cfg_rate, similarity_cfg_rate],
+                            random_voice=anonymization_only,
+                        )
                     vc_mel = vc_mel[:, :, target_mel_len:original_len]
-                vc_wave = self.vocoder(vc_mel).squeeze()[None]
+                with self.profiler.span("vocoder"):
+                    vc_wave = self.vocoder(vc_mel).squeeze()[None]
                 processed_frames, previous_chunk, should_break, mp3_bytes, full_audio = self._stream_wave_chunks(
                     vc_wave, processed_frames, vc_mel, overlap_wave_len,
-                    generated_wave_chunks, previous_chunk, is_last_chunk, stream_output
+                    generated_wave_chunks, previous_chunk, is_last_chunk, stream_output, stream_encoder
                 )
 
                 if stream_output and mp3_bytes is not None:
@@ -643,19 +879,21 @@ class VoiceConversionWrapper(torch.nn.Module):
                                                             (0, 0, 0, self.compile_len - cat_condition.size(1),), value=0)
                 with torch.autocast(device_type=device.type, dtype=torch.float32):  # force CFM to use float32
                     # Voice Conversion
-                    vc_mel = self.cfm.inference(
-                        cat_condition,
-                        torch.LongTensor([original_len]).to(device),
-                        target_mel, target_style, diffusion_steps,
-                        inference_cfg_rate=[intelligebility_cfg_rate, similarity_cfg_rate],
-                        random_voice=anonymization_only,
-                    )
+                    with self.profiler.span("cfm"):
+                        vc_mel = self.cfm.inference(
+                            cat_condition,
+                            torch.LongTensor([original_len]).to(device),
+                            target_mel, target_style, diffusion_steps,
+                            inference_cfg_rate=[intelligebility_cfg_rate, similarity_cfg_rate],
+                            random_voice=anonymization_only,
+                        )
                 vc_mel = vc_mel[:, :, target_mel_len:original_len]
-                vc_wave = self.vocoder(vc_mel).squeeze()[None]
+                with self.profiler.span("vocoder"):
+                    vc_wave = self.vocoder(vc_mel).squeeze()[None]
 
                 processed_frames, previous_chunk, should_break, mp3_bytes, full_audio = self._stream_wave_chunks(
                     vc_wave, processed_frames, vc_mel, overlap_wave_len,
-                    generated_wave_chunks, previous_chunk, is_last_chunk, stream_output
+                    generated_wave_chunks, previous_chunk, is_last_chunk, stream_output, stream_encoder
                 )
                 
                 if stream_output and mp3_bytes is not None:
@@ -0,0 +1,51 @@
+import torch
+
+# Helpers for running feature extractors over long audio in fixed-size overlapped
+# windows. Windows are independent, so they are grouped into batches bounded by a
+# sample budget and stitched back with the same overlap-trim rule the serial loops
+# used: keep every frame of the first window, drop the overlap frames of the others.
+
+
+def window_bounds(num_samples, window_samples, overlap_samples):
+    """
+    Return [(start, end), ...] sample ranges of overlapped windows covering num_samples.
+    Window k >= 1 starts `overlap_samples` before the end of the previous full window.
+    """
+    hop = window_samples - overlap_samples
+    bounds = [(0, min(window_samples, num_samples))]
+    start = hop
+    while start + overlap_samples < num_samples:
+        bounds.append((start, min(start + window_samples, num_samples)))
+        start += hop
+    return bounds
+
+
+def run_windowed(audio, extract_fn, window_samples, overlap_samples, max_batch_samples):
+    """
+    Run extract_fn over all overlapped windows of audio in batches.
+
+    Args:
+        audio: (1, T) or (T,) waveform
+        extract_fn: callable taking a list of (T_i,) window tensors and returning a list
+            with one output per window, in order
+        window_samples: window length in samples
+        overlap_samples: overlap between consecutive windows in samples
+        max_batch_samples: upper bound on the total window samples passed to one extract_fn call
+    Returns:
+        list of per-window outputs, in window order
+    """
+    audio = audio.reshape(-1)
+    bounds = window_bounds(audio.size(0), window_samples, overlap_samples)
+    windows_per_batch = max(1, max_batch_samples // window_samples)
+    outputs = []
+    for i in range(0, len(bounds), windows_per_batch):
+        windows = [audio[start:end] for start, end in bounds[i:i + windows_per_batch]]
+        outputs.extend(extract_fn(windows))
+    return outputs
+
+
+def stitch_windows(features, overlap_frames, dim=1):
+    """Concatenate per-window features, dropping the leading overlap of every window but the first."""
+    trim = (slice(None),) * dim + (slice(overlap_frames, None),)
+    trimmed = [feature if i == 0 else feature[trim] for i, feature in enumerate(features)]
+    return torch.cat(trimmed, dim=dim)
@@ -1,24 +1,45 @@
+from functools import partial
+
 import torch
 import torchaudio
 import librosa
 import numpy as np
-from pydub import AudioSegment
 import yaml
 from modules.commons import build_model, load_checkpoint, recursive_munch
 from hf_utils import load_custom_model_from_hf
 from modules.campplus.DTDNN import CAMPPlus
 from modules.bigvgan import bigvgan
 from modules.audio import mel_spectrogram
+from modules.lazy_loading import LazyComponents
+from modules.model_registry import MODEL_REGISTRY, model_key
 from modules.rmvpe import RMVPE
+from modules.windowing import run_windowed, stitch_windows
+from modules.stream_encoders import create_stream_encoder
 from transformers import AutoFeatureExtractor, WhisperModel
 
+BASE_DIT_CHECKPOINT = "DiT_seed_v2_uvit_whisper_small_wavenet_bigvgan_pruned.pth"
+BASE_DIT_CONFIG = "config_dit_mel_seed_uvit_whisper_small_wavenet.yml"
+F0_DIT_CHECKPOINT = "DiT_seed_v2_uvit_whisper_base_f0_44k_bigvgan_pruned_ft_ema.pth"
+F0_DIT_CONFIG = "config_dit_mel_seed_uvit_whisper_base_f0_44k.yml"
+
 class SeedVCWrapper:
-    def __init__(self, device=None):
+    # component groups needed by each kind of conversion; f0_condition=True is "svc"
+    CAPABILITIES = {
+        "vc": ("base_model", "whisper", "campplus", "bigvgan_22k"),
+        "svc": ("f0_model", "whisper", "campplus", "bigvgan_44k", "rmvpe"),
+    }
+
+    def __init__(self, device=None, capabilities=("vc", "svc"), prefetch=(), registry=MODEL_REGISTRY):
         """
         Initialize the Seed-VC wrapper with all necessary models and configurations.
         
         Args:
             device: torch device to use. If None, will be automatically determined.
+            capabilities: conversions ("vc", "svc") whose models are loaded now; the
+                models of any other conversion are loaded the first time it is used.
+            prefetch: conversions whose models are loaded on a background thread.
+            registry: ModelRegistry shared with other wrappers in the process; None loads
+                private copies.
         """
         # Set device
         if device is None:
@@ -30,125 +51,154 @@ class SeedVCWrapper:
                 self.device = torch.device("cpu")
         else:
             self.device = device
-            
-        # Load base model and configuration
-        self._load_base_model()
-        
-        # Load F0 conditioned model
-        self._load_f0_model()
-        
-        # Load additional modules
-        self._load_additional_modules()
+
+        # Fixed per model; known without loading anything
+        self.sr = 22050
+        self.hop_length = 256
+        self.sr_f0 = 44100
+        self.hop_length_f0 = 512
+
+        self.registry = registry
+        self._shared_keys = []
+        self._device_key = str(torch.empty(0, device=self.device).device)
+
+        self.components = LazyComponents(self.CAPABILITIES, {
+            "base_model": self._load_base_model,
+            "f0_model": self._load_f0_model,
+            "whisper": self._load_whisper,
+            "campplus": self._load_campplus,
+            "bigvgan_22k": self._load_bigvgan_22k,
+            "bigvgan_44k": self._load_bigvgan_44k,
+            "rmvpe": self._load_rmvpe,
+        })
+        self.components.ensure(*capabilities)
+        if prefetch:
+            self.components.prefetch(prefetch)
         
         # Set streaming parameters
         self.overlap_frame_len = 16
         self.bitrate = "320k"
-        
-    def _load_base_model(self):
-        """Load the base DiT model for voice conversion."""
+        self.stream_format = "mp3"  # mp3, opus, wav or pcm, see modules.stream_encoders
+        self.long_audio_batch_seconds = 120  # max audio per batched Whisper encoder forward
+
+    # Loaders build into locals and publish attributes last, so a model loading on the
+    # prefetch thread is never seen half-initialised.
+    def _load_dit(self, checkpoint_filename, config_filename):
         dit_checkpoint_path, dit_config_path = load_custom_model_from_hf(
-            "Plachta/Seed-VC",
-            "DiT_seed_v2_uvit_whisper_small_wavenet_bigvgan_pruned.pth",
-            "config_dit_mel_seed_uvit_whisper_small_wavenet.yml"
+            "Plachta/Seed-VC", checkpoint_filename, config_filename
         )
         config = yaml.safe_load(open(dit_config_path, 'r'))
         model_params = recursive_munch(config['model_params'])
-        self.model = build_model(model_params, stage='DiT')
-        self.hop_length = config['preprocess_params']['spect_params']['hop_length']
-        self.sr = config['preprocess_params']['sr']
-        
+        model = build_model(model_params, stage='DiT')
+
         # Load checkpoints
-        self.model, _, _, _ = load_checkpoint(
-            self.model, None, dit_checkpoint_path,
+        model, _, _, _ = load_checkpoint(
+            model, None, dit_checkpoint_path,
             load_only_params=True, ignore_modules=[], is_distributed=False
         )
-        for key in self.model:
-            self.model[key].eval()
-            self.model[key].to(self.device)
-        self.model.cfm.estimator.setup_caches(max_batch_size=1, max_seq_length=8192)
-        
+        for key in model:
+            model[key].eval()
+            model[key].to(self.device)
+        model.cfm.estimator.setup_caches(max_batch_size=1, max_seq_length=8192)
+
         # Set up mel spectrogram function
         mel_fn_args = {
             "n_fft": config['preprocess_params']['spect_params']['n_fft'],
             "win_size": config['preprocess_params']['spect_params']['win_length'],
             "hop_size": config['preprocess_params']['spect_params']['hop_length'],
             "num_mels": config['preprocess_params']['spect_params']['n_mels'],
-            "sampling_rate": self.sr,
+            "sampling_rate": config['preprocess_params']['sr'],
             "fmin": 0,
             "fmax": None,
             "center": False
         }
-        self.to_mel = lambda x: mel_spectrogram(x, **mel_fn_args)
-        
-        # Load whisper model
+        return model, lambda x: mel_spectrogram(x, **mel_fn_args)
+
+    def _shared(self, cls, checkpoint, dtype, loader):
+        """loader() through the model registry, so wrappers in one process share the weights."""
+        if self.registry is None:
+            return loader()
+        key = model_key(cls, checkpoint, dtype, self._device_key)
+        model = self.registry.acquire(key, loader)
+        self._shared_keys.append(key)
+        return model
+
+    def close(self):
+        """Give shared models back to the registry; the wrapper must not be used afterwards."""
+        for key in self._shared_keys:
+            self.registry.release(key)
+        self._shared_keys = []
+
+    def _load_base_model(self):
+        """Load the base DiT model for voice conversion."""
+        self.model, self.to_mel = self._shared(
+            "modules.commons.build_model", BASE_DIT_CHECKPOINT, torch.float32,
+            partial(self._load_dit, BASE_DIT_CHECKPOINT, BASE_DIT_CONFIG),
+        )
+
+    def _load_f0_model(self):
+        """Load the F0 conditioned model for voice conversion."""
+        self.model_f0, self.to_mel_f0 = self._shared(
+            "modules.commons.build_model", F0_DIT_CHECKPOINT, torch.float32,
+            partial(self._load_dit, F0_DIT_CHECKPOINT, F0_DIT_CONFIG),
+        )
+
+    def _build_whisper(self, local_whisper_path):
+        whisper_model = WhisperModel.from_pretrained(local_whisper_path, torch_dtype=torch.float16).to(self.device)
+        del whisper_model.decoder
+        return whisper_model
+
+    def _load_whisper(self):
+        """Load the Whisper encoder named by the base model's config; both models use it."""
+        _, dit_config_path = load_custom_model_from_hf("Plachta/Seed-VC", BASE_DIT_CHECKPOINT, BASE_DIT_CONFIG)
+        model_params = recursive_munch(yaml.safe_load(open(dit_config_path, 'r'))['model_params'])
         whisper_name = model_params.speech_tokenizer.whisper_name if hasattr(model_params.speech_tokenizer, 'whisper_name') else "openai/whisper-small"
         # Load from local directory instead of HuggingFace Hub
         local_whisper_path = os.path.join("./models", "whisper", whisper_name.split("/")[-1])
-        self.whisper_model = WhisperModel.from_pretrained(local_whisper_path, torch_dtype=torch.float16).to(self.device)
-        del self.whisper_model.decoder
         self.whisper_feature_extractor = AutoFeatureExtractor.from_pretrained(local_whisper_path)
-        
-    def _load_f0_model(self):
-        """Load the F0 conditioned model for voice conversion."""
-        dit_checkpoint_path, dit_config_path = load_custom_model_from_hf(
-            "Plachta/Seed-VC",
-            "DiT_seed_v2_uvit_whisper_base_f0_44k_bigvgan_pruned_ft_ema.pth",
-            "config_dit_mel_seed_uvit_whisper_base_f0_44k.yml"
-        )
-        config = yaml.safe_load(open(dit_config_path, 'r'))
-        model_params = recursive_munch(config['model_params'])
-        self.model_f0 = build_model(model_params, stage='DiT')
-        self.hop_length_f0 = config['preprocess_params']['spect_params']['hop_length']
-        self.sr_f0 = config['preprocess_params']['sr']
-        
-        # Load checkpoints
-        self.model_f0, _, _, _ = load_checkpoint(
-            self.model_f0, None, dit_checkpoint_path,
-            load_only_params=True, ignore_modules=[], is_distributed=False
+        self.whisper_model = self._shared(
+            WhisperModel, local_whisper_path, torch.float16, partial(self._build_whisper, local_whisper_path)
         )
-        for key in self.model_f0:
-            self.model_f0[key].eval()
-            self.model_f0[key].to(self.device)
-        self.model_f0.cfm.estimator.setup_caches(max_batch_size=1, max_seq_length=8192)
-        
-        # Set up mel spectrogram function for F0 model
-        mel_fn_args_f0 = {
-            "n_fft": config['preprocess_params']['spect_params']['n_fft'],
-            "win_size": config['preprocess_params']['spect_params']['win_length'],
-            "hop_size": config['preprocess_params']['spect_params']['hop_length'],
-            "num_mels": config['preprocess_params']['spect_params']['n_mels'],
-            "sampling_rate": self.sr_f0,
-            "fmin": 0,
-            "fmax": None,
-            "center": False
-        }
-        self.to_mel_f0 = lambda x: mel_spectrogram(x, **mel_fn_args_f0)
-        
-    def _load_additional_modules(self):
-        """Load additional modules like CAMPPlus, BigVGAN, and RMVPE."""
-        # Load CAMPPlus
+
+    def _build_campplus(self):
         campplus_ckpt_path = load_custom_model_from_hf("funasr/campplus", "campplus_cn_common.bin", config_filename=None)
-        self.campplus_model = CAMPPlus(feat_dim=80, embedding_size=192)
-        self.campplus_model.load_state_dict(torch.load(campplus_ckpt_path, map_location="cpu"))
-        self.campplus_model.eval()
-        self.campplus_model.to(self.device)
-        
-        # Load BigVGAN models
+        campplus_model = CAMPPlus(feat_dim=80, embedding_size=192)
+        campplus_model.load_state_dict(torch.load(campplus_ckpt_path, map_location="cpu"))
+        campplus_model.eval()
+        return campplus_model.to(self.device)
+
+    def _load_campplus(self):
+        # same key as the V2 wrapper's style encoder, so app.py holds a single CAMPPlus
+        self.campplus_model = self._shared(
+            CAMPPlus, "funasr/campplus/campplus_cn_common.bin", torch.float32, self._build_campplus
+        )
+
+    def _build_bigvgan(self, path):
+        bigvgan_model = bigvgan.BigVGAN.from_pretrained(path, use_cuda_kernel=False)
+        bigvgan_model.remove_weight_norm()
+        return bigvgan_model.eval().to(self.device)
+
+    def _load_bigvgan(self, name):
         # Load from local directory instead of HuggingFace Hub
-        local_bigvgan_22k_path = os.path.join("./models", "bigvgan", "v2_22khz_80band_256x")
-        self.bigvgan_model = bigvgan.BigVGAN.from_pretrained(local_bigvgan_22k_path, use_cuda_kernel=False)
-        self.bigvgan_model.remove_weight_norm()
-        self.bigvgan_model = self.bigvgan_model.eval().to(self.device)
-        
-        local_bigvgan_44k_path = os.path.join("./models", "bigvgan", "v2_44khz_128band_512x")
-        self.bigvgan_44k_model = bigvgan.BigVGAN.from_pretrained(local_bigvgan_44k_path, use_cuda_kernel=False)
-        self.bigvgan_44k_model.remove_weight_norm()
-        self.bigvgan_44k_model = self.bigvgan_44k_model.eval().to(self.device)
-        
-        # Load RMVPE for F0 extraction
+        path = os.path.join("./models", "bigvgan", name)
+        return self._shared(
+            bigvgan.BigVGAN, f"{path}#no_weight_norm", torch.float32, partial(self._build_bigvgan, path)
+        )
+
+    def _load_bigvgan_22k(self):
+        self.bigvgan_model = self._load_bigvgan("v2_22khz_80band_256x")
+
+    def _load_bigvgan_44k(self):
+        self.bigvgan_44k_model = self._load_bigvgan("v2_44khz_128band_512x")
+
+    def _build_rmvpe(self):
         model_path = load_custom_model_from_hf("lj1995/VoiceConversionWebUI", "rmvpe.pt", None)
-        self.rmvpe = RMVPE(model_path, is_half=False, device=self.device)
-        
+        return RMVPE(model_path, is_half=False, device=self.device)
+
+    def _load_rmvpe(self):
+        """Load RMVPE for F0 extraction."""
+        self.rmvpe = self._shared(RMVPE, "lj1995/VoiceConversionWebUI/rmvpe.pt", torch.float32, self._build_rmvpe)
+
     @staticmethod
     def adjust_f0_semitones(f0_sequence, n_semitones):
         """Adjust F0 values by a number of semitones."""
@@ -166,8 +216,20 @@ class SeedVCWrapper:
             chunk2[:overlap] = chunk2[:overlap] * fade_in + chunk1[-overlap:] * fade_out
         return chunk2
     
+    def _encode_stream_chunk(self, stream_encoder, wave_int16, is_last_chunk, sr):
+        """Feed one chunk to the stream's encoder and return the bytes ready so far (None if none yet)."""
+        if stream_encoder is None:
+            encoder = create_stream_encoder(self.stream_format, sr, self.bitrate, threaded=False)
+            return encoder.encode(wave_int16) + encoder.flush()
+        stream_encoder.write(wave_int16)
+        if is_last_chunk:
+            return stream_encoder.finish()
+        # wait for the first chunk so playback starts promptly; later chunks encode in the background
+        return stream_encoder.read(block=stream_encoder.bytes_emitted == 0) or None
+
     def _stream_wave_chunks(self, vc_wave, processed_frames, vc_target, overlap_wave_len, 
-                           generated_wave_chunks, previous_chunk, is_last_chunk, stream_output, sr):
+                           generated_wave_chunks, previous_chunk, is_last_chunk, stream_output, sr,
+                           stream_encoder=None):
         """
         Helper method to handle streaming wave chunks.
         
@@ -181,11 +243,12 @@ class SeedVCWrapper:
             is_last_chunk: Whether this is the last chunk
             stream_output: Whether to stream the output
             sr: Sample rate
+            stream_encoder: Persistent encoder of this stream (see modules.stream_encoders)
             
         Returns:
             Tuple of (processed_frames, previous_chunk, should_break, mp3_bytes, full_audio)
             where should_break indicates if processing should stop
-            mp3_bytes is the MP3 bytes if streaming, None otherwise
+            mp3_bytes is the encoded bytes ready so far if streaming, None otherwise
             full_audio is the full audio if this is the last chunk, None otherwise
         """
         mp3_bytes = None
@@ -198,10 +261,7 @@ class SeedVCWrapper:
                 
                 if stream_output:
                     output_wave_int16 = (output_wave * 32768.0).astype(np.int16)
-                    mp3_bytes = AudioSegment(
-                        output_wave_int16.tobytes(), frame_rate=sr,
-                        sample_width=output_wave_int16.dtype.itemsize, channels=1
-                    ).export(format="mp3", bitrate=self.bitrate).read()
+                    mp3_bytes = self._encode_stream_chunk(stream_encoder, output_wave_int16, is_last_chunk, sr)
                     full_audio = (sr, np.concatenate(generated_wave_chunks))
                 else:
                     return processed_frames, previous_chunk, True, None, np.concatenate(generated_wave_chunks)
@@ -215,10 +275,7 @@ class SeedVCWrapper:
             
             if stream_output:
                 output_wave_int16 = (output_wave * 32768.0).astype(np.int16)
-                mp3_bytes = AudioSegment(
-                    output_wave_int16.tobytes(), frame_rate=sr,
-                    sample_width=output_wave_int16.dtype.itemsize, channels=1
-                ).export(format="mp3", bitrate=self.bitrate).read()
+                mp3_bytes = self._encode_stream_chunk(stream_encoder, output_wave_int16, is_last_chunk, sr)
             
         elif is_last_chunk:
             output_wave = self.crossfade(previous_chunk.cpu().numpy(), vc_wave[0].cpu().numpy(), overlap_wave_len)
@@ -227,10 +284,7 @@ class SeedVCWrapper:
             
             if stream_output:
                 output_wave_int16 = (output_wave * 32768.0).astype(np.int16)
-                mp3_bytes = AudioSegment(
-                    output_wave_int16.tobytes(), frame_rate=sr,
-                    sample_width=output_wave_int16.dtype.itemsize, channels=1
-                ).export(format="mp3", bitrate=self.bitrate).read()
+                mp3_bytes = self._encode_stream_chunk(stream_encoder, output_wave_int16, is_last_chunk, sr)
                 full_audio = (sr, np.concatenate(generated_wave_chunks))
             else:
                 return processed_frames, previous_chunk, True, None, np.concatenate(generated_wave_chunks)
@@ -245,77 +299,46 @@ class SeedVCWrapper:
             
             if stream_output:
                 output_wave_int16 = (output_wave * 32768.0).astype(np.int16)
-                mp3_bytes = AudioSegment(
-                    output_wave_int16.tobytes(), frame_rate=sr,
-                    sample_width=output_wave_int16.dtype.itemsize, channels=1
-                ).export(format="mp3", bitrate=self.bitrate).read()
+                mp3_bytes = self._encode_stream_chunk(stream_encoder, output_wave_int16, is_last_chunk, sr)
                 
         return processed_frames, previous_chunk, False, mp3_bytes, full_audio
 
+    def _encode_whisper_windows(self, windows):
+        """Run the Whisper encoder on a batch of <= 30 s 16 kHz windows, one feature tensor per window."""
+        inputs = self.whisper_feature_extractor(
+            [window.reshape(-1).cpu().numpy() for window in windows],
+            return_tensors="pt",
+            return_attention_mask=True,
+            sampling_rate=16000
+        )
+        input_features = self.whisper_model._mask_input_features(
+            inputs.input_features, attention_mask=inputs.attention_mask
+        ).to(self.device)
+        outputs = self.whisper_model.encoder(
+            input_features.to(self.whisper_model.encoder.dtype),
+            head_mask=None,
+            output_attentions=False,
+            output_hidden_states=False,
+            return_dict=True,
+        )
+        features = outputs.last_hidden_state.to(torch.float32)
+        return [features[bib:bib + 1, :window.size(-1) // 320 + 1] for bib, window in enumerate(windows)]
+
     def _process_whisper_features(self, audio_16k, is_source=True):
         """Process audio through Whisper model to extract features."""
         if audio_16k.size(-1) <= 16000 * 30:
             # If audio is short enough, process in one go
-            inputs = self.whisper_feature_extractor(
-                [audio_16k.squeeze(0).cpu().numpy()],
-                return_tensors="pt",
-                return_attention_mask=True,
-                sampling_rate=16000
-            )
-            input_features = self.whisper_model._mask_input_features(
-                inputs.input_features, attention_mask=inputs.attention_mask
-            ).to(self.device)
-            outputs = self.whisper_model.encoder(
-                input_features.to(self.whisper_model.encoder.dtype),
-                head_mask=None,
-                output_attentions=False,
-                output_hidden_states=False,
-                return_dict=True,
-            )
-            features = outputs.last_hidden_state.to(torch.float32)
-            features = features[:, :audio_16k.size(-1) // 320 + 1]
-        else:
-            # Process long audio in chunks
-            overlapping_time = 5  # 5 seconds
-            features_list = []
-            buffer = None
-            traversed_time = 0
-            while traversed_time < audio_16k.size(-1):
-                if buffer is None:  # first chunk
-                    chunk = audio_16k[:, traversed_time:traversed_time + 16000 * 30]
-                else:
-                    chunk = torch.cat([
-                        buffer, 
-                        audio_16k[:, traversed_time:traversed_time + 16000 * (30 - overlapping_time)]
-                    ], dim=-1)
-                inputs = self.whisper_feature_extractor(
-                    [chunk.squeeze(0).cpu().numpy()],
-                    return_tensors="pt",
-                    return_attention_mask=True,
-                    sampling_rate=16000
-                )
-                input_features = self.whisper_model._mask_input_features(
-                    inputs.input_features, attention_mask=inputs.attention_mask
-                ).to(self.device)
-                outputs = self.whisper_model.encoder(
-                    input_features.to(self.whisper_model.encoder.dtype),
-                    head_mask=None,
-                    output_attentions=False,
-                    output_hidden_states=False,
-                    return_dict=True,
-                )
-                chunk_features = outputs.last_hidden_state.to(torch.float32)
-                chunk_features = chunk_features[:, :chunk.size(-1) // 320 + 1]
-                if traversed_time == 0:
-                    features_list.append(chunk_features)
-                else:
-                    features_list.append(chunk_features[:, 50 * overlapping_time:])
-                buffer = chunk[:, -16000 * overlapping_time:]
-                traversed_time += 30 * 16000 if traversed_time == 0 else chunk.size(-1) - 16000 * overlapping_time
-            features = torch.cat(features_list, dim=1)
-        
-        return features
-    
+            return self._encode_whisper_windows([audio_16k])[0]
+        # Process long audio in overlapped 30 s windows, batched under a sample budget
+        overlapping_time = 5  # 5 seconds
+        window_features = run_windowed(
+            audio_16k, self._encode_whisper_windows,
+            window_samples=16000 * 30,
+            overlap_samples=16000 * overlapping_time,
+            max_batch_samples=16000 * self.long_audio_batch_seconds,
+        )
+        return stitch_windows(window_features, 50 * overlapping_time)
+
     @torch.no_grad()
     @torch.inference_mode()
     def convert_voice(self, source, target, diffusion_steps=10, length_adjust=1.0,
@@ -339,6 +362,7 @@ class SeedVCWrapper:
             If stream_output is True, yields (mp3_bytes, full_audio) tuples
             If stream_output is False, returns the full audio as a numpy array
         """
+        self.components.ensure("svc" if f0_condition else "vc")
         # Select appropriate models based on F0 condition
         inference_module = self.model if not f0_condition else self.model_f0
         mel_fn = self.to_mel if not f0_condition else self.to_mel_f0
@@ -428,6 +452,7 @@ class SeedVCWrapper:
         processed_frames = 0
         generated_wave_chunks = []
         previous_chunk = None
+        stream_encoder = create_stream_encoder(self.stream_format, sr, self.bitrate) if stream_output else None
         
         # Generate chunk by chunk and stream the output
         while processed_frames < cond.size(1):
@@ -449,7 +474,7 @@ class SeedVCWrapper:
             
             processed_frames, previous_chunk, should_break, mp3_bytes, full_audio = self._stream_wave_chunks(
                 vc_wave, processed_frames, vc_target, overlap_wave_len, 
-                generated_wave_chunks, previous_chunk, is_last_chunk, stream_output, sr
+                generated_wave_chunks, previous_chunk, is_last_chunk, stream_output, sr, stream_encoder
             )
             
             if stream_output and mp3_bytes is not None:
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import struct
+from typing import List, Sequence
+
+import numpy as np
+
+try:
+    import opuslib
+except ImportError:  # optional dependency, only needed for codec=opus
+    opuslib = None
+
+# Transport codecs of the /ws/convert stream. A codec turns one client payload into
+# float32 samples and converted float32 samples back into one payload. PCM payloads are
+# raw little-endian int16; Opus payloads are a sequence of packets, each prefixed with
+# its length as a little-endian uint16, so one websocket message can carry any number
+# of fixed-duration Opus frames.
+
+CODEC_PCM = "pcm"
+CODEC_OPUS = "opus"
+CODECS = (CODEC_PCM, CODEC_OPUS)
+
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+OPUS_FRAME_MS = (10, 20, 40, 60)
+
+_PACKET_LEN = struct.Struct("<H")
+
+
+class CodecUnavailable(RuntimeError):
+    """Raised when a codec's optional dependency is not installed."""
+
+
+class CodecError(ValueError):
+    """Raised when a client payload cannot be decoded."""
+
+
+def opus_sample_rate(sample_rate: int) -> int:
+    """Smallest Opus-supported rate that does not lose bandwidth relative to sample_rate."""
+    for rate in OPUS_SAMPLE_RATES:
+        if rate >= sample_rate:
+            return rate
+    return OPUS_SAMPLE_RATES[-1]
+
+
+def pack_packets(packets: Sequence[bytes]) -> bytes:
+    return b"".join(_PACKET_LEN.pack(len(packet)) + packet for packet in packets)
+
+
+def unpack_packets(data: bytes) -> List[bytes]:
+    packets, offset = [], 0
+    while offset < len(data):
+        if offset + _PACKET_LEN.size > len(data):
+            raise CodecError("truncated packet length")
+        (length,) = _PACKET_LEN.unpack_from(data, offset)
+        offset += _PACKET_LEN.size
+        if offset + length > len(data):
+            raise CodecError("truncated packet")
+        packets.append(bytes(data[offset:offset + length]))
+        offset += length
+    return packets
+
+
+class PCMCodec:
+    """Raw int16 PCM at the negotiated rates (the original wire format)."""
+
+    name = CODEC_PCM
+
+    def __init__(self, input_rate: int, output_rate: int) -> None:
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        self.frame_size = 1
+
+    @property
+    def input_bytes_per_second(self) -> float:
+        return 2.0 * self.input_rate
+
+    def decode(self, data: bytes) -> np.ndarray:
+        if len(data) % 2:
+            raise CodecError("pcm payload is not a whole number of int16 samples")
+        return np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+
+    def encode(self, wave: np.ndarray) -> bytes:
+        wave = np.clip(wave, -1.0, 1.0)
+        return (wave * 32767.0).astype(np.int16).tobytes()
+
+    def flush(self) -> bytes:
+        return b""
+
+    def sample_count(self, payload: bytes) -> int:
+        return len(payload) // 2
+
+
+class OpusCodec:
+    """
+    Mono Opus with one decoder and one encoder per session.
+
+    Output is cut into frames of `frame_ms`; samples that do not fill a whole frame are
+    kept for the next call and zero-padded by `flush`, so packet boundaries stay aligned
+    with the stream rather than with conversion chunks.
+    """
+
+    name = CODEC_OPUS
+
+    def __init__(self, input_rate: int, output_rate: int, frame_ms: int = 20, bitrate: int = 32000) -> None:
+        if opuslib is None:
+            raise CodecUnavailable("codec=opus requires the optional 'opuslib' package (and libopus)")
+        if frame_ms not in OPUS_FRAME_MS:
+            raise ValueError(f"opus_frame_ms must be one of {OPUS_FRAME_MS}")
+        self.input_rate = opus_sample_rate(input_rate)
+        self.output_rate = opus_sample_rate(output_rate)
+        self.frame_ms = frame_ms
+        self.bitrate = bitrate
+        self.frame_size = self.output_rate * frame_ms // 1000
+        self.max_decode_frame = self.input_rate * 120 // 1000  # longest Opus packet is 120 ms
+        self.decoder = opuslib.Decoder(self.input_rate, 1)
+        self.encoder = opuslib.Encoder(self.output_rate, 1, opuslib.APPLICATION_AUDIO)
+        self.encoder.bitrate = bitrate
+        self.pending = np.zeros(0, dtype=np.int16)
+
+    @property
+    def input_bytes_per_second(self) -> float:
+        return self.bitrate / 8.0
+
+    def decode(self, data: bytes) -> np.ndarray:
+        try:
+            pcm = [self.decoder.decode(packet, self.max_decode_frame) for packet in unpack_packets(data)]
+        except opuslib.OpusError as e:
+            raise CodecError(f"invalid opus packet: {e}") from e
+        if not pcm:
+            return np.zeros(0, dtype=np.float32)
+        return np.frombuffer(b"".join(pcm), dtype=np.int16).astype(np.float32) / 32768.0
+
+    def _encode_frames(self) -> bytes:
+        n_frames = self.pending.size // self.frame_size
+        packets = [
+            self.encoder.encode(self.pending[i * self.frame_size:(i + 1) * self.frame_size].tobytes(), self.frame_size)
+            for i in range(n_frames)
+        ]
+        self.pending = self.pending[n_frames * self.frame_size:]
+        return pack_packets(packets)
+
+    def encode(self, wave: np.ndarray) -> bytes:
+        wave = (np.clip(wave, -1.0, 1.0) * 32767.0).astype(np.int16)
+        self.pending = np.concatenate([self.pending, wave])
+        return self._encode_frames()
+
+    def flush(self) -> bytes:
+        if self.pending.size == 0:
+            return b""
+        pad = -self.pending.size % self.frame_size
+        self.pending = np.concatenate([self.pending, np.zeros(pad, dtype=np.int16)])
+        return self._encode_frames()
+
+    def sample_count(self, payload: bytes) -> int:
+        return len(unpack_packets(payload)) * self.frame_size
+
+
+def create_codec(name: str, input_rate: int, output_rate: int, frame_ms: int = 20, bitrate: int = 32000):
+    if name == CODEC_PCM:
+        return PCMCodec(input_rate, output_rate)
+    if name == CODEC_OPUS:
+        return OpusCodec(input_rate, output_rate, frame_ms=frame_ms, bitrate=bitrate)
+    raise ValueError(f"codec must be one of {', '.join(CODECS)}")
+
+
+__all__ = [
+    "CODECS",
+    "CODEC_OPUS",
+    "CODEC_PCM",
+    "CodecError",
+    "CodecUnavailable",
+    "OpusCodec",
+    "PCMCodec",
+    "create_codec",
+    "opus_sample_rate",
+    "pack_packets",
+    "unpack_packets",
+]
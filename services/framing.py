@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import struct
+from dataclasses import dataclass
+from typing import Tuple
+
+# Binary frames of the /ws/convert stream when the client connects with protocol=framed.
+#
+# Every websocket binary message is one frame: a little-endian header followed by the
+# audio payload.
+#
+#   offset size field
+#   0      4    magic b"SVCF"
+#   4      1    version
+#   5      1    flags
+#   6      2    header size in bytes (payload starts here; later versions may append fields)
+#   8      4    sequence number
+#   12     8    capture timestamp in microseconds (client clock, echoed back untouched)
+#   20     4    sample count of the payload
+#   24     4    processing time in microseconds (0 on input; server receive -> send on output)
+#
+# Output frames echo the sequence number and capture timestamp of the input frame that
+# completed them, so clients can measure end-to-end latency and run a jitter buffer.
+
+MAGIC = b"SVCF"
+VERSION = 1
+_HEADER = struct.Struct("<4sBBHIQII")
+HEADER_SIZE = _HEADER.size
+
+FLAG_END_OF_STREAM = 0x01  # input: flush the session after this frame; output: last frame of a flush
+FLAG_DISCONTINUITY = 0x02  # output: input audio was dropped before this frame
+
+PROTOCOL_RAW = "raw"
+PROTOCOL_FRAMED = "framed"
+PROTOCOLS = (PROTOCOL_RAW, PROTOCOL_FRAMED)
+
+
+class FrameError(ValueError):
+    """Raised for binary messages that are not valid frames."""
+
+
+@dataclass
+class FrameHeader:
+    seq: int
+    timestamp_us: int = 0
+    sample_count: int = 0
+    flags: int = 0
+    processing_us: int = 0
+    version: int = VERSION
+
+    @property
+    def end_of_stream(self) -> bool:
+        return bool(self.flags & FLAG_END_OF_STREAM)
+
+
+def encode_frame(header: FrameHeader, payload: bytes) -> bytes:
+    return _HEADER.pack(
+        MAGIC,
+        VERSION,
+        header.flags & 0xFF,
+        HEADER_SIZE,
+        header.seq & 0xFFFFFFFF,
+        header.timestamp_us & 0xFFFFFFFFFFFFFFFF,
+        header.sample_count & 0xFFFFFFFF,
+        min(max(int(header.processing_us), 0), 0xFFFFFFFF),
+    ) + payload
+
+
+def decode_frame(data: bytes) -> Tuple[FrameHeader, bytes]:
+    if len(data) < HEADER_SIZE or data[:4] != MAGIC:
+        raise FrameError("not a framed message")
+    _, version, flags, header_size, seq, timestamp_us, sample_count, processing_us = _HEADER.unpack_from(data)
+    if version > VERSION:
+        raise FrameError(f"unsupported frame version {version}")
+    if header_size < HEADER_SIZE or header_size > len(data):
+        raise FrameError(f"invalid header size {header_size}")
+    header = FrameHeader(
+        seq=seq,
+        timestamp_us=timestamp_us,
+        sample_count=sample_count,
+        flags=flags,
+        processing_us=processing_us,
+        version=version,
+    )
+    return header, bytes(data[header_size:])
+
+
+__all__ = [
+    "FLAG_DISCONTINUITY",
+    "FLAG_END_OF_STREAM",
+    "FrameError",
+    "FrameHeader",
+    "HEADER_SIZE",
+    "MAGIC",
+    "PROTOCOLS",
+    "PROTOCOL_FRAMED",
+    "PROTOCOL_RAW",
+    "VERSION",
+    "decode_frame",
+    "encode_frame",
+]
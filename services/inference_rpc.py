@@ -0,0 +1,531 @@
+from __future__ import annotations
+
+import dataclasses
+import json
+import mmap
+import os
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from functools import partial
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from services.audio_codec import CODEC_OPUS, CodecError, CodecUnavailable, unpack_packets
+from services.metrics import ServiceMetrics
+from services.vc_service import ConversionConfig
+from services.voice_library import VoiceProfile
+
+# Inference worker processes behind a local RPC. The web tier (svc_backend) keeps the
+# websocket handling and talks to one or more processes that own a VCService
+# (inference_server.py) over Unix sockets, so websocket I/O and inference no longer share
+# an interpreter and one web tier can front several inference workers.
+#
+# Every session is one socket connection. Messages are a little-endian (json length,
+# inline length) header, a JSON object and optional inline bytes. Audio does not go
+# through the socket: each session maps two shared buffers (tmpfs files, /dev/shm on
+# Linux), the client writes the input payload into one and the worker decodes it in place
+# with np.frombuffer, and the worker writes its encoded output into the other. Only
+# payloads larger than a buffer fall back to inline bytes.
+
+_HEADER = struct.Struct("<II")
+DEFAULT_SLAB_BYTES = 1 << 20
+ENV_SOCKETS = "SEED_VC_INFERENCE_SOCKETS"
+ENV_WORKERS = "SEED_VC_INFERENCE_WORKERS"
+# a worker whose connection failed gets no new sessions for this long
+DOWN_SECONDS = 10.0
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "inference_server.py")
+
+_ERRORS = {
+    "KeyError": KeyError,
+    "ValueError": ValueError,
+    "CodecError": CodecError,
+    "CodecUnavailable": CodecUnavailable,
+}
+
+
+class RemoteError(RuntimeError):
+    """An inference worker failed a request."""
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytearray:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            raise ConnectionError("inference connection closed")
+        received += n
+    return buffer
+
+
+def send_message(sock: socket.socket, message: dict, payload: bytes = b"") -> None:
+    data = json.dumps(message).encode()
+    sock.sendall(_HEADER.pack(len(data), len(payload)) + data + payload)
+
+
+def recv_message(sock: socket.socket) -> Tuple[dict, bytes]:
+    json_len, payload_len = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    message = json.loads(_recv_exact(sock, json_len))
+    payload = bytes(_recv_exact(sock, payload_len)) if payload_len else b""
+    return message, payload
+
+
+def _shm_dir() -> str:
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+class Slab:
+    """A file-backed buffer mapped by both the web tier and an inference worker."""
+
+    def __init__(self, path: str, size: int, create: bool = False) -> None:
+        flags = os.O_RDWR | (os.O_CREAT | os.O_EXCL if create else 0)
+        fd = os.open(path, flags, 0o600)
+        try:
+            if create:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.path = path
+        self.size = size
+        self.view = memoryview(self.map)
+
+    @classmethod
+    def create(cls, size: int = DEFAULT_SLAB_BYTES) -> "Slab":
+        return cls(os.path.join(_shm_dir(), f"seed-vc-{uuid.uuid4().hex}"), size, create=True)
+
+    def unlink(self) -> None:
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def write_chunks(self, chunks: Sequence[bytes]) -> Tuple[List[int], bytes]:
+        """Copy `chunks` into the slab; returns their sizes and the inline bytes if they do not fit."""
+        sizes = [len(chunk) for chunk in chunks]
+        if sum(sizes) > self.size:
+            return sizes, b"".join(chunks)
+        offset = 0
+        for chunk, size in zip(chunks, sizes):
+            self.view[offset:offset + size] = chunk
+            offset += size
+        return sizes, b""
+
+    def read_chunks(self, sizes: Sequence[int], inline: bytes = b"") -> List[bytes]:
+        source = memoryview(inline) if inline else self.view
+        chunks, offset = [], 0
+        for size in sizes:
+            chunks.append(bytes(source[offset:offset + size]))
+            offset += size
+        return chunks
+
+    def close(self) -> None:
+        self.view.release()
+        self.map.close()
+
+
+def _error_reply(error: BaseException) -> dict:
+    return {"error": str(error), "type": type(error).__name__}
+
+
+def _raise_for_error(message: dict) -> dict:
+    if "error" in message:
+        raise _ERRORS.get(message["type"], RemoteError)(message["error"])
+    return message
+
+
+class InferenceServer(socketserver.ThreadingUnixStreamServer):
+    """Serves a VCService on a Unix socket; each connection is one session or one query."""
+
+    daemon_threads = True
+
+    def __init__(self, service, path: str) -> None:
+        self.service = service
+        self.active_sessions = 0
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            os.unlink(path)  # stale socket of an earlier run
+        super().__init__(path, _ConnectionHandler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+    def query(self, message: dict) -> Tuple[dict, bytes]:
+        op = message.get("op")
+        if op == "status":
+            return {"pid": os.getpid(), "active_sessions": self.active_sessions}, b""
+        if op == "voices":
+            voices = [dataclasses.asdict(voice) for voice in self.service.list_voices()]
+            return {"voices": voices}, b""
+        if op == "metrics":
+            return {}, self.service.metrics.render().encode()
+        raise ValueError(f"unknown op {op!r}")
+
+    def run_session(self, sock: socket.socket, message: dict) -> None:
+        slabs = []
+        try:
+            for key in ("input", "output"):
+                slabs.append(Slab(message[key], message["slab_bytes"]))
+            session = self.service.create_session(
+                voice_id=message["voice_id"],
+                source_sample_rate=message["source_sample_rate"],
+                overrides=message.get("overrides"),
+            )
+        except Exception as e:
+            for slab in slabs:
+                slab.close()
+            send_message(sock, _error_reply(e))
+            return
+        slab_in, slab_out = slabs
+        op = None
+        with self._lock:
+            self.active_sessions += 1
+        try:
+            send_message(sock, {
+                "session_id": session.session_id,
+                "input_rate": session.input_rate,
+                "output_rate": session.output_rate,
+                "codec": session.codec.name,
+                "frame_size": session.codec.frame_size,
+                "input_bytes_per_second": session.codec.input_bytes_per_second,
+                "config": dataclasses.asdict(session.config),
+            })
+            while True:
+                try:
+                    message, payload = recv_message(sock)
+                except ConnectionError:
+                    break
+                op = message.get("op")
+                if op == "close":
+                    session.close()
+                    send_message(sock, {})
+                    return
+                try:
+                    if op == "process":
+                        if payload:
+                            chunks = session.process_audio(payload)
+                        else:
+                            view = slab_in.view[:message["size"]]
+                            try:
+                                chunks = session.process_audio(view)
+                            finally:
+                                view.release()
+                    elif op == "flush":
+                        chunks = session.flush()
+                    else:
+                        raise ValueError(f"unknown op {op!r}")
+                except Exception as e:
+                    send_message(sock, _error_reply(e))
+                    continue
+                sizes, inline = slab_out.write_chunks(chunks)
+                send_message(sock, {"sizes": sizes, "events": session.pop_events()}, inline)
+        finally:
+            if op != "close":
+                session.close()  # the client went away without closing
+            slab_in.close()
+            slab_out.close()
+            with self._lock:
+                self.active_sessions -= 1
+
+
+class _ConnectionHandler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        try:
+            message, _ = recv_message(self.request)
+        except ConnectionError:
+            return
+        if message.get("op") == "open":
+            self.server.run_session(self.request, message)
+            return
+        try:
+            reply, payload = self.server.query(message)
+        except Exception as e:
+            reply, payload = _error_reply(e), b""
+        send_message(self.request, reply, payload)
+
+
+def _connect(path: str, timeout: Optional[float] = None) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def query(path: str, op: str, timeout: Optional[float] = 10.0) -> Tuple[dict, bytes]:
+    with _connect(path, timeout) as sock:
+        send_message(sock, {"op": op})
+        message, payload = recv_message(sock)
+    return _raise_for_error(message), payload
+
+
+class _CodecInfo:
+    """Web-tier view of a session codec: rates and payload sizes, no encoder or decoder."""
+
+    def __init__(self, name: str, frame_size: int, input_bytes_per_second: float) -> None:
+        self.name = name
+        self.frame_size = frame_size
+        self.input_bytes_per_second = input_bytes_per_second
+
+    def sample_count(self, payload: bytes) -> int:
+        if self.name == CODEC_OPUS:
+            return len(unpack_packets(payload)) * self.frame_size
+        return len(payload) // 2
+
+
+class RemoteSession:
+    """Stand-in for ConversionSession in the web tier; conversion runs in an inference worker."""
+
+    def __init__(
+        self,
+        path: str,
+        voice_id: str,
+        source_sample_rate: int,
+        overrides: Optional[Dict[str, float]] = None,
+        metrics: Optional[ServiceMetrics] = None,
+        slab_bytes: int = DEFAULT_SLAB_BYTES,
+        on_close: Optional[Callable[[], None]] = None,
+        on_failure: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.path = path
+        self.on_close = on_close
+        self.on_failure = on_failure
+        self.metrics = metrics if metrics is not None else ServiceMetrics()
+        self.events: List[dict] = []
+        self.slab_in = Slab.create(slab_bytes)
+        self.slab_out = Slab.create(slab_bytes)
+        self.sock = None
+        try:
+            self.sock = _connect(path)
+            send_message(self.sock, {
+                "op": "open",
+                "voice_id": voice_id,
+                "source_sample_rate": source_sample_rate,
+                "overrides": overrides,
+                "input": self.slab_in.path,
+                "output": self.slab_out.path,
+                "slab_bytes": slab_bytes,
+            })
+            reply = _raise_for_error(recv_message(self.sock)[0])
+        except BaseException:
+            self._release()
+            raise
+        finally:
+            # the worker has mapped the buffers (or failed); nothing else needs their names
+            self.slab_in.unlink()
+            self.slab_out.unlink()
+        self.session_id = reply["session_id"]
+        self.input_rate = reply["input_rate"]
+        self.output_rate = reply["output_rate"]
+        self.config = ConversionConfig(**reply["config"])
+        self.codec = _CodecInfo(reply["codec"], reply["frame_size"], reply["input_bytes_per_second"])
+
+    def _call(self, message: dict, payload: bytes = b"") -> List[bytes]:
+        try:
+            send_message(self.sock, message, payload)
+            reply, inline = recv_message(self.sock)
+        except OSError:
+            # the worker died or hung up; the session is lost
+            if self.on_failure is not None:
+                self.on_failure()
+            raise
+        _raise_for_error(reply)
+        self.events.extend(reply["events"])
+        return self.slab_out.read_chunks(reply["sizes"], inline)
+
+    def process_audio(self, audio_bytes: bytes) -> List[bytes]:
+        if not audio_bytes:
+            return []
+        if len(audio_bytes) > self.slab_in.size:
+            return self._call({"op": "process"}, audio_bytes)
+        self.slab_in.view[:len(audio_bytes)] = audio_bytes
+        return self._call({"op": "process", "size": len(audio_bytes)})
+
+    def flush(self) -> List[bytes]:
+        return self._call({"op": "flush"})
+
+    def pop_events(self) -> List[dict]:
+        events, self.events = self.events, []
+        return events
+
+    def _release(self) -> None:
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        self.slab_in.close()
+        self.slab_out.close()
+
+    def close(self) -> None:
+        if self.sock is None:
+            return
+        try:
+            send_message(self.sock, {"op": "close"})
+            recv_message(self.sock)
+        except OSError:
+            pass  # the worker is gone already
+        self._release()
+        if self.on_close is not None:
+            self.on_close()
+
+
+class RemoteService:
+    """
+    Web-tier stand-in for VCService that forwards sessions to inference workers.
+
+    Each session goes to the worker with the fewest sessions opened by this process.
+    Workers are either started here (`spawn`) or run separately and found by socket path.
+    A worker that cannot be reached, or drops a session, is marked down for DOWN_SECONDS
+    and new sessions go to the other workers meanwhile.
+    """
+
+    def __init__(
+        self,
+        paths: Sequence[str],
+        processes: Sequence[subprocess.Popen] = (),
+        metrics: Optional[ServiceMetrics] = None,
+    ) -> None:
+        if not paths:
+            raise ValueError("RemoteService needs at least one inference worker socket")
+        self.paths = list(paths)
+        self.processes = list(processes)
+        self._owner = os.getpid()  # forked web workers must not stop the inference workers
+        self.metrics = metrics if metrics is not None else ServiceMetrics()
+        self.active = [0] * len(self.paths)
+        self.down_until = [0.0] * len(self.paths)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def spawn(
+        cls,
+        workers: int,
+        socket_dir: Optional[str] = None,
+        args: Sequence[str] = (),
+        metrics: Optional[ServiceMetrics] = None,
+    ) -> "RemoteService":
+        """Start `workers` inference_server.py processes with sockets in `socket_dir`."""
+        socket_dir = socket_dir or tempfile.mkdtemp(prefix="seed-vc-")
+        paths, processes = [], []
+        for index in range(workers):
+            path = os.path.join(socket_dir, f"inference-{index}.sock")
+            processes.append(subprocess.Popen([sys.executable, SERVER_SCRIPT, "--socket", path, *args]))
+            paths.append(path)
+        return cls(paths, processes, metrics=metrics)
+
+    @classmethod
+    def from_env(cls, metrics: Optional[ServiceMetrics] = None) -> Optional["RemoteService"]:
+        """SEED_VC_INFERENCE_SOCKETS (comma separated paths) or SEED_VC_INFERENCE_WORKERS (count to spawn)."""
+        paths = [path.strip() for path in os.environ.get(ENV_SOCKETS, "").split(",") if path.strip()]
+        if paths:
+            return cls(paths, metrics=metrics)
+        workers = int(os.environ.get(ENV_WORKERS, "0"))
+        if workers > 0:
+            return cls.spawn(workers, metrics=metrics)
+        return None
+
+    def wait_ready(self, timeout: float = 600.0, poll: float = 0.5) -> None:
+        """Block until every worker answers; workers listen only once their models are loaded and warm."""
+        deadline = time.monotonic() + timeout
+        pending = list(range(len(self.paths)))
+        while pending:
+            for index in list(pending):
+                process = self.processes[index] if index < len(self.processes) else None
+                if process is not None and process.poll() is not None:
+                    raise RuntimeError(f"inference worker {index} exited with status {process.returncode}")
+                try:
+                    query(self.paths[index], "status", timeout=poll)
+                    pending.remove(index)
+                except OSError:
+                    pass
+            if pending:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"inference workers {pending} did not start within {timeout:.0f}s")
+                time.sleep(poll)
+
+    def list_voices(self) -> List[VoiceProfile]:
+        message, _ = query(self.paths[0], "voices")
+        return [VoiceProfile(**voice) for voice in message["voices"]]
+
+    def worker_metrics(self, index: int) -> str:
+        return query(self.paths[index], "metrics")[1].decode()
+
+    def create_session(
+        self,
+        voice_id: str,
+        source_sample_rate: int,
+        overrides: Optional[Dict[str, float]] = None,
+        metrics: Optional[ServiceMetrics] = None,
+    ) -> RemoteSession:
+        tried = set()
+        while True:
+            with self._lock:
+                index = self._pick_worker(tried)
+                self.active[index] += 1
+            try:
+                return RemoteSession(
+                    self.paths[index], voice_id, source_sample_rate, overrides,
+                    metrics=metrics if metrics is not None else self.metrics,
+                    on_close=partial(self._session_closed, index),
+                    on_failure=partial(self.mark_down, index),
+                )
+            except OSError:
+                self._session_closed(index)
+                self.mark_down(index)
+                tried.add(index)
+                if len(tried) == len(self.paths):
+                    raise
+            except BaseException:
+                self._session_closed(index)
+                raise
+
+    def _pick_worker(self, exclude) -> int:
+        """Least-loaded worker not in `exclude`, preferring workers that are not marked down."""
+        now = time.monotonic()
+        candidates = [index for index in range(len(self.paths)) if index not in exclude]
+        up = [index for index in candidates if self.down_until[index] <= now]
+        return min(up or candidates, key=self.active.__getitem__)
+
+    def mark_down(self, index: int) -> None:
+        with self._lock:
+            self.down_until[index] = time.monotonic() + DOWN_SECONDS
+
+    def _session_closed(self, index: int) -> None:
+        with self._lock:
+            self.active[index] -= 1
+
+    def prepare_fork(self) -> int:
+        return 0  # no weights in this process
+
+    def close(self) -> None:
+        if os.getpid() != self._owner:
+            return
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+__all__ = [
+    "InferenceServer",
+    "RemoteError",
+    "RemoteService",
+    "RemoteSession",
+    "Slab",
+    "query",
+    "recv_message",
+    "send_message",
+]
@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import torch
+
+from modules.profiling import DEFAULT_BUCKETS_MS, Profiler
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class _Metric:
+    """Base of the minimal Prometheus text-format (0.0.4) metric types below."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def remove(self, **labels) -> None:
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+    def render(self, const_labels: Optional[Dict[str, str]] = None) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(dict(const_labels or {}, **labels))} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            index = len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    index = i
+                    break
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def load(self, counts: Sequence[int], total: float, count: int, **labels) -> None:
+        """Replace the state of one label set with per-bucket (non-cumulative) counts."""
+        if len(counts) != len(self.buckets) + 1:
+            raise ValueError(f"{self.name} expects {len(self.buckets) + 1} bucket counts")
+        with self._lock:
+            self._values[self._key(labels)] = [list(counts), float(total), int(count)]
+
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, total, count) in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", dict(labels, le=_format_value(bound)), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+    def render(self, const_labels: Optional[Dict[str, str]] = None) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            formatted = _format_labels(dict(const_labels or {}, **labels))
+            if "le" in labels or name.endswith("_count"):
+                lines.append(f"{name}{formatted} {int(value)}")
+            else:
+                lines.append(f"{name}{formatted} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds metrics and renders them in the Prometheus text exposition format. `const_labels`
+    are added to every sample, e.g. the worker index of a pre-forked worker.
+    """
+
+    def __init__(self, const_labels: Optional[Dict[str, str]] = None) -> None:
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+        self.const_labels: Dict[str, str] = dict(const_labels or {})
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Register a callable run before every render, used to refresh scrape-time values."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render(self.const_labels))
+        return "\n".join(lines) + "\n"
+
+
+class ServiceMetrics:
+    """Metrics of the conversion backend: sessions, queueing, latency, throughput and GPU memory."""
+
+    def __init__(self, profiler: Optional[Profiler] = None, device: Optional[torch.device] = None) -> None:
+        self.profiler = profiler
+        self.device = device
+        registry = self.registry = MetricsRegistry()
+        self.active_sessions = registry.gauge("seedvc_active_sessions", "Open websocket conversion sessions.")
+        self.sessions = registry.counter("seedvc_sessions_total", "Websocket conversion sessions started.")
+        self.queue_depth = registry.gauge(
+            "seedvc_queue_depth", "Client messages received but not yet processed, over all sessions."
+        )
+        self.queued_audio = registry.gauge(
+            "seedvc_queued_audio_seconds", "Audio received but not yet processed, over all sessions."
+        )
+        self.dropped = registry.counter(
+            "seedvc_dropped_messages_total", "Audio messages dropped because a session queue was full."
+        )
+        self.vad_skipped = registry.counter(
+            "seedvc_vad_skipped_chunks_total", "Chunks without speech that were answered with silence."
+        )
+        self.vad_skipped_seconds = registry.counter(
+            "seedvc_vad_skipped_audio_seconds_total", "Audio time not converted because the VAD found no speech."
+        )
+        self.bytes_received = registry.counter("seedvc_bytes_received_total", "Audio payload bytes received.")
+        self.bytes_sent = registry.counter("seedvc_bytes_sent_total", "Audio payload bytes sent.")
+        self.chunk_latency = registry.histogram(
+            "seedvc_chunk_latency_seconds", "Wall time to convert one chunk of audio."
+        )
+        self.frame_latency = registry.histogram(
+            "seedvc_frame_latency_seconds",
+            "Server time from receiving an input frame to sending the output it completed (framed protocol).",
+        )
+        self.session_rtf = registry.gauge(
+            "seedvc_session_rtf", "Real-time factor of the last converted chunk (processing time / audio time).",
+            ("session",),
+        )
+        self.stage_latency = registry.histogram(
+            "seedvc_stage_latency_seconds", "Pipeline stage latency from the profiler (only when profiling is enabled).",
+            ("stage",),
+            buckets=[bound / 1000.0 for bound in DEFAULT_BUCKETS_MS],
+        )
+        self.gpu_allocated = registry.gauge(
+            "seedvc_gpu_memory_allocated_bytes", "CUDA memory occupied by tensors.", ("device",)
+        )
+        self.gpu_reserved = registry.gauge(
+            "seedvc_gpu_memory_reserved_bytes", "CUDA memory reserved by the caching allocator.", ("device",)
+        )
+        self.gpu_peak = registry.gauge(
+            "seedvc_gpu_memory_peak_bytes", "Peak CUDA memory occupied by tensors.", ("device",)
+        )
+        self.ready = registry.gauge("seedvc_ready", "1 once models are loaded and warmup has finished.")
+        self.warmup_seconds = registry.gauge("seedvc_warmup_seconds", "Wall time of the startup warmup.")
+        for metric in (self.active_sessions, self.queue_depth, self.queued_audio, self.ready):
+            metric.set(0)
+        for metric in (
+            self.sessions, self.dropped, self.vad_skipped, self.vad_skipped_seconds, self.bytes_received, self.bytes_sent
+        ):
+            metric.inc(0)
+        registry.add_collector(self._collect_stages)
+        registry.add_collector(self._collect_gpu)
+
+    def observe_chunk(self, session_id: str, seconds: float, audio_seconds: float, bytes_out: int) -> None:
+        self.chunk_latency.observe(seconds)
+        if audio_seconds > 0:
+            self.session_rtf.set(seconds / audio_seconds, session=session_id)
+        self.bytes_sent.inc(bytes_out)
+
+    def session_closed(self, session_id: str) -> None:
+        self.session_rtf.remove(session=session_id)
+
+    def _collect_stages(self) -> None:
+        if self.profiler is None or not self.profiler.enabled:
+            return
+        self.profiler.summary()  # resolves pending CUDA events
+        for stage, histogram in list(self.profiler.histograms.items()):
+            # profiler histograms use the same bounds in milliseconds
+            self.stage_latency.load(histogram.counts, histogram.sum / 1000.0, histogram.count, stage=stage)
+
+    def _collect_gpu(self) -> None:
+        if self.device is None or self.device.type != "cuda" or not torch.cuda.is_available():
+            return
+        label = str(self.device)
+        self.gpu_allocated.set(torch.cuda.memory_allocated(self.device), device=label)
+        self.gpu_reserved.set(torch.cuda.memory_reserved(self.device), device=label)
+        self.gpu_peak.set(torch.cuda.max_memory_allocated(self.device), device=label)
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+__all__ = [
+    "CONTENT_TYPE",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "MetricsRegistry",
+    "ServiceMetrics",
+]
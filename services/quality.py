@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Union
+
+# Adaptive quality for real-time conversion. The controller watches how long each block
+# takes against the block deadline and walks a ladder of settings: level 0 is the
+# configured quality, higher levels are cheaper. It steps down (cheaper) when processing
+# stays close to the deadline and steps back up after a run of blocks with headroom.
+
+CfgRate = Union[float, Sequence[float]]
+
+
+def _disable_cfg(rate: CfgRate, keep_similarity: bool) -> CfgRate:
+    if isinstance(rate, (list, tuple)):
+        # V2 multi-condition CFG runs the estimator on a batch of 3; dropping the
+        # intelligibility term leaves a batch of 2, dropping both a batch of 1
+        return [0.0, rate[1] if keep_similarity else 0.0]
+    return 0.0
+
+
+def build_quality_ladder(
+    diffusion_steps: int,
+    inference_cfg_rate: CfgRate,
+    extra_time: Optional[float] = None,
+    min_diffusion_steps: int = 3,
+    min_extra_time: float = 0.1,
+) -> List[Dict[str, object]]:
+    """
+    Ordered settings from the configured quality down to the cheapest allowed one:
+    fewer diffusion steps, then single-condition / no CFG, then shorter DiT context
+    (`extra_time`, when given), then the minimum number of diffusion steps.
+    """
+    base: Dict[str, object] = {"diffusion_steps": int(diffusion_steps), "inference_cfg_rate": inference_cfg_rate}
+    if extra_time is not None:
+        base["extra_time"] = float(extra_time)
+    levels = [dict(base)]
+
+    def push(**changes) -> None:
+        level = dict(levels[-1], **changes)
+        if level != levels[-1]:
+            levels.append(level)
+
+    for factor in (0.75, 0.5):
+        push(diffusion_steps=max(min_diffusion_steps, min(int(diffusion_steps), int(round(diffusion_steps * factor)))))
+    if isinstance(inference_cfg_rate, (list, tuple)) and all(rate != 0 for rate in inference_cfg_rate):
+        push(inference_cfg_rate=_disable_cfg(inference_cfg_rate, keep_similarity=True))
+    push(inference_cfg_rate=_disable_cfg(inference_cfg_rate, keep_similarity=False))
+    if extra_time is not None:
+        push(extra_time=max(min_extra_time, min(float(extra_time), round(extra_time * 0.5, 3))))
+        push(extra_time=max(min_extra_time, min(float(extra_time), round(extra_time * 0.25, 3))))
+    push(diffusion_steps=min(int(diffusion_steps), min_diffusion_steps))
+    return levels
+
+
+@dataclass
+class QualityChange:
+    level: int
+    previous_level: int
+    settings: Dict[str, object]
+    reason: str  # "behind" or "headroom"
+    processing_ms: float
+    deadline_ms: float
+
+    def as_event(self) -> Dict[str, object]:
+        return {
+            "event": "quality",
+            "level": self.level,
+            "previous_level": self.previous_level,
+            "settings": self.settings,
+            "reason": self.reason,
+            "processing_ms": round(self.processing_ms, 2),
+            "deadline_ms": round(self.deadline_ms, 2),
+        }
+
+
+class AdaptiveQualityController:
+    """
+    Args:
+        deadline: seconds available per block (the block's audio duration)
+        ladder: settings per level, see build_quality_ladder
+        high_water: degrade when smoothed processing time exceeds this fraction of the deadline...
+        degrade_after: ...for this many consecutive blocks
+        low_water: restore one level when smoothed processing time stays below this fraction...
+        upgrade_after: ...for this many consecutive blocks
+        smoothing: weight of the newest block in the exponential moving average
+    """
+
+    def __init__(
+        self,
+        deadline: float,
+        ladder: List[Dict[str, object]],
+        high_water: float = 0.9,
+        low_water: float = 0.6,
+        degrade_after: int = 2,
+        upgrade_after: int = 16,
+        smoothing: float = 0.3,
+    ) -> None:
+        self.deadline = deadline
+        self.ladder = ladder
+        self.high_water = high_water
+        self.low_water = low_water
+        self.degrade_after = degrade_after
+        self.upgrade_after = upgrade_after
+        self.smoothing = smoothing
+        self.level = 0
+        self.average = None
+        self._over = 0
+        self._under = 0
+
+    @property
+    def settings(self) -> Dict[str, object]:
+        return self.ladder[self.level]
+
+    def observe(self, seconds: float) -> Optional[QualityChange]:
+        """Record one block's processing time; returns the change to apply, if any."""
+        if self.average is None:
+            self.average = seconds
+        else:
+            self.average += self.smoothing * (seconds - self.average)
+        load = self.average / self.deadline
+        self._over = self._over + 1 if load > self.high_water else 0
+        self._under = self._under + 1 if load < self.low_water else 0
+
+        if self._over >= self.degrade_after and self.level < len(self.ladder) - 1:
+            return self._move(self.level + 1, "behind")
+        if self._under >= self.upgrade_after and self.level > 0:
+            return self._move(self.level - 1, "headroom")
+        return None
+
+    def _move(self, level: int, reason: str) -> QualityChange:
+        previous, self.level = self.level, level
+        self._over = self._under = 0
+        # the next blocks run with different settings; start averaging afresh
+        processing = self.average
+        self.average = None
+        return QualityChange(
+            level=level,
+            previous_level=previous,
+            settings=dict(self.settings),
+            reason=reason,
+            processing_ms=processing * 1000.0,
+            deadline_ms=self.deadline * 1000.0,
+        )
+
+
+__all__ = [
+    "AdaptiveQualityController",
+    "QualityChange",
+    "build_quality_ladder",
+]
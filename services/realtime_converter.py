@@ -0,0 +1,529 @@
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import librosa
+import numpy as np
+import torch
+import torch.nn.functional as F
+import torchaudio
+import yaml
+
+from hf_utils import load_custom_model_from_hf_map
+from modules.commons import build_model, load_checkpoint, recursive_munch
+from modules.profiling import NULL_PROFILER, Profiler
+from modules.resample import StreamingResampler, resample
+from services.quality import AdaptiveQualityController, build_quality_ladder
+
+# settings the adaptive quality controller may lower; the user's values are kept apart
+QUALITY_SETTINGS = ("diffusion_steps", "inference_cfg_rate", "extra_time")
+
+
+
+def load_realtime_models(checkpoint_path=None, config_path=None, device=torch.device("cpu")):
+    """
+    Load the V1 DiT model set used for real-time conversion.
+
+    Returns:
+        (model, semantic_fn, vocoder_fn, campplus_model, to_mel, mel_fn_args)
+    """
+    if checkpoint_path is None or checkpoint_path == "":
+        dit_checkpoint_path, dit_config_path = load_custom_model_from_hf_map("Plachta/Seed-VC",
+                                                                         "DiT_uvit_tat_xlsr_ema.pth",
+                                                                         "config_dit_mel_seed_uvit_xlsr_tiny.yml")
+    else:
+        dit_checkpoint_path = checkpoint_path
+        dit_config_path = config_path
+    config = yaml.safe_load(open(dit_config_path, "r"))
+    model_params = recursive_munch(config["model_params"])
+    model_params.dit_type = 'DiT'
+    model = build_model(model_params, stage="DiT")
+    hop_length = config["preprocess_params"]["spect_params"]["hop_length"]
+    sr = config["preprocess_params"]["sr"]
+
+    # Load checkpoints
+    model, _, _, _ = load_checkpoint(
+        model,
+        None,
+        dit_checkpoint_path,
+        load_only_params=True,
+        ignore_modules=[],
+        is_distributed=False,
+    )
+    for key in model:
+        model[key].eval()
+        model[key].to(device)
+    model.cfm.estimator.setup_caches(max_batch_size=1, max_seq_length=8192)
+
+    # Load additional modules
+    from modules.campplus.DTDNN import CAMPPlus
+
+    campplus_ckpt_path = load_custom_model_from_hf_map(
+        "funasr/campplus", "campplus_cn_common.bin", config_filename=None
+    )
+    campplus_model = CAMPPlus(feat_dim=80, embedding_size=192)
+    campplus_model.load_state_dict(torch.load(campplus_ckpt_path, map_location="cpu"))
+    campplus_model.eval()
+    campplus_model.to(device)
+
+    vocoder_type = model_params.vocoder.type
+
+    if vocoder_type == 'bigvgan':
+        from modules.bigvgan import bigvgan
+        bigvgan_name = model_params.vocoder.name
+        bigvgan_model = bigvgan.BigVGAN.from_pretrained(bigvgan_name, use_cuda_kernel=False)
+        # remove weight norm in the model and set to eval mode
+        bigvgan_model.remove_weight_norm()
+        bigvgan_model = bigvgan_model.eval().to(device)
+        vocoder_fn = bigvgan_model
+    elif vocoder_type == 'hifigan':
+        from modules.hifigan.generator import HiFTGenerator
+        from modules.hifigan.f0_predictor import ConvRNNF0Predictor
+        hift_config = yaml.safe_load(open('configs/hifigan.yml', 'r'))
+        hift_gen = HiFTGenerator(**hift_config['hift'], f0_predictor=ConvRNNF0Predictor(**hift_config['f0_predictor']))
+        hift_path = load_custom_model_from_hf_map("FunAudioLLM/CosyVoice-300M", 'hift.pt', None)
+        hift_gen.load_state_dict(torch.load(hift_path, map_location='cpu'))
+        hift_gen.eval()
+        hift_gen.to(device)
+        vocoder_fn = hift_gen
+    elif vocoder_type == "vocos":
+        vocos_config = yaml.safe_load(open(model_params.vocoder.vocos.config, 'r'))
+        vocos_path = model_params.vocoder.vocos.path
+        vocos_model_params = recursive_munch(vocos_config['model_params'])
+        vocos = build_model(vocos_model_params, stage='mel_vocos')
+        vocos_checkpoint_path = vocos_path
+        vocos, _, _, _ = load_checkpoint(vocos, None, vocos_checkpoint_path,
+                                         load_only_params=True, ignore_modules=[], is_distributed=False)
+        _ = [vocos[key].eval().to(device) for key in vocos]
+        _ = [vocos[key].to(device) for key in vocos]
+        total_params = sum(sum(p.numel() for p in vocos[key].parameters() if p.requires_grad) for key in vocos.keys())
+        print(f"Vocoder model total parameters: {total_params / 1_000_000:.2f}M")
+        vocoder_fn = vocos.decoder
+    else:
+        raise ValueError(f"Unknown vocoder type: {vocoder_type}")
+
+    speech_tokenizer_type = model_params.speech_tokenizer.type
+    if speech_tokenizer_type == 'whisper':
+        # whisper
+        from transformers import AutoFeatureExtractor, WhisperModel
+        whisper_name = model_params.speech_tokenizer.name
+        whisper_model = WhisperModel.from_pretrained(whisper_name, torch_dtype=torch.float16).to(device)
+        del whisper_model.decoder
+        whisper_feature_extractor = AutoFeatureExtractor.from_pretrained(whisper_name)
+
+        def semantic_fn(waves_16k):
+            ori_inputs = whisper_feature_extractor([waves_16k.squeeze(0).cpu().numpy()],
+                                                   return_tensors="pt",
+                                                   return_attention_mask=True)
+            ori_input_features = whisper_model._mask_input_features(
+                ori_inputs.input_features, attention_mask=ori_inputs.attention_mask).to(device)
+            with torch.no_grad():
+                ori_outputs = whisper_model.encoder(
+                    ori_input_features.to(whisper_model.encoder.dtype),
+                    head_mask=None,
+                    output_attentions=False,
+                    output_hidden_states=False,
+                    return_dict=True,
+                )
+            S_ori = ori_outputs.last_hidden_state.to(torch.float32)
+            S_ori = S_ori[:, :waves_16k.size(-1) // 320 + 1]
+            return S_ori
+    elif speech_tokenizer_type == 'cnhubert':
+        from transformers import (
+            Wav2Vec2FeatureExtractor,
+            HubertModel,
+        )
+        hubert_model_name = config['model_params']['speech_tokenizer']['name']
+        hubert_feature_extractor = Wav2Vec2FeatureExtractor.from_pretrained(hubert_model_name)
+        hubert_model = HubertModel.from_pretrained(hubert_model_name)
+        hubert_model = hubert_model.to(device)
+        hubert_model = hubert_model.eval()
+        hubert_model = hubert_model.half()
+
+        def semantic_fn(waves_16k):
+            ori_waves_16k_input_list = [
+                waves_16k[bib].cpu().numpy()
+                for bib in range(len(waves_16k))
+            ]
+            ori_inputs = hubert_feature_extractor(ori_waves_16k_input_list,
+                                                  return_tensors="pt",
+                                                  return_attention_mask=True,
+                                                  padding=True,
+                                                  sampling_rate=16000).to(device)
+            with torch.no_grad():
+                ori_outputs = hubert_model(
+                    ori_inputs.input_values.half(),
+                )
+            S_ori = ori_outputs.last_hidden_state.float()
+            return S_ori
+    elif speech_tokenizer_type == 'xlsr':
+        from transformers import (
+            Wav2Vec2FeatureExtractor,
+            Wav2Vec2Model,
+        )
+        extractor_dir='./models/wav2vec2'
+        model_name = config['model_params']['speech_tokenizer']['name']
+        output_layer = config['model_params']['speech_tokenizer']['output_layer']
+        wav2vec_feature_extractor = Wav2Vec2FeatureExtractor.from_pretrained(extractor_dir)
+        wav2vec_model = Wav2Vec2Model.from_pretrained(extractor_dir)
+        wav2vec_model.encoder.layers = wav2vec_model.encoder.layers[:output_layer]
+        wav2vec_model = wav2vec_model.to(device)
+        wav2vec_model = wav2vec_model.eval()
+        wav2vec_model = wav2vec_model.half()
+
+        def semantic_fn(waves_16k):
+            ori_waves_16k_input_list = [
+                waves_16k[bib].cpu().numpy()
+                for bib in range(len(waves_16k))
+            ]
+            ori_inputs = wav2vec_feature_extractor(ori_waves_16k_input_list,
+                                                   return_tensors="pt",
+                                                   return_attention_mask=True,
+                                                   padding=True,
+                                                   sampling_rate=16000).to(device)
+            with torch.no_grad():
+                ori_outputs = wav2vec_model(
+                    ori_inputs.input_values.half(),
+                )
+            S_ori = ori_outputs.last_hidden_state.float()
+            return S_ori
+    else:
+        raise ValueError(f"Unknown speech tokenizer type: {speech_tokenizer_type}")
+    # Generate mel spectrograms
+    mel_fn_args = {
+        "n_fft": config['preprocess_params']['spect_params']['n_fft'],
+        "win_size": config['preprocess_params']['spect_params']['win_length'],
+        "hop_size": config['preprocess_params']['spect_params']['hop_length'],
+        "num_mels": config['preprocess_params']['spect_params']['n_mels'],
+        "sampling_rate": sr,
+        "fmin": config['preprocess_params']['spect_params'].get('fmin', 0),
+        "fmax": None if config['preprocess_params']['spect_params'].get('fmax', "None") == "None" else 8000,
+        "center": False
+    }
+    from modules.audio import mel_spectrogram
+
+    to_mel = lambda x: mel_spectrogram(x, **mel_fn_args)
+
+    return (
+        model,
+        semantic_fn,
+        vocoder_fn,
+        campplus_model,
+        to_mel,
+        mel_fn_args,
+    )
+
+
+@dataclass
+class RealtimeConfig:
+    """Block sizing and inference parameters of a real-time conversion stream."""
+
+    block_time: float = 0.25  # s
+    crossfade_time: float = 0.05
+    extra_time_ce: float = 2.5
+    extra_time: float = 0.5
+    extra_time_right: float = 2.0
+    diffusion_steps: int = 10
+    inference_cfg_rate: float = 0.7
+    max_prompt_length: float = 3.0  # s
+    samplerate: Optional[int] = None  # I/O sample rate, defaults to the model sample rate
+    fp16: bool = True
+    passthrough: bool = False  # monitor input instead of converting
+    adaptive_quality: bool = False  # trade diffusion steps / CFG / extra_time for keeping up with the deadline
+
+
+class RealtimeConverter:
+    """
+    Headless block-wise voice conversion engine.
+
+    Takes mono float32 blocks of `block_frame` samples at `samplerate` and returns
+    converted blocks of the same size. All streaming state (reference prompt cache,
+    context buffers, SOLA buffer, VAD state) lives on the instance, so several
+    converters can share one model set in the same process.
+
+    Only the thread calling process_block touches `config` once streaming has started;
+    other threads (a GUI) change settings through update_settings.
+    """
+
+    def __init__(
+        self,
+        model_set,
+        device: Union[str, torch.device],
+        config: Optional[RealtimeConfig] = None,
+        vad_model=None,
+        profiler: Optional[Profiler] = None,
+    ) -> None:
+        (
+            self.model,
+            self.semantic_fn,
+            self.vocoder_fn,
+            self.campplus_model,
+            self.to_mel,
+            self.mel_fn_args,
+        ) = model_set
+        self.device = torch.device(device)
+        self.config = config if config is not None else RealtimeConfig()
+        self.vad_model = vad_model
+        # each pipeline stage runs in a span of this name: prompt, vad, resample, semantic_fn, cfm, ...
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
+        self.model_sr = self.mel_fn_args["sampling_rate"]
+        self.hop_length = self.mel_fn_args["hop_size"]
+        self.reference_wav = None
+        self.reference_name = None
+        self.prompt_condition, self.mel2, self.style2 = None, None, None
+        self._prompt_key = None
+        self.events = []
+        # the user's quality settings; config holds the ones currently applied
+        self.base_settings = {key: getattr(self.config, key) for key in QUALITY_SETTINGS}
+        self._pending_settings = {}
+        self._settings_lock = threading.Lock()
+        self.reset()
+        self.reset_quality()
+
+    def set_reference(self, reference: Union[str, np.ndarray], name: Optional[str] = None) -> None:
+        """Set the target voice from a file path or a waveform at the model sample rate."""
+        if isinstance(reference, str):
+            name = name or reference
+            reference = librosa.load(reference, sr=self.model_sr)[0]
+        self.reference_wav = np.asarray(reference, dtype=np.float32)
+        self.reference_name = name
+        self._prompt_key = None
+
+    def _frames(self, seconds: float) -> int:
+        return int(np.round(seconds * self.samplerate / self.zc)) * self.zc
+
+    def reset(self) -> None:
+        """(Re)allocate all streaming buffers from the current config."""
+        config = self.config
+        if config.extra_time_ce - config.extra_time < 0:
+            raise ValueError("Content encoder extra context must be greater than DiT extra context!")
+        self.samplerate = config.samplerate or self.model_sr
+        self.zc = self.samplerate // 50
+        self.block_frame = self._frames(config.block_time)
+        self.block_frame_16k = 320 * self.block_frame // self.zc
+        self.crossfade_frame = self._frames(config.crossfade_time)
+        self.sola_buffer_frame = min(self.crossfade_frame, 4 * self.zc)
+        self.sola_search_frame = self.zc
+        self.extra_frame = self._frames(config.extra_time_ce)
+        self.extra_frame_right = self._frames(config.extra_time_right)
+        self.input_wav = torch.zeros(
+            self.extra_frame
+            + self.crossfade_frame
+            + self.sola_search_frame
+            + self.block_frame
+            + self.extra_frame_right,
+            device=self.device,
+            dtype=torch.float32,
+        )
+        self.input_wav_res = torch.zeros(
+            320 * self.input_wav.shape[0] // self.zc,
+            device=self.device,
+            dtype=torch.float32,
+        )  # input wave resampled to 16000
+        self.sola_buffer = torch.zeros(self.sola_buffer_frame, device=self.device, dtype=torch.float32)
+        self.skip_head = self.extra_frame // self.zc
+        self.skip_tail = self.extra_frame_right // self.zc
+        self.return_length = (self.block_frame + self.sola_buffer_frame + self.sola_search_frame) // self.zc
+        self.fade_in_window = (
+            torch.sin(
+                0.5
+                * np.pi
+                * torch.linspace(0.0, 1.0, steps=self.sola_buffer_frame, device=self.device, dtype=torch.float32)
+            )
+            ** 2
+        )
+        self.fade_out_window = 1 - self.fade_in_window
+        self.vad_resampler = StreamingResampler(self.samplerate, 16000, device=self.device)
+        self.vad_cache = {}
+        self.vad_chunk_size = min(500, 1000 * config.block_time)
+        self.vad_speech_detected = self.vad_model is None
+        self.set_speech_detected_false_at_end_flag = False
+
+    def reset_quality(self) -> None:
+        """Apply the user's quality settings and (re)build the adaptive quality ladder with them on top."""
+        for key, value in self.base_settings.items():
+            setattr(self.config, key, value)
+        self.quality = None
+        if self.config.adaptive_quality:
+            ladder = build_quality_ladder(
+                self.base_settings["diffusion_steps"],
+                self.base_settings["inference_cfg_rate"],
+                extra_time=self.base_settings["extra_time"],
+            )
+            self.quality = AdaptiveQualityController(self.block_frame / self.samplerate, ladder)
+
+    def update_settings(self, **settings) -> None:
+        """
+        Change quality settings (diffusion_steps, inference_cfg_rate, extra_time) from any
+        thread; they become the new top quality level before the next block is processed.
+        """
+        unknown = set(settings) - set(QUALITY_SETTINGS)
+        if unknown:
+            raise ValueError(f"unknown settings {sorted(unknown)}, expected some of {QUALITY_SETTINGS}")
+        with self._settings_lock:
+            self._pending_settings.update(settings)
+
+    def _apply_pending_settings(self) -> None:
+        with self._settings_lock:
+            pending, self._pending_settings = self._pending_settings, {}
+        if pending:
+            self.base_settings.update(pending)
+            self.reset_quality()
+
+    def pop_events(self) -> list:
+        """Return and clear the events (quality changes) raised since the last call."""
+        events, self.events = self.events, []
+        return events
+
+    def _update_prompt(self) -> None:
+        key = (self.reference_name, self.config.max_prompt_length)
+        if self.prompt_condition is not None and self._prompt_key == key:
+            return
+        if self.reference_wav is None:
+            raise RuntimeError("set_reference() must be called before processing audio")
+        with self.profiler.span("prompt"):
+            self._compute_prompt()
+        self._prompt_key = key
+
+    def _compute_prompt(self) -> None:
+        reference_wav = self.reference_wav[:int(self.model_sr * self.config.max_prompt_length)]
+        reference_wav_tensor = torch.from_numpy(reference_wav).to(self.device)
+
+        ori_waves_16k = resample(reference_wav_tensor, self.model_sr, 16000)
+        S_ori = self.semantic_fn(ori_waves_16k.unsqueeze(0))
+        feat2 = torchaudio.compliance.kaldi.fbank(
+            ori_waves_16k.unsqueeze(0), num_mel_bins=80, dither=0, sample_frequency=16000
+        )
+        feat2 = feat2 - feat2.mean(dim=0, keepdim=True)
+        self.style2 = self.campplus_model(feat2.unsqueeze(0))
+
+        self.mel2 = self.to_mel(reference_wav_tensor.unsqueeze(0))
+        target2_lengths = torch.LongTensor([self.mel2.size(2)]).to(self.mel2.device)
+        self.prompt_condition = self.model.length_regulator(
+            S_ori, ylens=target2_lengths, n_quantizers=3, f0=None
+        )[0]
+
+    @torch.no_grad()
+    def _infer(self) -> torch.Tensor:
+        """Run content extraction, CFM and vocoder on the current context; returns model-rate audio."""
+        self._update_prompt()
+        ce_dit_difference = self.config.extra_time_ce - self.config.extra_time
+        with self.profiler.span("semantic_fn"):
+            S_alt = self.semantic_fn(self.input_wav_res.unsqueeze(0))
+
+        ce_dit_frame_difference = int(ce_dit_difference * 50)
+        S_alt = S_alt[:, ce_dit_frame_difference:]
+        target_lengths = torch.LongTensor([
+            (self.skip_head + self.return_length + self.skip_tail - ce_dit_frame_difference)
+            / 50 * self.model_sr // self.hop_length
+        ]).to(S_alt.device)
+        cond = self.model.length_regulator(
+            S_alt, ylens=target_lengths, n_quantizers=3, f0=None
+        )[0]
+        cat_condition = torch.cat([self.prompt_condition, cond], dim=1)
+        with torch.autocast(device_type=self.device.type, dtype=torch.float16 if self.config.fp16 else torch.float32):
+            with self.profiler.span("cfm"):
+                vc_target = self.model.cfm.inference(
+                    cat_condition,
+                    torch.LongTensor([cat_condition.size(1)]).to(self.mel2.device),
+                    self.mel2,
+                    self.style2,
+                    None,
+                    n_timesteps=int(self.config.diffusion_steps),
+                    inference_cfg_rate=self.config.inference_cfg_rate,
+                )
+                vc_target = vc_target[:, :, self.mel2.size(-1):]
+            with self.profiler.span("vocoder"):
+                vc_wave = self.vocoder_fn(vc_target).squeeze()
+        output_len = self.return_length * self.model_sr // 50
+        tail_len = self.skip_tail * self.model_sr // 50
+        return vc_wave[-output_len - tail_len: -tail_len]
+
+    def _detect_speech(self, block: np.ndarray) -> None:
+        if self.vad_model is None:
+            return
+        block_16k = self.vad_resampler.process(block).cpu().numpy()
+        res = self.vad_model.generate(input=block_16k, cache=self.vad_cache, is_final=False, chunk_size=self.vad_chunk_size)
+        res_value = res[0]["value"]
+        if len(res_value) % 2 == 1 and not self.vad_speech_detected:
+            self.vad_speech_detected = True
+        elif len(res_value) % 2 == 1 and self.vad_speech_detected:
+            self.set_speech_detected_false_at_end_flag = True
+
+    def _push_input(self, block: np.ndarray) -> None:
+        self.input_wav[: -self.block_frame] = self.input_wav[self.block_frame:].clone()
+        self.input_wav[-block.shape[0]:] = torch.from_numpy(block).to(self.device)
+        self.input_wav_res[: -self.block_frame_16k] = self.input_wav_res[self.block_frame_16k:].clone()
+        self.input_wav_res[-320 * (block.shape[0] // self.zc + 1):] = resample(
+            self.input_wav[-block.shape[0] - 2 * self.zc:], self.samplerate, 16000
+        )[320:]
+
+    def _sola(self, infer_wav: torch.Tensor) -> torch.Tensor:
+        # SOLA algorithm from https://github.com/yxlllc/DDSP-SVC
+        conv_input = infer_wav[None, None, : self.sola_buffer_frame + self.sola_search_frame]
+        cor_nom = F.conv1d(conv_input, self.sola_buffer[None, None, :])
+        cor_den = torch.sqrt(
+            F.conv1d(
+                conv_input ** 2,
+                torch.ones(1, 1, self.sola_buffer_frame, device=self.device),
+            )
+            + 1e-8
+        )
+        tensor = cor_nom[0, 0] / cor_den[0, 0]
+        if tensor.numel() > 1:  # If tensor has multiple elements
+            if sys.platform == "darwin":
+                _, sola_offset = torch.max(tensor, dim=0)
+                sola_offset = sola_offset.item()
+            else:
+                sola_offset = torch.argmax(tensor, dim=0).item()
+        else:
+            sola_offset = tensor.item()
+
+        infer_wav = infer_wav[int(sola_offset):]
+        infer_wav[: self.sola_buffer_frame] *= self.fade_in_window
+        infer_wav[: self.sola_buffer_frame] += self.sola_buffer * self.fade_out_window
+        self.sola_buffer[:] = infer_wav[self.block_frame: self.block_frame + self.sola_buffer_frame]
+        return infer_wav[: self.block_frame]
+
+    def process_block(self, block: np.ndarray) -> np.ndarray:
+        """Convert one mono float32 block of `block_frame` samples; returns a block of the same size."""
+        start_time = time.perf_counter()
+        self._apply_pending_settings()
+        block = np.asarray(block, dtype=np.float32).reshape(-1)
+        with self.profiler.span("vad"):
+            self._detect_speech(block)
+        with self.profiler.span("resample"):
+            self._push_input(block)
+        if self.config.passthrough:
+            infer_wav = self.input_wav[self.extra_frame:].clone()
+        else:
+            infer_wav = self._infer()
+            with self.profiler.span("resample_out"):
+                infer_wav = resample(infer_wav, self.model_sr, self.samplerate)
+            if not self.vad_speech_detected:
+                infer_wav = torch.zeros_like(self.input_wav[self.extra_frame:])
+        with self.profiler.span("sola"):
+            output = self._sola(infer_wav).cpu().numpy()
+
+        if self.set_speech_detected_false_at_end_flag:
+            self.vad_speech_detected = False
+            self.set_speech_detected_false_at_end_flag = False
+        if self.quality is not None and not self.config.passthrough:
+            self._adapt_quality(time.perf_counter() - start_time)
+        return output
+
+    def _adapt_quality(self, elapsed: float) -> None:
+        change = self.quality.observe(elapsed)
+        if change is None:
+            return
+        # extra_time only moves the DiT window inside the content encoder context, no realloc needed
+        for key, value in change.settings.items():
+            setattr(self.config, key, value)
+        self.events.append(change.as_event())
+
+
+__all__ = ["RealtimeConfig", "RealtimeConverter", "load_realtime_models"]
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+
+from modules.resample import StreamingResampler
+
+# Voice activity detection for ConversionSession. A detector is fed the session's audio
+# block by block, in order, and keeps its state across blocks; `is_speech(block)` says
+# whether the block needs conversion at all.
+
+VAD_OFF = "off"
+VAD_ENERGY = "energy"
+VAD_FUNASR = "funasr"
+VAD_MODES = (VAD_OFF, VAD_ENERGY, VAD_FUNASR)
+
+
+class EnergyVAD:
+    """
+    Frame RMS gate with hangover.
+
+    A frame is voiced when its RMS level is above `threshold_db` dBFS. A block counts as
+    speech if any of its frames is voiced or the hangover from the last voiced frame
+    (possibly in an earlier block) has not run out, so word tails are not cut.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        threshold_db: float = -50.0,
+        frame_ms: int = 20,
+        hangover_ms: int = 300,
+    ) -> None:
+        self.frame_size = max(1, sample_rate * frame_ms // 1000)
+        self.threshold = 10.0 ** (threshold_db / 20.0)
+        self.hangover_frames = int(np.ceil(hangover_ms / frame_ms))
+        self.reset()
+
+    def reset(self) -> None:
+        self.hangover_left = 0
+        self.remainder = np.zeros(0, dtype=np.float32)
+
+    def is_speech(self, block: np.ndarray) -> bool:
+        audio = np.concatenate([self.remainder, np.asarray(block, dtype=np.float32).reshape(-1)])
+        n_frames = audio.size // self.frame_size
+        self.remainder = audio[n_frames * self.frame_size:]
+        speech = self.hangover_left > 0
+        if n_frames == 0:
+            return speech
+        frames = audio[: n_frames * self.frame_size].reshape(n_frames, self.frame_size)
+        voiced = np.sqrt(np.mean(frames ** 2, axis=1)) > self.threshold
+        if voiced.any():
+            last_voiced = n_frames - 1 - int(np.argmax(voiced[::-1]))
+            self.hangover_left = max(0, self.hangover_frames - (n_frames - 1 - last_voiced))
+            return True
+        self.hangover_left = max(0, self.hangover_left - n_frames)
+        return speech
+
+
+class FunASRVAD:
+    """
+    Streaming FunASR fsmn-vad, as used by the real-time GUI.
+
+    The model is shared between sessions; the streaming cache and the open/closed
+    segment state are per instance.
+    """
+
+    def __init__(self, sample_rate: int, model, device=None) -> None:
+        self.model = model
+        self.resampler = StreamingResampler(sample_rate, 16000, device=device)
+        self.reset()
+
+    def reset(self) -> None:
+        self.cache = {}
+        self.active = False
+        self.resampler.reset()
+
+    def is_speech(self, block: np.ndarray) -> bool:
+        block_16k = self.resampler.process(np.asarray(block, dtype=np.float32).reshape(-1)).cpu().numpy()
+        chunk_ms = min(500, max(10, 1000 * block_16k.size // 16000))
+        result = self.model.generate(input=block_16k, cache=self.cache, is_final=False, chunk_size=chunk_ms)
+        speech = self.active
+        # segments are [start_ms, end_ms]; -1 marks a boundary outside this block
+        for start, end in result[0]["value"] if result else []:
+            speech = True
+            if start != -1:
+                self.active = True
+            if end != -1:
+                self.active = False
+        return speech
+
+
+def load_funasr_vad_model():
+    from funasr import AutoModel
+
+    return AutoModel(model="fsmn-vad", model_revision="v2.0.4")
+
+
+def create_vad(mode: str, sample_rate: int, threshold_db: float = -50.0, model=None, device=None) -> Optional[object]:
+    if mode == VAD_OFF:
+        return None
+    if mode == VAD_ENERGY:
+        return EnergyVAD(sample_rate, threshold_db=threshold_db)
+    if mode == VAD_FUNASR:
+        if model is None:
+            model = load_funasr_vad_model()
+        return FunASRVAD(sample_rate, model, device=device)
+    raise ValueError(f"vad must be one of {', '.join(VAD_MODES)}")
+
+
+__all__ = [
+    "EnergyVAD",
+    "FunASRVAD",
+    "VAD_ENERGY",
+    "VAD_FUNASR",
+    "VAD_MODES",
+    "VAD_OFF",
+    "create_vad",
+    "load_funasr_vad_model",
+]
@@ -2,21 +2,41 @@ from __future__ import annotations
 
 import asyncio
 import json
+import os
 import tempfile
+import threading
+import time
+import uuid
+from collections import deque
 from dataclasses import dataclass
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence
 
-import librosa
 import numpy as np
-import soundfile as sf
 import torch
-import yaml
 from fastapi import WebSocket
 from starlette.websockets import WebSocketDisconnect, WebSocketState
-from hydra.utils import instantiate
-from omegaconf import DictConfig
 
+from modules.compile_cache import CompileCache, configure_inductor
+from modules.model_registry import MODEL_REGISTRY
+from modules.profiling import NULL_PROFILER, Profiler
+from modules.resample import StreamingResampler
+from services.audio_codec import CODEC_OPUS, CODEC_PCM, CodecError, create_codec
+from services.framing import (
+    FLAG_DISCONTINUITY,
+    FLAG_END_OF_STREAM,
+    PROTOCOL_FRAMED,
+    PROTOCOL_RAW,
+    FrameError,
+    FrameHeader,
+    decode_frame,
+    encode_frame,
+)
+from services.framing import VERSION as FRAME_VERSION
+from services.metrics import ServiceMetrics
+from services.quality import AdaptiveQualityController, build_quality_ladder
+from services.vad import VAD_FUNASR, VAD_OFF, create_vad, load_funasr_vad_model
 from services.voice_library import VoiceLibrary, VoiceProfile
+from services.workers import share_parameters
 
 
 def _select_device() -> torch.device:
@@ -27,6 +47,17 @@ def _select_device() -> torch.device:
     return torch.device("cpu")
 
 
+# wrapper capabilities loaded at startup, see modules.v2.vc_wrapper.CAPABILITIES
+DEFAULT_CAPABILITIES = ("timbre", "style")
+
+
+def _env_list(name: str, default: Sequence[str]) -> Sequence[str]:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
 @dataclass
 class ConversionConfig:
     diffusion_steps: int = 30
@@ -36,6 +67,14 @@ class ConversionConfig:
     temperature: float = 0.7
     repetition_penalty: float = 1.5
     chunk_seconds: float = 2.0
+    max_queue_seconds: float = 10.0  # received audio waiting for conversion before the oldest is dropped
+    codec: str = CODEC_PCM  # transport codec of both directions, see services.audio_codec
+    opus_frame_ms: int = 20
+    opus_bitrate: int = 32000
+    vad: str = VAD_OFF  # off, energy or funasr; clients opt in, silent chunks then skip conversion
+    vad_threshold_db: float = -50.0  # energy gate level in dBFS
+    adaptive_quality: bool = False  # lower diffusion steps / CFG when conversion falls behind real time
+    convert_style: Optional[bool] = None  # AR style conversion; None follows the service's capabilities
 
 
 class ConversionSession:
@@ -49,69 +88,166 @@ class ConversionSession:
         dtype: torch.dtype,
         source_sample_rate: int,
         config: ConversionConfig,
+        profiler: Optional[Profiler] = None,
+        metrics: Optional[ServiceMetrics] = None,
+        vad_model=None,
     ) -> None:
+        self.session_id = uuid.uuid4().hex[:8]
         self.voice = voice
         self.wrapper = wrapper
         self.device = device
         self.dtype = dtype
         self.source_sample_rate = source_sample_rate
         self.config = config
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
+        self.metrics = metrics if metrics is not None else ServiceMetrics()
         self.target_sr = getattr(wrapper, "sr", 22050)
+        self.codec = create_codec(
+            config.codec,
+            source_sample_rate,
+            self.target_sr,
+            frame_ms=config.opus_frame_ms,
+            bitrate=config.opus_bitrate,
+        )
+        # rates on the wire; Opus only supports a few, so they can differ from source/model rates
+        self.input_rate = self.codec.input_rate
+        self.output_rate = self.codec.output_rate
         self.buffer = np.array([], dtype=np.float32)
-        self.chunk_samples = max(int(self.target_sr * self.config.chunk_seconds), self.target_sr // 2)
+        self.resampler = StreamingResampler(self.input_rate, self.target_sr, device=self.device)
+        self.output_resampler = None
+        if self.output_rate != self.target_sr:
+            self.output_resampler = StreamingResampler(self.target_sr, self.output_rate, device=self.device)
+        chunk_seconds = self.config.chunk_seconds
+        if self.codec.name == CODEC_OPUS:
+            # whole number of Opus frames per chunk
+            frame_seconds = self.config.opus_frame_ms / 1000.0
+            chunk_seconds = max(1, round(chunk_seconds / frame_seconds)) * frame_seconds
+        self.chunk_samples = max(int(round(self.target_sr * chunk_seconds)), self.target_sr // 2)
+        self.vad = create_vad(
+            config.vad, self.target_sr, threshold_db=config.vad_threshold_db, model=vad_model, device=self.device
+        )
+        self.events: List[dict] = []  # session events for the client, drained by stream_conversion
+        self.quality = None
+        if config.adaptive_quality:
+            self.quality = AdaptiveQualityController(
+                self.chunk_samples / self.target_sr,
+                build_quality_ladder(config.diffusion_steps, config.inference_cfg_rate),
+                upgrade_after=4,
+            )
+
+    def _process_chunk(self, chunk: np.ndarray, final: bool = False) -> bytes:
+        """Convert a chunk, or emit silence of the converted length when the VAD finds no speech."""
+        if self.vad is not None:
+            with self.profiler.span("session.vad"):
+                speech = self.vad.is_speech(chunk)
+            if not speech:
+                self.metrics.vad_skipped.inc()
+                self.metrics.vad_skipped_seconds.inc(chunk.size / self.target_sr)
+                silence = np.zeros(int(round(chunk.size * self.config.length_adjust)), dtype=np.float32)
+                output = self._encode(silence, final=final)
+                self.metrics.bytes_sent.inc(len(output))
+                return output
+        return self._convert_chunk(chunk, final=final)
+
+    def _convert_chunk(self, chunk: np.ndarray, final: bool = False) -> bytes:
+        start = time.perf_counter()
+        with self.profiler.span("session.convert_chunk"):
+            converted = self._run_conversion(chunk)
+        output = self._encode(converted, final=final)
+        elapsed = time.perf_counter() - start
+        self.metrics.observe_chunk(self.session_id, elapsed, chunk.size / self.target_sr, len(output))
+        if self.quality is not None and not final:
+            change = self.quality.observe(elapsed)
+            if change is not None:
+                for key, value in change.settings.items():
+                    setattr(self.config, key, value)
+                self.events.append(change.as_event())
+        return output
+
+    def pop_events(self) -> List[dict]:
+        events, self.events = self.events, []
+        return events
+
+    def _encode(self, wave: np.ndarray, final: bool = False) -> bytes:
+        """Resample converted audio to the wire rate and encode it; `final` drains resampler and codec."""
+        with self.profiler.span("session.encode"):
+            if self.output_resampler is not None:
+                parts = [self.output_resampler.process(wave).cpu().numpy()]
+                if final:
+                    parts.append(self.output_resampler.flush().cpu().numpy())
+                wave = np.concatenate(parts)
+            payload = self.codec.encode(wave)
+            if final:
+                payload += self.codec.flush()
+        return payload
+
+    def _run_conversion(self, chunk: np.ndarray) -> np.ndarray:
+        import soundfile as sf
 
-    def _convert_chunk(self, chunk: np.ndarray) -> bytes:
         chunk = np.clip(chunk, -1.0, 1.0)
         with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
             sf.write(tmp.name, chunk, self.target_sr)
-            converted = self.wrapper.convert_voice(
-                source_audio_path=tmp.name,
-                target_audio_path=self.voice.path,
-                diffusion_steps=self.config.diffusion_steps,
-                length_adjust=self.config.length_adjust,
-                inference_cfg_rate=self.config.inference_cfg_rate,
-                top_p=self.config.top_p,
-                temperature=self.config.temperature,
-                repetition_penalty=self.config.repetition_penalty,
-                device=self.device,
-                dtype=self.dtype,
-            )
+            if self.config.convert_style:
+                converted = self.wrapper.convert_voice(
+                    source_audio_path=tmp.name,
+                    target_audio_path=self.voice.path,
+                    diffusion_steps=self.config.diffusion_steps,
+                    length_adjust=self.config.length_adjust,
+                    inference_cfg_rate=self.config.inference_cfg_rate,
+                    top_p=self.config.top_p,
+                    temperature=self.config.temperature,
+                    repetition_penalty=self.config.repetition_penalty,
+                    device=self.device,
+                    dtype=self.dtype,
+                )
+            else:
+                converted = self.wrapper.convert_timbre(
+                    source_audio_path=tmp.name,
+                    target_audio_path=self.voice.path,
+                    diffusion_steps=self.config.diffusion_steps,
+                    length_adjust=self.config.length_adjust,
+                    inference_cfg_rate=self.config.inference_cfg_rate,
+                    device=self.device,
+                    dtype=self.dtype,
+                )
         converted_wave = converted.squeeze().astype(np.float32)
-        converted_wave = np.clip(converted_wave, -1.0, 1.0)
-        converted_int16 = (converted_wave * 32767.0).astype(np.int16)
-        return converted_int16.tobytes()
+        return np.clip(converted_wave, -1.0, 1.0)
 
-    def process_audio(self, audio_bytes: bytes) -> List[bytes]:
-        if not audio_bytes:
-            return []
-        audio_int16 = np.frombuffer(audio_bytes, dtype=np.int16)
-        if audio_int16.size == 0:
-            return []
-        audio_float = audio_int16.astype(np.float32) / 32768.0
-        if self.source_sample_rate != self.target_sr:
-            audio_float = librosa.resample(
-                audio_float,
-                orig_sr=self.source_sample_rate,
-                target_sr=self.target_sr,
-            )
+    def _append(self, audio_float: np.ndarray) -> None:
         if self.buffer.size == 0:
             self.buffer = audio_float
         else:
             self.buffer = np.concatenate([self.buffer, audio_float])
 
+    def process_audio(self, audio_bytes: bytes) -> List[bytes]:
+        if not audio_bytes:
+            return []
+        self.metrics.bytes_received.inc(len(audio_bytes))
+        with self.profiler.span("session.decode"):
+            audio_float = self.codec.decode(audio_bytes)
+            if audio_float.size == 0:
+                return []
+            audio_float = self.resampler.process(audio_float).cpu().numpy()
+        self._append(audio_float)
+
         outputs: List[bytes] = []
         while self.buffer.size >= self.chunk_samples:
             chunk = self.buffer[: self.chunk_samples]
             self.buffer = self.buffer[self.chunk_samples :]
-            outputs.append(self._convert_chunk(chunk))
+            outputs.append(self._process_chunk(chunk))
         return outputs
 
     def flush(self) -> List[bytes]:
+        self._append(self.resampler.flush().cpu().numpy())
         if self.buffer.size == 0:
-            return []
+            tail = self._encode(np.zeros(0, dtype=np.float32), final=True)
+            return [tail] if tail else []
         chunk = self.buffer
         self.buffer = np.array([], dtype=np.float32)
-        return [self._convert_chunk(chunk)]
+        return [self._process_chunk(chunk, final=True)]
+
+    def close(self) -> None:
+        self.metrics.session_closed(self.session_id)
 
 
 class VCService:
@@ -122,35 +258,129 @@ class VCService:
         voice_root: str = "examples/reference",
         ar_checkpoint_path: Optional[str] = None,
         cfm_checkpoint_path: Optional[str] = None,
-        compile_ar: bool = False,
+        compile_ar: Optional[bool] = None,
         chunk_seconds: float = 2.0,
+        profile: Optional[bool] = None,
+        max_queue_seconds: float = 10.0,
+        bundle_path: Optional[str] = None,
+        capabilities: Optional[Sequence[str]] = None,
+        prefetch: Optional[Sequence[str]] = None,
+        share_models: bool = True,
+        compile_cfm: Optional[bool] = None,
+        compile_cache: Optional[str] = None,
+        metrics: Optional[ServiceMetrics] = None,
     ) -> None:
         self.voice_library = VoiceLibrary(voice_root)
         self.device = _select_device()
+        # profile=None defers to the SEED_VC_PROFILE environment variable
+        if profile is None:
+            self.profiler = Profiler.from_env(device=self.device)
+        else:
+            self.profiler = Profiler(enabled=profile, device=self.device)
         self.dtype = torch.float16 if self.device.type in {"cuda", "mps"} else torch.float32
-        self.wrapper = self._load_wrapper(ar_checkpoint_path, cfm_checkpoint_path, compile_ar)
-        self.config_template = ConversionConfig(chunk_seconds=chunk_seconds)
+        # a backend passes the registry it already serves /metrics from while the models load
+        self.metrics = metrics if metrics is not None else ServiceMetrics()
+        self.metrics.profiler, self.metrics.device = self.profiler, self.device
+        # bundle_path=None defers to SEED_VC_BUNDLE; a bundle replaces both checkpoint paths
+        if bundle_path is None:
+            bundle_path = os.environ.get("SEED_VC_BUNDLE") or None
+        # capabilities / prefetch=None defer to SEED_VC_CAPABILITIES / SEED_VC_PREFETCH (comma separated).
+        # Components outside the capabilities (e.g. the AR model for a timbre-only deployment)
+        # are loaded by the first session that needs them, or in the background when prefetched.
+        if capabilities is None:
+            capabilities = _env_list("SEED_VC_CAPABILITIES", DEFAULT_CAPABILITIES)
+        if prefetch is None:
+            prefetch = _env_list("SEED_VC_PREFETCH", ())
+        self.capabilities = tuple(capabilities)
+        self.prefetch = tuple(prefetch)
+        # compile_ar / compile_cfm=None defer to SEED_VC_COMPILE ("ar", "cfm" or both, comma separated);
+        # compile_cache=None defers to SEED_VC_COMPILE_CACHE, a directory of compile artifacts that
+        # survives restarts (see modules.compile_cache and warm_compile_cache.py)
+        compile_targets = _env_list("SEED_VC_COMPILE", ())
+        if compile_ar is None:
+            compile_ar = "ar" in compile_targets
+        if compile_cfm is None:
+            compile_cfm = "cfm" in compile_targets
+        if compile_cache is None:
+            compile_cache = os.environ.get("SEED_VC_COMPILE_CACHE") or None
+        self.compile_cache: Optional[CompileCache] = None
+        # services in one process share model weights through the registry, see close()
+        self.registry = MODEL_REGISTRY if share_models else None
+        self.wrapper = self._load_wrapper(
+            ar_checkpoint_path, cfm_checkpoint_path, compile_ar, bundle_path, compile_cfm, compile_cache
+        )
+        if prefetch:
+            self.wrapper.prefetch(prefetch)
+        self.vad_model = None  # FunASR fsmn-vad, loaded on the first session that asks for it
+        self._vad_lock = threading.Lock()
+        self.config_template = ConversionConfig(chunk_seconds=chunk_seconds, max_queue_seconds=max_queue_seconds)
 
     def _load_wrapper(
         self,
         ar_checkpoint_path: Optional[str],
         cfm_checkpoint_path: Optional[str],
         compile_ar: bool,
+        bundle_path: Optional[str] = None,
+        compile_cfm: bool = False,
+        compile_cache: Optional[str] = None,
     ):
-        cfg = DictConfig(yaml.safe_load(open("configs/v2/vc_wrapper.yaml", "r")))
-        wrapper = instantiate(cfg)
-        wrapper.load_checkpoints(ar_checkpoint_path=ar_checkpoint_path, cfm_checkpoint_path=cfm_checkpoint_path)
+        # the model stack (hydra, transformers, safetensors, ...) is imported only when the
+        # service is built, so importing this module and the backend stays cheap
+        if bundle_path:
+            from modules.v2.bundle import load_bundle, read_bundle_metadata
+
+            with self.profiler.span("load_checkpoints"):
+                wrapper = load_bundle(
+                    bundle_path, device=self.device, capabilities=self.capabilities, registry=self.registry
+                )
+            wrapper.set_profiler(self.profiler)
+            model_config = json.loads(read_bundle_metadata(bundle_path)["config"])
+        else:
+            import yaml
+            from omegaconf import DictConfig, OmegaConf
+
+            from modules.v2.vc_wrapper import instantiate_wrapper
+
+            cfg = DictConfig(yaml.safe_load(open("configs/v2/vc_wrapper.yaml", "r")))
+            wrapper = instantiate_wrapper(cfg, capabilities=self.capabilities, registry=self.registry)
+            wrapper.set_profiler(self.profiler)
+            wrapper.load_checkpoints(ar_checkpoint_path=ar_checkpoint_path, cfm_checkpoint_path=cfm_checkpoint_path)
+            model_config = OmegaConf.to_container(cfg, resolve=True)
         wrapper.to(self.device)
         wrapper.eval()
         wrapper.setup_ar_caches(max_batch_size=1, max_seq_len=4096, dtype=self.dtype, device=self.device)
+        if self.registry is not None:
+            # shared groups are built (or reused) only now that the device is known
+            with self.profiler.span("load_checkpoints"):
+                wrapper.ensure_capability(*self.capabilities)
+        if compile_ar or compile_cfm:
+            if compile_cache:
+                self.compile_cache = CompileCache.for_model(
+                    compile_cache, model_config, self.device, self.dtype
+                ).activate()
+            else:
+                configure_inductor()
         if compile_ar:
-            torch._inductor.config.coordinate_descent_tuning = True
-            torch._inductor.config.triton.unique_kernel_names = True
-            if hasattr(torch._inductor.config, "fx_graph_cache"):
-                torch._inductor.config.fx_graph_cache = True
             wrapper.compile_ar()
+        if compile_cfm:
+            wrapper.compile_cfm()
         return wrapper
 
+    def prepare_fork(self) -> int:
+        """
+        Build every component this service will use and move the weights to shared memory,
+        so that worker processes forked afterwards share one copy (see services.workers).
+        Returns the bytes moved to shared memory.
+        """
+        if self.device.type != "cpu":
+            raise RuntimeError(f"Multi-worker serving needs the CPU device, {self.device.type} state cannot be forked")
+        self.wrapper.ensure_capability(*self.capabilities, *self.prefetch)
+        return share_parameters(self.wrapper)
+
+    def close(self) -> None:
+        """Give the shared model weights back to the registry."""
+        self.wrapper.release_shared()
+
     def list_voices(self) -> List[VoiceProfile]:
         return self.voice_library.list()
 
@@ -159,6 +389,7 @@ class VCService:
         voice_id: str,
         source_sample_rate: int,
         overrides: Optional[Dict[str, float]] = None,
+        metrics: Optional[ServiceMetrics] = None,
     ) -> ConversionSession:
         voice = self.voice_library.get(voice_id)
         config_data: Dict[str, float] = {
@@ -169,10 +400,23 @@ class VCService:
             "temperature": self.config_template.temperature,
             "repetition_penalty": self.config_template.repetition_penalty,
             "chunk_seconds": self.config_template.chunk_seconds,
+            "max_queue_seconds": self.config_template.max_queue_seconds,
+            "codec": self.config_template.codec,
+            "opus_frame_ms": self.config_template.opus_frame_ms,
+            "opus_bitrate": self.config_template.opus_bitrate,
+            "vad": self.config_template.vad,
+            "vad_threshold_db": self.config_template.vad_threshold_db,
+            "adaptive_quality": self.config_template.adaptive_quality,
+            "convert_style": "style" in self.capabilities,
         }
         if overrides:
             config_data.update(overrides)
         config = ConversionConfig(**config_data)
+        if config.vad == VAD_FUNASR:
+            # blocking; the backend calls create_session from a worker thread
+            with self._vad_lock:
+                if self.vad_model is None:
+                    self.vad_model = load_funasr_vad_model()
         return ConversionSession(
             voice=voice,
             wrapper=self.wrapper,
@@ -180,38 +424,227 @@ class VCService:
             dtype=self.dtype,
             source_sample_rate=source_sample_rate,
             config=config,
+            profiler=self.profiler,
+            metrics=metrics if metrics is not None else self.metrics,
+            vad_model=self.vad_model,
         )
 
 
-async def stream_conversion(
-    websocket: WebSocket,
-    session: ConversionSession,
-) -> None:
-    await websocket.send_text(json.dumps({"event": "ready", "target_sample_rate": session.target_sr}))
+@dataclass
+class _InputFrame:
+    header: FrameHeader
+    received_at: float  # perf_counter() when the frame arrived
+
+
+class _InputQueue:
+    """
+    Client messages received but not yet processed by a session.
+
+    Audio is bounded by `max_seconds` of queued playback time; when the converter
+    falls behind, the oldest audio messages are dropped so latency stays bounded.
+    Control messages are never dropped.
+    """
+
+    def __init__(self, max_seconds: float, bytes_per_second: float, metrics: ServiceMetrics) -> None:
+        self.max_seconds = max_seconds
+        self.bytes_per_second = bytes_per_second
+        self.metrics = metrics
+        self.items: deque = deque()
+        self.audio_seconds = 0.0
+        self.dropped = 0  # drops not yet reported to the client
+        self.closed = False
+        self._ready = asyncio.Event()
+
+    def _push(self, kind: str, payload, seconds: float = 0.0, frame: Optional[_InputFrame] = None) -> None:
+        self.items.append((kind, payload, seconds, frame))
+        self.audio_seconds += seconds
+        self.metrics.queue_depth.inc()
+        self.metrics.queued_audio.inc(seconds)
+        self._ready.set()
+
+    def _remove(self, index: int):
+        kind, payload, seconds, frame = self.items[index]
+        del self.items[index]
+        self.audio_seconds -= seconds
+        self.metrics.queue_depth.dec()
+        self.metrics.queued_audio.dec(seconds)
+        return kind, payload, frame
+
+    def put_audio(self, data: bytes, frame: Optional[_InputFrame] = None) -> None:
+        self._push("audio", data, len(data) / self.bytes_per_second, frame)
+        while self.audio_seconds > self.max_seconds:
+            oldest = next(i for i, item in enumerate(self.items) if item[0] == "audio")
+            if oldest == len(self.items) - 1:
+                break  # never drop the message just received
+            self._remove(oldest)
+            self.dropped += 1
+            self.metrics.dropped.inc()
+
+    def put_text(self, payload: dict) -> None:
+        self._push("text", payload)
+
+    def close(self) -> None:
+        self.closed = True
+        self._ready.set()
+
+    async def get(self):
+        """Return the next (kind, payload, frame), or None once closed and drained."""
+        while not self.items:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        return self._remove(0)
+
+    def drain(self) -> None:
+        while self.items:
+            self._remove(0)
+
+
+async def _send_error(websocket: WebSocket, message: str) -> None:
+    await websocket.send_text(json.dumps({"event": "error", "message": message}))
+
+
+async def _send_events(websocket: WebSocket, session: ConversionSession) -> None:
+    for event in session.pop_events():
+        await websocket.send_text(json.dumps(event))
+
+
+async def _receive_loop(websocket: WebSocket, queue: _InputQueue, protocol: str) -> None:
     try:
         while True:
             message = await websocket.receive()
             if message.get("type") in {"websocket.disconnect", "websocket.close"}:
                 break
             if "bytes" in message and message["bytes"] is not None:
-                chunks = await asyncio.to_thread(session.process_audio, message["bytes"])
-                for chunk in chunks:
-                    await websocket.send_bytes(chunk)
+                if protocol == PROTOCOL_FRAMED:
+                    try:
+                        header, payload = decode_frame(message["bytes"])
+                    except FrameError as e:
+                        await _send_error(websocket, str(e))
+                        continue
+                    queue.put_audio(payload, _InputFrame(header, time.perf_counter()))
+                    if header.end_of_stream:
+                        queue.put_text({"event": "flush"})
+                else:
+                    queue.put_audio(message["bytes"])
             elif "text" in message and message["text"]:
-                payload = json.loads(message["text"])
-                if payload.get("event") == "flush":
+                queue.put_text(json.loads(message["text"]))
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        queue.close()
+
+
+class _FrameWriter:
+    """Sends encoded output as bare payloads, or as frames echoing the last input frame."""
+
+    def __init__(self, websocket: WebSocket, protocol: str, codec, metrics: ServiceMetrics) -> None:
+        self.websocket = websocket
+        self.framed = protocol == PROTOCOL_FRAMED
+        self.codec = codec
+        self.metrics = metrics
+        self.last_input: Optional[_InputFrame] = None
+
+    async def send(self, chunks: List[bytes], queue: _InputQueue, end_of_stream: bool = False) -> None:
+        if not self.framed:
+            for chunk in chunks:
+                await self.websocket.send_bytes(chunk)
+            return
+        source = self.last_input
+        if end_of_stream and not chunks:
+            chunks = [b""]  # always acknowledge an end-of-stream frame
+        for i, chunk in enumerate(chunks):
+            flags = 0
+            if queue.dropped:
+                flags |= FLAG_DISCONTINUITY
+                queue.dropped = 0
+            if end_of_stream and i == len(chunks) - 1:
+                flags |= FLAG_END_OF_STREAM
+            processing = time.perf_counter() - source.received_at if source is not None else 0.0
+            header = FrameHeader(
+                seq=source.header.seq if source is not None else 0,
+                timestamp_us=source.header.timestamp_us if source is not None else 0,
+                sample_count=self.codec.sample_count(chunk),
+                flags=flags,
+                processing_us=int(processing * 1e6),
+            )
+            await self.websocket.send_bytes(encode_frame(header, chunk))
+            if source is not None:
+                self.metrics.frame_latency.observe(processing)
+
+
+async def stream_conversion(
+    websocket: WebSocket,
+    session: ConversionSession,
+    protocol: str = PROTOCOL_RAW,
+) -> None:
+    metrics = session.metrics
+    metrics.sessions.inc()
+    metrics.active_sessions.inc()
+    queue = _InputQueue(session.config.max_queue_seconds, session.codec.input_bytes_per_second, metrics)
+    writer = _FrameWriter(websocket, protocol, session.codec, metrics)
+    receiver = asyncio.create_task(_receive_loop(websocket, queue, protocol))
+    failure: Optional[str] = None
+    try:
+        await websocket.send_text(json.dumps({
+            "event": "ready",
+            "target_sample_rate": session.output_rate,
+            "input_sample_rate": session.input_rate,
+            "codec": session.codec.name,
+            "frame_ms": session.config.opus_frame_ms if session.codec.name == CODEC_OPUS else None,
+            "protocol": protocol,
+            "frame_version": FRAME_VERSION if protocol == PROTOCOL_FRAMED else None,
+        }))
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            kind, payload, frame = item
+            if kind == "audio":
+                if frame is not None:
+                    writer.last_input = frame
+                try:
+                    chunks = await asyncio.to_thread(session.process_audio, payload)
+                except CodecError as e:
+                    # a malformed payload only costs its own audio, the stream goes on
+                    await _send_error(websocket, f"Could not decode audio: {e}")
+                    continue
+                except (RuntimeError, OSError) as e:
+                    # the model or the inference worker behind the session failed
+                    failure = f"Conversion failed: {e}"
+                    break
+                await writer.send(chunks, queue)
+                await _send_events(websocket, session)
+            elif payload.get("event") == "flush":
+                try:
                     chunks = await asyncio.to_thread(session.flush)
-                    for chunk in chunks:
-                        await websocket.send_bytes(chunk)
-                    await websocket.send_text(json.dumps({"event": "completed"}))
+                except (RuntimeError, OSError) as e:
+                    failure = f"Conversion failed: {e}"
+                    break
+                await writer.send(chunks, queue, end_of_stream=True)
+                await _send_events(websocket, session)
+                await websocket.send_text(json.dumps({"event": "completed"}))
     except WebSocketDisconnect:
         pass
     finally:
-        if websocket.application_state == WebSocketState.CONNECTED:
-            remaining = await asyncio.to_thread(session.flush)
-            for chunk in remaining:
-                await websocket.send_bytes(chunk)
-            await websocket.close()
+        receiver.cancel()
+        queue.drain()
+        try:
+            if (
+                websocket.application_state == WebSocketState.CONNECTED
+                and websocket.client_state == WebSocketState.CONNECTED
+            ):
+                if failure is not None:
+                    await _send_error(websocket, failure)
+                    await websocket.close(code=1011)  # internal error
+                else:
+                    remaining = await asyncio.to_thread(session.flush)
+                    await writer.send(remaining, queue, end_of_stream=bool(remaining))
+                    await websocket.close()
+        finally:
+            session.close()
+            metrics.active_sessions.dec()
 
 
 __all__ = [
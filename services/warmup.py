@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from services.audio_codec import CODEC_PCM
+from services.metrics import ServiceMetrics
+from services.vad import VAD_OFF
+
+# Startup warmup and readiness for the backend. Before a replica takes traffic it runs a
+# few synthetic conversions at the chunk lengths clients use, which pays for CUDA context
+# creation, cuDNN autotuning, lazy tokenizer loads and AR graph capture up front. The
+# Readiness state backs the /ready endpoint.
+
+STATE_STARTING = "starting"
+STATE_LOADING = "loading"
+STATE_WARMING = "warming"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off")
+
+
+@dataclass
+class WarmupConfig:
+    enabled: bool = True
+    chunk_seconds: Sequence[float] = ()  # chunk lengths to warm; empty means the service default
+    iterations: int = 2  # the first pass is cold, later ones settle autotuning and graph capture
+    voice_id: Optional[str] = None  # reference voice; defaults to the first voice of the library
+    source_sample_rate: int = 16000
+    convert_style: Optional[bool] = None  # None follows the service's capabilities
+
+    @classmethod
+    def from_env(cls) -> "WarmupConfig":
+        """SEED_VC_WARMUP, SEED_VC_WARMUP_CHUNKS (comma separated seconds), SEED_VC_WARMUP_ITERATIONS, SEED_VC_WARMUP_VOICE."""
+        chunks = os.environ.get("SEED_VC_WARMUP_CHUNKS", "")
+        return cls(
+            enabled=_env_bool("SEED_VC_WARMUP", True),
+            chunk_seconds=tuple(float(item) for item in chunks.split(",") if item.strip()),
+            iterations=int(os.environ.get("SEED_VC_WARMUP_ITERATIONS", "2")),
+            voice_id=os.environ.get("SEED_VC_WARMUP_VOICE") or None,
+        )
+
+
+def synthetic_speech(seconds: float, sample_rate: int, seed: int = 0) -> np.ndarray:
+    """Voiced, syllable-modulated harmonic signal with some noise; close enough to speech to exercise every stage."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(round(seconds * sample_rate)), dtype=np.float64) / sample_rate
+    f0 = 140.0 + 30.0 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = 0.5 * (1.0 - np.cos(2 * np.pi * 4.0 * t))  # ~4 syllables per second
+    wave = 0.2 * envelope * voiced + 0.01 * rng.standard_normal(t.size)
+    return np.clip(wave, -1.0, 1.0).astype(np.float32)
+
+
+def run_warmup(service, config: WarmupConfig) -> List[Dict[str, float]]:
+    """Convert synthetic audio at every configured chunk length; returns the per-pass timings."""
+    voices = service.list_voices()
+    voice_id = config.voice_id or (voices[0].id if voices else None)
+    if voice_id is None:
+        raise RuntimeError("warmup needs at least one reference voice")
+    chunk_lengths = list(config.chunk_seconds) or [service.config_template.chunk_seconds]
+
+    results = []
+    for chunk_seconds in chunk_lengths:
+        audio = synthetic_speech(chunk_seconds, config.source_sample_rate)
+        payload = (audio * 32767.0).astype("<i2").tobytes()
+        for iteration in range(config.iterations):
+            overrides = {
+                "chunk_seconds": chunk_seconds,
+                "codec": CODEC_PCM,
+                "vad": VAD_OFF,
+                "adaptive_quality": False,
+            }
+            if config.convert_style is not None:
+                overrides["convert_style"] = config.convert_style
+            # private metrics so warmup does not show up in the service's latency histograms
+            session = service.create_session(
+                voice_id, config.source_sample_rate, overrides=overrides, metrics=ServiceMetrics()
+            )
+            start = time.perf_counter()
+            try:
+                session.process_audio(payload)
+                session.flush()
+            finally:
+                session.close()
+            results.append({
+                "chunk_seconds": chunk_seconds,
+                "iteration": iteration,
+                "seconds": round(time.perf_counter() - start, 4),
+            })
+    return results
+
+
+class Readiness:
+    """Startup state shared between the loader thread and the HTTP handlers."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.state = STATE_STARTING
+        self.error: Optional[str] = None
+        self.warmup: List[Dict[str, float]] = []
+        self.started_at = time.time()
+        self.ready_at: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == STATE_READY
+
+    def set(self, state: str) -> None:
+        with self._lock:
+            self.state = state
+            if state == STATE_READY:
+                self.ready_at = time.time()
+
+    def fail(self, error: BaseException) -> None:
+        with self._lock:
+            self.state = STATE_FAILED
+            self.error = f"{type(error).__name__}: {error}"
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            data: Dict[str, object] = {"status": self.state, "warmup": list(self.warmup)}
+            if self.error is not None:
+                data["error"] = self.error
+            if self.ready_at is not None:
+                data["startup_seconds"] = round(self.ready_at - self.started_at, 3)
+            return data
+
+
+__all__ = [
+    "Readiness",
+    "STATE_FAILED",
+    "STATE_LOADING",
+    "STATE_READY",
+    "STATE_STARTING",
+    "STATE_WARMING",
+    "WarmupConfig",
+    "run_warmup",
+    "synthetic_speech",
+]
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import os
+import signal
+import socket
+import time
+from typing import Callable, Dict, Optional
+
+# Pre-fork multi-worker serving. One uvicorn worker is GIL-bound in the numpy / librosa
+# parts of every session, and starting independent workers loads every model once per
+# worker. Instead the parent process loads (and warms) the service once, moves the model
+# parameters into shared memory, binds the listening socket and forks the workers: each
+# worker inherits the loaded service and serves connections accepted from the shared
+# socket, so sessions spread over the workers while the weights exist once.
+#
+# Forking a process that has initialised CUDA is not supported, so this is a CPU mode.
+#
+# Every worker keeps its own metrics and /metrics answers from whichever worker accepted
+# the scrape, so each sample carries a `worker` label: successive scrapes of the one
+# target then fill one series per worker instead of mixing them into a single series
+# that jumps back and forth. Aggregate with `sum without (worker) (...)` (or max for the
+# gauges), and scrape at a few times the worker count per rate() window so that every
+# worker is sampled.
+
+ENV_WORKERS = "SEED_VC_WORKERS"
+
+
+def worker_count(workers: Optional[int] = None) -> int:
+    """`workers`, else SEED_VC_WORKERS (0 or "auto" = one per core), else 1."""
+    if workers is None:
+        value = os.environ.get(ENV_WORKERS, "1").strip().lower()
+        workers = 0 if value == "auto" else int(value)
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def threads_per_worker(workers: int) -> int:
+    """Intra-op threads per worker so that the workers together use each core once."""
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def share_parameters(module) -> int:
+    """
+    Move the CPU parameters of `module` into shared memory and return their size in bytes.
+
+    Buffers are left alone: some of them are per-worker state (the AR KV caches) and must
+    not be shared, and the rest are small enough for copy-on-write to handle. Parameters
+    loaded from a bundle are already backed by the memory-mapped file, whose pages the
+    forked workers share through the page cache, so they are skipped.
+    """
+    shared = 0
+    for param in module.parameters():
+        if param.device.type != "cpu" or param.is_shared():
+            continue
+        storage = param.untyped_storage()
+        if getattr(storage, "filename", None):
+            continue  # file-backed mmap
+        param.share_memory_()
+        shared += storage.nbytes()
+    return shared
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class PreforkServer:
+    """
+    Forks `workers` processes that each run `serve(sock, index)` on one shared listening
+    socket, and replaces workers that exit while the server is running.
+
+    Call it after the expensive state (models) is loaded: forked workers share that memory
+    copy-on-write. The kernel hands every connection to exactly one worker.
+    """
+
+    def __init__(
+        self,
+        serve: Callable[[socket.socket, int], None],
+        workers: int,
+        host: str = "0.0.0.0",
+        port: int = 8000,
+        on_worker_start: Optional[Callable[[int], None]] = None,
+        respawn_delay: float = 1.0,
+    ) -> None:
+        self.serve = serve
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.on_worker_start = on_worker_start
+        self.respawn_delay = respawn_delay
+        self.sock: Optional[socket.socket] = None
+        self.pids: Dict[int, int] = {}  # pid -> worker index
+        self.stopping = False
+
+    @property
+    def address(self):
+        return self.sock.getsockname()
+
+    def start(self) -> None:
+        if self.sock is None:
+            self.sock = bind_socket(self.host, self.port)
+        for index in range(self.workers):
+            self._spawn(index)
+
+    def _spawn(self, index: int) -> int:
+        pid = os.fork()
+        if pid:
+            self.pids[pid] = index
+            return pid
+        # worker: never return into the parent's code path
+        code = 0
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            if self.on_worker_start is not None:
+                self.on_worker_start(index)
+            self.serve(self.sock, index)
+        except BaseException as e:
+            if not isinstance(e, (KeyboardInterrupt, SystemExit)):
+                print(f"Worker {index} ({os.getpid()}) failed: {type(e).__name__}: {e}")
+                code = 1
+        finally:
+            os._exit(code)
+
+    def reap(self, block: bool = True) -> None:
+        """Wait for worker exits and, unless stopping, start replacements."""
+        while self.pids:
+            try:
+                pid, status = os.waitpid(-1, 0 if block else os.WNOHANG)
+            except ChildProcessError:
+                self.pids.clear()
+                return
+            except InterruptedError:
+                continue
+            if pid == 0:
+                return
+            index = self.pids.pop(pid, None)
+            if index is None:
+                continue
+            if self.stopping:
+                continue
+            print(f"Worker {index} ({pid}) exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+            time.sleep(self.respawn_delay)  # no tight fork loop when workers crash on startup
+            self._spawn(index)
+            if not block:
+                return
+
+    def _signal_workers(self, sig: int) -> None:
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Ask every worker to shut down gracefully, kill the ones still alive after `timeout`."""
+        self.stopping = True
+        self._signal_workers(signal.SIGTERM)
+        deadline = time.monotonic() + timeout
+        while self.pids and time.monotonic() < deadline:
+            self.reap(block=False)
+            time.sleep(0.05)
+        self._signal_workers(signal.SIGKILL)
+        self.reap()
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def run(self) -> None:
+        """start(), supervise until SIGINT / SIGTERM, then stop()."""
+        def request_stop(signum, frame):
+            self.stopping = True
+            self._signal_workers(signal.SIGTERM)
+
+        previous = {sig: signal.signal(sig, request_stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            self.start()
+            while not self.stopping:
+                self.reap()
+        finally:
+            self.stop()
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+
+
+__all__ = [
+    "PreforkServer",
+    "bind_socket",
+    "share_parameters",
+    "threads_per_worker",
+    "worker_count",
+]
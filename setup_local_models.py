@@ -8,6 +8,7 @@ import os
 import sys
 from pathlib import Path
 from local_model_loader import create_model_directories, print_model_requirements, MODEL_MAPPING
+from download_models import verify_models
 
 def main():
     print("=" * 60)
@@ -48,6 +49,14 @@ def main():
                 missing_models.append(repo_id)
                 print(f"✗ {repo_id} (目录)")
     
+    # 并行校验已下载文件的 SHA256 (download_models.py 写入的清单)
+    report = verify_models()
+    for local_path in report["missing"] + report["corrupt"]:
+        print(f"✗ 校验失败: {local_path}")
+    if report["missing"] or report["corrupt"]:
+        missing_models.extend(report["missing"] + report["corrupt"])
+    print(f"✓ 已校验 {len(report['ok'])} 个文件")
+
     print(f"\n现有模型: {len(existing_models)}")
     print(f"缺失模型: {len(missing_models)}")
     
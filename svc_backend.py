@@ -1,13 +1,35 @@
 from __future__ import annotations
 
+import asyncio
+import dataclasses
 import json
-from typing import Dict
+import threading
+import time
+from typing import Dict, Optional
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
 
+from services.audio_codec import CodecUnavailable
+from services.framing import PROTOCOL_RAW, PROTOCOLS
+from services.inference_rpc import RemoteError
+from services.metrics import CONTENT_TYPE, ServiceMetrics
 from services.vc_service import VCService, stream_conversion
+from services.warmup import STATE_LOADING, STATE_READY, STATE_WARMING, Readiness, WarmupConfig, run_warmup
 
 app = FastAPI(title="Seed VC V2 Backend", version="0.1.0")
+app.state.readiness = Readiness()
+# created before the service so /metrics answers (seedvc_ready 0) while the models load and warm up
+app.state.metrics = ServiceMetrics()
+_service_lock = threading.Lock()
+
+
+def _parse_bool(value: str) -> bool:
+    if value.lower() in ("1", "true", "yes", "on"):
+        return True
+    if value.lower() in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(value)
 
 
 CONFIG_CASTERS: Dict[str, callable] = {
@@ -18,32 +40,128 @@ CONFIG_CASTERS: Dict[str, callable] = {
     "temperature": float,
     "repetition_penalty": float,
     "chunk_seconds": float,
+    "codec": str,
+    "opus_frame_ms": int,
+    "opus_bitrate": int,
+    "vad": str,
+    "vad_threshold_db": float,
+    "adaptive_quality": _parse_bool,
+    "convert_style": _parse_bool,
 }
 
 
+def _create_service():
+    """VCService in this process, or a RemoteService when inference workers are configured."""
+    from services.inference_rpc import RemoteService
+
+    remote = RemoteService.from_env(metrics=app.state.metrics)
+    if remote is not None:
+        return remote
+    return VCService(metrics=app.state.metrics)
+
+
 def get_service() -> VCService:
+    with _service_lock:
+        service = getattr(app.state, "vc_service", None)
+        if service is None:
+            app.state.vc_service = _create_service()
+            service = app.state.vc_service
+    return service
+
+
+def _loaded_service() -> VCService:
+    # handlers never construct the service themselves; that is the startup thread's job
     service = getattr(app.state, "vc_service", None)
     if service is None:
-        app.state.vc_service = VCService()
-        service = app.state.vc_service
+        raise HTTPException(status_code=503, detail=app.state.readiness.snapshot())
     return service
 
 
+def _start_service(warmup: WarmupConfig, share_weights: bool = False) -> None:
+    """
+    Load the models and warm them up; runs on a worker thread so /health answers meanwhile.
+    With `share_weights` the weights move to shared memory before warmup, ready for forking.
+    """
+    readiness = app.state.readiness
+    try:
+        readiness.set(STATE_LOADING)
+        service = get_service()
+        if not isinstance(service, VCService):
+            # inference workers load and warm up on their own and listen once ready
+            service.wait_ready()
+            warmup = dataclasses.replace(warmup, enabled=False)
+        if share_weights:
+            shared = service.prepare_fork()
+            print(f"Moved {shared / 2 ** 20:.1f} MiB of model weights to shared memory")
+        if warmup.enabled:
+            readiness.set(STATE_WARMING)
+            start = time.perf_counter()
+            readiness.warmup = run_warmup(service, warmup)
+            app.state.metrics.warmup_seconds.set(time.perf_counter() - start)
+        readiness.set(STATE_READY)
+        app.state.metrics.ready.set(1)
+    except Exception as e:
+        readiness.fail(e)
+        print(f"Backend startup failed: {readiness.error}")
+
+
 @app.on_event("startup")
 async def startup_event() -> None:
-    get_service()
+    if getattr(app.state, "vc_service", None) is not None:
+        return  # forked worker, the parent already loaded and warmed up the service
+    # keep a reference so the task is not garbage collected while it runs
+    app.state.startup_task = asyncio.get_running_loop().run_in_executor(
+        None, _start_service, WarmupConfig.from_env()
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    service = getattr(app.state, "vc_service", None)
+    if service is not None:
+        service.close()
 
 
 @app.get("/health")
 async def health() -> Dict[str, str]:
+    """Liveness: the process is up. Use /ready to decide whether to send traffic."""
     return {"status": "ok"}
 
 
+@app.get("/ready")
+async def ready() -> JSONResponse:
+    readiness = app.state.readiness
+    data = readiness.snapshot()
+    worker = getattr(app.state, "worker", None)
+    if worker is not None:
+        data["worker"] = worker
+    return JSONResponse(data, status_code=200 if readiness.ready else 503)
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    """
+    Prometheus metrics of this process, also while loading (seedvc_ready 0); forked workers
+    label theirs with `worker` (see services.workers).
+    """
+    return Response(app.state.metrics.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/metrics/workers/{index}")
+async def worker_metrics(index: int) -> Response:
+    """Metrics of one inference worker process (only with SEED_VC_INFERENCE_*)."""
+    service = _loaded_service()
+    if not hasattr(service, "worker_metrics") or not 0 <= index < len(service.paths):
+        raise HTTPException(status_code=404, detail="no such inference worker")
+    text = await asyncio.to_thread(service.worker_metrics, index)
+    return Response(text, media_type=CONTENT_TYPE)
+
+
 @app.get("/voices")
 async def list_voices() -> Dict[str, object]:
     voices = [
         {"id": voice.id, "title": voice.title}
-        for voice in get_service().list_voices()
+        for voice in _loaded_service().list_voices()
     ]
     return {"voices": voices}
 
@@ -52,6 +170,10 @@ async def list_voices() -> Dict[str, object]:
 async def websocket_convert(websocket: WebSocket) -> None:
     await websocket.accept()
     try:
+        if not app.state.readiness.ready:
+            await websocket.send_text(json.dumps({"event": "error", "message": "Service is not ready yet"}))
+            await websocket.close(code=1013)  # try again later
+            return
         voice_id = websocket.query_params.get("voice_id")
         if not voice_id:
             await websocket.send_text(json.dumps({"event": "error", "message": "voice_id is required"}))
@@ -64,6 +186,13 @@ async def websocket_convert(websocket: WebSocket) -> None:
             await websocket.send_text(json.dumps({"event": "error", "message": "sample_rate must be an integer"}))
             await websocket.close(code=1008)
             return
+        protocol = websocket.query_params.get("protocol", PROTOCOL_RAW)
+        if protocol not in PROTOCOLS:
+            await websocket.send_text(
+                json.dumps({"event": "error", "message": f"protocol must be one of {', '.join(PROTOCOLS)}"})
+            )
+            await websocket.close(code=1008)
+            return
         overrides = {}
         for key, caster in CONFIG_CASTERS.items():
             if key in websocket.query_params:
@@ -76,7 +205,9 @@ async def websocket_convert(websocket: WebSocket) -> None:
                     await websocket.close(code=1008)
                     return
         try:
-            session = get_service().create_session(
+            # may load the FunASR VAD model or wait on an inference worker, keep it off the event loop
+            session = await asyncio.to_thread(
+                get_service().create_session,
                 voice_id=voice_id,
                 source_sample_rate=source_sample_rate,
                 overrides=overrides or None,
@@ -85,12 +216,57 @@ async def websocket_convert(websocket: WebSocket) -> None:
             await websocket.send_text(json.dumps({"event": "error", "message": "Unknown voice id"}))
             await websocket.close(code=1008)
             return
-        await stream_conversion(websocket, session)
+        except (ValueError, CodecUnavailable) as e:
+            await websocket.send_text(json.dumps({"event": "error", "message": str(e)}))
+            await websocket.close(code=1008)
+            return
+        except (RemoteError, OSError) as e:
+            # no inference worker could open the session
+            await websocket.send_text(json.dumps({"event": "error", "message": f"Inference unavailable: {e}"}))
+            await websocket.close(code=1011)
+            return
+        await stream_conversion(websocket, session, protocol=protocol)
     except WebSocketDisconnect:
         return
 
 
-def run(host: str = "0.0.0.0", port: int = 8000) -> None:
+def _run_workers(host: str, port: int, workers: int) -> None:
+    """Load the service once, then fork `workers` uvicorn workers that share it (see services.workers)."""
+    import uvicorn
+
+    from services.workers import PreforkServer, threads_per_worker
+
+    _start_service(WarmupConfig.from_env(), share_weights=True)
+    if not app.state.readiness.ready:
+        raise SystemExit(f"Backend startup failed: {app.state.readiness.error}")
+    threads = threads_per_worker(workers)
+
+    def on_worker_start(index: int) -> None:
+        import torch
+
+        torch.set_num_threads(threads)
+        app.state.worker = index
+        # the metrics were inherited from the parent; tell the workers' samples apart
+        app.state.metrics.registry.const_labels["worker"] = str(index)
+
+    def serve(sock, index: int) -> None:
+        uvicorn.Server(uvicorn.Config(app, lifespan="on")).run(sockets=[sock])
+
+    print(f"Serving on {host}:{port} with {workers} workers x {threads} threads")
+    try:
+        PreforkServer(serve, workers, host=host, port=port, on_worker_start=on_worker_start).run()
+    finally:
+        app.state.vc_service.close()
+
+
+def run(host: str = "0.0.0.0", port: int = 8000, workers: Optional[int] = None) -> None:
+    """Serve the backend; workers=None defers to SEED_VC_WORKERS (default 1, 0 or "auto" = one per core)."""
+    from services.workers import worker_count
+
+    workers = worker_count(workers)
+    if workers > 1:
+        _run_workers(host, port, workers)
+        return
     import uvicorn
 
     uvicorn.run("svc_backend:app", host=host, port=port, reload=False)
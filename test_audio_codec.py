@@ -0,0 +1,39 @@
+import numpy as np
+
+from services.audio_codec import CodecError, PCMCodec, pack_packets, unpack_packets
+
+
+def test_packets_roundtrip():
+    packets = [b"\x01" * 3, b"", b"\x02" * 300]
+    assert unpack_packets(pack_packets(packets)) == packets
+
+
+def test_malformed_payloads_raise_codec_error():
+    data = pack_packets([b"\x01" * 10])
+    for bad in (data[:-1], data + b"\x05"):
+        try:
+            unpack_packets(bad)
+            raise AssertionError(f"decoded malformed payload {bad!r}")
+        except CodecError:
+            pass
+    codec = PCMCodec(16000, 22050)
+    try:
+        codec.decode(b"\0" * 5)
+        raise AssertionError("decoded odd-length pcm")
+    except CodecError:
+        pass
+    assert np.array_equal(codec.decode(b"\0\x40"), np.array([0.5], dtype=np.float32))
+
+
+def run_tests():
+    test_packets_roundtrip()
+    test_malformed_payloads_raise_codec_error()
+    return True
+
+
+if __name__ == '__main__':
+    success = run_tests()
+    if success:
+        print("\n✅ 所有测试通过!")
+    else:
+        print("\n❌ 部分测试失败!")
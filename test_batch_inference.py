@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+from batch_inference_v2 import ProgressLog, read_items, read_progress
+from modules.v2.batch import TargetPrompt, convert_segments, extract_conditions, plan_batches, segment_bounds, \
+    stitch_segments
+from modules.v2.cfm import CFM
+from modules.v2.dit_wrapper import DiT
+from modules.v2.length_regulator import InterpolateRegulator
+from test_content_extraction import content_wrapper
+
+
+def _args(**kwargs):
+    defaults = dict(
+        manifest=None, sources=[], targets=[], diffusion_steps=30, length_adjust=1.0,
+        intelligibility_cfg_rate=0.7, similarity_cfg_rate=0.7, top_p=0.9, temperature=1.0,
+        repetition_penalty=1.0, convert_style=False,
+    )
+    defaults.update(kwargs)
+    return argparse.Namespace(**defaults)
+
+
+def test_segment_bounds_match_streaming_windows():
+    assert segment_bounds(100, 300, 16) == [(0, 100)]
+    assert segment_bounds(300, 300, 16) == [(0, 300)]
+    assert segment_bounds(700, 300, 16) == [(0, 300), (284, 584), (568, 700)]
+
+
+def test_plan_batches_respects_size_and_frames():
+    lengths = [50, 400, 60, 300, 55, 410]
+    batches = plan_batches(lengths, max_batch_size=2, max_batch_frames=10000)
+    assert batches == [[0, 4], [2, 3], [1, 5]]
+    batches = plan_batches(lengths, max_batch_size=8, max_batch_frames=800)
+    assert batches == [[0, 4, 2], [3, 1], [5]]
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+
+
+def test_stitch_segments_crossfades_overlaps():
+    def crossfade(chunk1, chunk2, overlap):
+        chunk2[:overlap] = (chunk1 + chunk2[:overlap]) / 2
+        return chunk2
+
+    first, second = np.ones(10, dtype=np.float32), np.full(8, 3.0, dtype=np.float32)
+    wave = stitch_segments([first, second], 2, crossfade)
+    assert len(wave) == 10 + 8 - 2
+    assert wave[7] == 1.0 and wave[8] == 2.0 and wave[-1] == 3.0
+    assert stitch_segments([first], 2, crossfade) is first
+
+
+def test_manifest_items_and_resume():
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = os.path.join(tmp, "jobs.csv")
+        with open(manifest, "w") as f:
+            f.write("source,target,output,diffusion_steps,convert_style\n")
+            f.write("a.wav,voices/x.wav,,10,\n")
+            f.write("b.wav,voices/x.wav,b_custom.wav,,true\n")
+        items = read_items(_args(manifest=manifest))
+        assert [item["output"] for item in items] == ["a_x.wav", "b_custom.wav"]
+        assert items[0]["source"] == os.path.join(tmp, "a.wav")
+        assert items[0]["diffusion_steps"] == 10 and items[1]["diffusion_steps"] == 30
+        assert items[0]["convert_style"] is False and items[1]["convert_style"] is True
+
+        output = os.path.join(tmp, "out")
+        os.makedirs(output)
+        progress = ProgressLog(output)
+        progress.record(items[1], error="RuntimeError: boom")
+        with open(os.path.join(output, "a_x.wav"), "wb") as f:
+            f.write(b"RIFF")
+        progress.record(items[0], audio_seconds=1.0, seconds=0.1)
+        progress.close()
+        with open(os.path.join(output, "progress.jsonl"), "a") as f:
+            f.write('{"output": "b_cus')  # interrupted mid-line
+        assert read_progress(output) == {"a_x.wav"}
+        os.remove(os.path.join(output, "a_x.wav"))
+        assert read_progress(output) == set()
+        assert progress.failed == 1
+
+
+def test_globs_cross_product():
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ["s1.wav", "s2.wav", "t1.wav"]:
+            open(os.path.join(tmp, name), "wb").close()
+        items = read_items(_args(sources=[os.path.join(tmp, "s*.wav")], targets=[os.path.join(tmp, "t*.wav")]))
+        assert [item["output"] for item in items] == ["s1_t1.wav", "s2_t1.wav"]
+        assert json.dumps(items)  # plain values only, as written to progress.jsonl
+
+
+class NoiselessCFM(CFM):
+    """CFM starting from zero noise, so batched and single runs see the same input."""
+
+    def inference(self, *args, **kwargs):
+        return super().inference(*args, temperature=0.0, **kwargs)
+
+
+def _frame_vocoder(mel):
+    # frame-wise, so padded frames cannot leak into the real ones
+    return mel.mean(dim=1, keepdim=True).tanh().repeat_interleave(4, dim=2)
+
+
+def test_convert_segments_batched_matches_single():
+    torch.manual_seed(0)
+    estimator = DiT(
+        time_as_token=True, style_as_token=True, uvit_skip_connection=False, block_size=256, depth=1,
+        num_heads=2, hidden_dim=16, in_channels=8, content_dim=16, style_encoder_dim=4,
+        class_dropout_prob=0.1, dropout_rate=0.0, attn_dropout_rate=0.0,
+    )
+    wrapper = SimpleNamespace(
+        cfm=NoiselessCFM(estimator).eval(), dit_compiled=False, compile_len=0, vocoder=_frame_vocoder, hop_size=4,
+    )
+    prompt = TargetPrompt(torch.randn(1, 8, 6), torch.randn(1, 6, 16), torch.randn(1, 4))
+    conditions = [torch.randn(1, length, 16) for length in (5, 12, 9)]
+    for rates in ((0.7, 0.7), (0.0, 0.7), (0.7, 0.0), (0.0, 0.0)):
+        batched = convert_segments(wrapper, prompt, conditions, 3, *rates)
+        for condition, wave in zip(conditions, batched):
+            [single] = convert_segments(wrapper, prompt, [condition], 3, *rates)
+            assert wave.shape == (condition.size(1) * 4,)
+            assert np.abs(wave - single).max() < 1e-5, rates
+
+
+def conditions_wrapper():
+    """content_wrapper (real ConvNeXt encoders and BSQ quantizers) plus what extract_conditions uses on top."""
+    wrapper = content_wrapper()
+    wrapper.mel_fn = lambda wave: torch.zeros(1, 8, wave.size(-1) // 256)
+    wrapper.cfm_length_regulator = InterpolateRegulator(
+        channels=16, sampling_ratios=[1], is_discrete=True, codebook_size=2048,
+    ).eval()
+    passes = []
+    extract_content = wrapper.extract_content
+
+    def counting_extract_content(waves_16k, narrow=True):
+        passes.append(len(waves_16k))
+        return extract_content(waves_16k, narrow=narrow)
+
+    wrapper.extract_content = counting_extract_content
+    return wrapper, passes
+
+
+def test_extract_conditions_batched_matches_single():
+    rng = np.random.default_rng(0)
+    waves = [rng.uniform(-0.1, 0.1, int(seconds * 22050)).astype(np.float32) for seconds in (2.0, 31.0, 0.5, 1.2)]
+    wrapper, passes = conditions_wrapper()
+    batched = extract_conditions(wrapper, waves, torch.device("cpu"), torch.float32)
+    assert passes == [3, 2]  # the short sources share one SSL pass, the long one is two windows
+    for wave, condition in zip(waves, batched):
+        [single] = extract_conditions(wrapper, [wave], torch.device("cpu"), torch.float32)
+        assert condition.size(1) == len(wave) // 256
+        assert torch.equal(condition, single)
+
+
+def run_tests():
+    test_segment_bounds_match_streaming_windows()
+    test_plan_batches_respects_size_and_frames()
+    test_stitch_segments_crossfades_overlaps()
+    test_manifest_items_and_resume()
+    test_globs_cross_product()
+    test_convert_segments_batched_matches_single()
+    test_extract_conditions_batched_matches_single()
+    return True
+
+
+if __name__ == '__main__':
+    success = run_tests()
+    if success:
+        print("\n✅ 所有测试通过!")
+    else:
+        print("\n❌ 部分测试失败!")
@@ -0,0 +1,155 @@
+import json
+import os
+import tempfile
+
+import torch
+from hydra.utils import instantiate
+from omegaconf import DictConfig
+
+from modules.model_registry import ModelRegistry
+from modules.v2.bundle import load_bundle, named_tensors, read_bundle_metadata, save_bundle
+
+BIGVGAN_CONFIG = {
+    "resblock": "1",
+    "num_mels": 8,
+    "upsample_rates": [4, 4],
+    "upsample_kernel_sizes": [8, 8],
+    "upsample_initial_channel": 16,
+    "resblock_kernel_sizes": [3],
+    "resblock_dilation_sizes": [[1, 3, 5]],
+    "activation": "snakebeta",
+    "snake_logscale": True,
+}
+
+
+class TinyQuantizer(torch.nn.Module):
+    """Stands in for AstralQuantizer; its output projection is tied to the input one."""
+
+    def __init__(self, load_ssl_weights=True):
+        super().__init__()
+        self.proj_in = torch.nn.Linear(4, 4, bias=False)
+        self.proj_out = torch.nn.Linear(4, 4, bias=False)
+        self.proj_out.weight = self.proj_in.weight
+
+
+class TinyStyleEncoder(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.proj = torch.nn.Linear(80, 4)
+
+
+def tiny_config(vocoder_dir):
+    regulator = {
+        "_target_": "modules.v2.length_regulator.InterpolateRegulator",
+        "channels": 16, "is_discrete": True, "codebook_size": 32, "sampling_ratios": [1], "f0_condition": False,
+    }
+    return DictConfig({
+        "_target_": "modules.v2.vc_wrapper.VoiceConversionWrapper",
+        "sr": 22050,
+        "hop_size": 256,
+        "mel_fn": {
+            "_target_": "modules.audio.mel_spectrogram", "_partial_": True, "n_fft": 1024, "win_size": 1024,
+            "hop_size": 256, "num_mels": 8, "sampling_rate": 22050, "fmin": 0, "fmax": None, "center": False,
+        },
+        "cfm": {
+            "_target_": "modules.v2.cfm.CFM",
+            "estimator": {
+                "_target_": "modules.v2.dit_wrapper.DiT",
+                "time_as_token": True, "style_as_token": True, "uvit_skip_connection": False, "block_size": 256,
+                "depth": 1, "num_heads": 2, "hidden_dim": 16, "in_channels": 8, "content_dim": 16,
+                "style_encoder_dim": 4, "class_dropout_prob": 0.1, "dropout_rate": 0.0, "attn_dropout_rate": 0.0,
+            },
+        },
+        "cfm_length_regulator": regulator,
+        "ar": {
+            "_target_": "modules.v2.ar.NaiveWrapper",
+            "model": {
+                "_target_": "modules.v2.ar.NaiveTransformer",
+                "config": {
+                    "_target_": "modules.v2.ar.NaiveModelArgs",
+                    "dim": 16, "n_head": 2, "n_local_heads": 2, "intermediate_size": 32, "n_layer": 1,
+                    "vocab_size": 33, "max_seq_len": 32,
+                },
+            },
+        },
+        "ar_length_regulator": {**regulator, "sampling_ratios": []},
+        "style_encoder": {"_target_": f"{__name__}.TinyStyleEncoder"},
+        "content_extractor_narrow": {"_target_": f"{__name__}.TinyQuantizer", "load_ssl_weights": True},
+        "content_extractor_wide": {"_target_": f"{__name__}.TinyQuantizer", "load_ssl_weights": True},
+        "vocoder": {"_target_": "modules.v2.bundle.build_bigvgan", "pretrained_model_name_or_path": vocoder_dir},
+    })
+
+
+def _assert_same_tensors(reference, loaded, prefix=""):
+    expected = {name: tensor for name, tensor in named_tensors(reference) if name.startswith(prefix)}
+    actual = dict(named_tensors(loaded))
+    assert expected and set(expected) <= set(actual)
+    for name, tensor in expected.items():
+        assert torch.equal(tensor.detach(), actual[name].detach()), name
+
+
+def test_round_trip_keeps_every_tensor_and_tie():
+    torch.manual_seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "config.json"), "w") as f:
+            json.dump(BIGVGAN_CONFIG, f)
+        cfg = tiny_config(tmp)
+        for weight_norm in (True, False):
+            wrapper = instantiate(cfg).eval()
+            if not weight_norm:
+                wrapper.vocoder.remove_weight_norm()
+            path = os.path.join(tmp, f"bundle-{weight_norm}.safetensors")
+            n_tensors, n_aliases = save_bundle(wrapper, cfg, path)
+            assert n_aliases >= 2  # the tied projections of both quantizers
+            assert read_bundle_metadata(path)["vocoder_weight_norm"] == ("1" if weight_norm else "0")
+
+            loaded = load_bundle(path)
+            _assert_same_tensors(wrapper, loaded)
+            # non-persistent buffers (the AR rope table and causal mask) come back too
+            assert torch.equal(loaded.ar.model.freqs_cis, wrapper.ar.model.freqs_cis)
+            assert loaded.content_extractor_wide.proj_out.weight is loaded.content_extractor_wide.proj_in.weight
+            assert not any(tensor.is_meta for _, tensor in named_tensors(loaded))
+            mel = torch.randn(1, 8, 5)
+            assert torch.allclose(loaded.vocoder(mel), wrapper.vocoder(mel), atol=1e-6)
+
+
+def test_deferred_and_shared_groups_load_on_first_use():
+    torch.manual_seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "config.json"), "w") as f:
+            json.dump(BIGVGAN_CONFIG, f)
+        cfg = tiny_config(tmp)
+        wrapper = instantiate(cfg).eval()
+        path = os.path.join(tmp, "bundle.safetensors")
+        save_bundle(wrapper, cfg, path)
+
+        timbre = load_bundle(path, capabilities=("timbre",))
+        assert timbre.ar is None and timbre.content_extractor_narrow is None
+        timbre.ensure_capability("style")
+        _assert_same_tensors(wrapper, timbre, prefix="ar.")
+        _assert_same_tensors(wrapper, timbre, prefix="content_extractor_narrow.")
+
+        registry = ModelRegistry()
+        first = load_bundle(path, capabilities=("style",), registry=registry)
+        second = load_bundle(path, capabilities=("style",), registry=registry)
+        assert first.vocoder is second.vocoder
+        assert first.cfm.estimator is second.cfm.estimator
+        assert first.ar is not second.ar  # KV caches are per wrapper
+        _assert_same_tensors(wrapper, first)
+        first.release_shared()
+        second.release_shared()
+        assert len(registry) == 0
+
+
+def run_tests():
+    test_round_trip_keeps_every_tensor_and_tie()
+    test_deferred_and_shared_groups_load_on_first_use()
+    return True
+
+
+if __name__ == '__main__':
+    success = run_tests()
+    if success:
+        print("\n✅ 所有测试通过!")
+    else:
+        print("\n❌ 部分测试失败!")
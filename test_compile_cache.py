@@ -0,0 +1,51 @@
+import os
+import tempfile
+
+import torch
+
+from modules.compile_cache import CompileCache, cache_key
+
+
+CONFIG = {"cfm": {"_target_": "modules.v2.cfm.CFM", "estimator": {"hidden_dim": 512}}}
+
+
+def test_key_depends_on_model_dtype_and_torch():
+    key = cache_key(CONFIG, "cpu", torch.float32)
+    assert key == cache_key(dict(CONFIG), "cpu", torch.float32)
+    assert key.startswith(f"torch{torch.__version__}".replace("+", "_")) and "-cpu-float32-" in key
+    assert key != cache_key(CONFIG, "cpu", torch.float16)
+    other = {"cfm": {"_target_": "modules.v2.cfm.CFM", "estimator": {"hidden_dim": 768}}}
+    assert key != cache_key(other, "cpu", torch.float32)
+
+
+def test_activate_and_manifest():
+    previous = {name: os.environ.get(name) for name in ("TORCHINDUCTOR_CACHE_DIR", "TRITON_CACHE_DIR")}
+    with tempfile.TemporaryDirectory() as root:
+        try:
+            cache = CompileCache.for_model(root, CONFIG, "cpu", torch.float32).activate()
+            assert os.path.isdir(cache.path) and os.path.dirname(cache.path) == root
+            assert os.environ["TORCHINDUCTOR_CACHE_DIR"] == os.path.join(cache.path, "inductor")
+            assert not cache.is_warm
+            cache.write_manifest(chunk_seconds=[1.0, 2.0])
+            manifest = CompileCache.for_model(root, CONFIG, "cpu", torch.float32).read_manifest()
+            assert cache.is_warm and manifest["key"] == cache.key and manifest["chunk_seconds"] == [1.0, 2.0]
+        finally:
+            for name, value in previous.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+
+def run_tests():
+    test_key_depends_on_model_dtype_and_torch()
+    test_activate_and_manifest()
+    return True
+
+
+if __name__ == '__main__':
+    success = run_tests()
+    if success:
+        print("\n✅ 所有测试通过!")
+    else:
+        print("\n❌ 部分测试失败!")
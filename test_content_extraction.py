@@ -0,0 +1,101 @@
+from types import SimpleNamespace
+
+import torch
+from transformers import Wav2Vec2FeatureExtractor
+
+from modules.astral_quantization.bsq import BinarySphericalQuantize
+from modules.astral_quantization.convnext import ConvNeXtV2Stage
+from modules.astral_quantization.default_model import AstralQuantizer
+from modules.v2.vc_wrapper import VoiceConversionWrapper
+
+
+class FrameSSL(torch.nn.Module):
+    """Stands in for HuBERT: one hidden state per 320-sample frame, independent of the padding."""
+
+    def __init__(self, hidden_dim=32):
+        super().__init__()
+        self.proj = torch.nn.Linear(320, hidden_dim)
+
+    def forward(self, input_values, attention_mask=None):
+        frames = input_values[:, :input_values.size(1) // 320 * 320].reshape(input_values.size(0), -1, 320)
+        return SimpleNamespace(last_hidden_state=self.proj(frames))
+
+
+class TinyQuantizer(AstralQuantizer):
+    """AstralQuantizer around a real encoder / quantizer, without the tokenizer or HF downloads."""
+
+    def __init__(self, encoder, quantizer, ssl_model=None):
+        torch.nn.Module.__init__(self)
+        self.encoder = encoder
+        self.quantizer = quantizer
+        self.ssl_model = ssl_model
+        self.ssl_feature_extractor = Wav2Vec2FeatureExtractor(
+            feature_size=1, sampling_rate=16000, padding_value=0.0, do_normalize=True, return_attention_mask=True,
+        )
+        self.ssl_do_normalize = True
+        self.ssl_padding_value = 0.0
+
+
+def _quantizer(codebook_size, ssl_model=None):
+    encoder = ConvNeXtV2Stage(dim=16, intermediate_dim=32, num_blocks=2, dilation=1, input_dim=32)
+    for name, param in encoder.named_parameters():
+        if name.endswith(("gamma", "beta")):
+            torch.nn.init.normal_(param)  # GRN is the identity at its zero initialisation
+    return TinyQuantizer(encoder, BinarySphericalQuantize(codebook_size=codebook_size, dim=16, spherical=True), ssl_model)
+
+
+def content_wrapper():
+    """VoiceConversionWrapper with real ConvNeXt encoders and BSQ quantizers at toy sizes."""
+    torch.manual_seed(0)
+    wrapper = VoiceConversionWrapper(
+        sr=22050, hop_size=256, mel_fn=None, cfm=None, cfm_length_regulator=None,
+        content_extractor_narrow=_quantizer(32),
+        content_extractor_wide=_quantizer(2048, FrameSSL()),
+        ar_length_regulator=None, ar=None, style_encoder=None, vocoder=None,
+    )
+    return wrapper.eval()
+
+
+def _waves(*seconds):
+    generator = torch.Generator().manual_seed(1)
+    return [torch.randn(1, int(s * 16000), generator=generator) * 0.1 for s in seconds]
+
+
+@torch.no_grad()
+def test_batched_indices_match_single_items():
+    wrapper = content_wrapper()
+    waves = _waves(1.0, 2.3, 0.4)
+    wide, narrow = wrapper.extract_content(waves, narrow=True)
+    for wave, wide_indices, narrow_indices in zip(waves, wide, narrow):
+        [single_wide], [single_narrow] = wrapper.extract_content([wave], narrow=True)
+        assert wide_indices.shape == (1, wave.size(-1) // 320)
+        assert torch.equal(wide_indices, single_wide)
+        assert torch.equal(narrow_indices, single_narrow)
+
+
+@torch.no_grad()
+def test_batched_windows_match_serial_windows():
+    wrapper = content_wrapper()
+    # three windows of unequal length (30 s, 30 s, 20 s) next to a short file
+    waves = _waves(70.0, 3.0)
+    batched = wrapper._process_content_features_batch(waves, narrow=True)
+    wrapper.long_audio_batch_seconds = 30  # one window per SSL pass
+    for wave, (wide, narrow) in zip(waves, batched):
+        serial_wide, serial_narrow = wrapper._process_content_features(wave, narrow=True)
+        assert wide.shape == (1, wave.size(-1) // 320)
+        assert torch.equal(wide, serial_wide)
+        assert torch.equal(narrow, serial_narrow)
+
+
+def run_tests():
+    test_batched_indices_match_single_items()
+    test_batched_windows_match_serial_windows()
+    return True
+
+
+if __name__ == '__main__':
+    success = run_tests()
+    if success:
+        print("\n✅ 所有测试通过!")
+    else:
+        print("\n❌ 部分测试失败!")
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from download_models import download_models, verify_models
+from local_model_loader import manifest_path
+
+WEIGHTS = os.urandom(3 * 2 ** 20 + 123)
+CONFIG = b"model_type: dit\n"
+REPOS = {
+    "Plachta/Seed-VC": {"v2/cfm_small.pth": WEIGHTS, "config.yml": CONFIG},
+    "nvidia/bigvgan": {"bigvgan_generator.pt": WEIGHTS[:1000], "config.json": b"{}", ".gitattributes": b"*"},
+}
+MAPPING = {
+    "Plachta/Seed-VC": {"v2/cfm_small.pth": "seed-vc/v2/cfm_small.pth", "config.yml": "seed-vc/config.yml"},
+    "nvidia/bigvgan": "bigvgan/test",
+}
+
+
+class FakeHub(BaseHTTPRequestHandler):
+    """Minimal stand-in for the Hub API and resolve endpoints, with Range support."""
+    ranges = []
+    lfs = {"v2/cfm_small.pth", "bigvgan_generator.pt"}
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=()):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        for repo_id, files in REPOS.items():
+            if path == f"/api/models/{repo_id}/revision/main":
+                siblings = []
+                for name, data in files.items():
+                    sibling = {"rfilename": name}
+                    if name in self.lfs:
+                        sibling["lfs"] = {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data)}
+                    siblings.append(sibling)
+                return self._send(200, json.dumps({"siblings": siblings}).encode())
+            prefix = f"/{repo_id}/resolve/main/"
+            if path.startswith(prefix) and path[len(prefix):] in files:
+                data = files[path[len(prefix):]]
+                if "Range" in self.headers:
+                    start = int(self.headers["Range"][len("bytes="):].rstrip("-"))
+                    self.ranges.append(start)
+                    return self._send(206, data[start:], [("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")])
+                return self._send(200, data)
+        self._send(404, b"not found")
+
+
+def _serve():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeHub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_parallel_download_resume_and_verify():
+    server, endpoint = _serve()
+    try:
+        with tempfile.TemporaryDirectory() as models_dir:
+            # an interrupted earlier run left half of the checkpoint behind
+            partial = os.path.join(models_dir, "seed-vc/v2/cfm_small.pth.part")
+            os.makedirs(os.path.dirname(partial))
+            with open(partial, "wb") as f:
+                f.write(WEIGHTS[:2 ** 20])
+
+            succeeded, total = download_models(workers=4, endpoint=endpoint, models_dir=models_dir, mapping=MAPPING)
+            assert (succeeded, total) == (4, 4)
+            assert FakeHub.ranges == [2 ** 20]
+            with open(os.path.join(models_dir, "seed-vc/v2/cfm_small.pth"), "rb") as f:
+                assert f.read() == WEIGHTS
+            assert not os.path.exists(os.path.join(models_dir, "bigvgan/test/.gitattributes"))
+            with open(manifest_path("Plachta/Seed-VC", models_dir)) as f:
+                assert f"{hashlib.sha256(CONFIG).hexdigest()}  seed-vc/config.yml\n" in f.read()
+
+            report = verify_models(workers=4, models_dir=models_dir, mapping=MAPPING)
+            assert len(report["ok"]) == 4 and not report["corrupt"] and not report["missing"]
+
+            # a second run trusts the manifest instead of downloading again
+            assert download_models(endpoint=endpoint, models_dir=models_dir, mapping=MAPPING) == (4, 4)
+            assert FakeHub.ranges == [2 ** 20]
+
+            with open(os.path.join(models_dir, "seed-vc/v2/cfm_small.pth"), "r+b") as f:
+                f.write(b"\0" * 16)
+            os.remove(os.path.join(models_dir, "bigvgan/test/config.json"))
+            report = verify_models(models_dir=models_dir, mapping=MAPPING)
+            assert report["corrupt"] == ["seed-vc/v2/cfm_small.pth"]
+            assert report["missing"] == ["bigvgan/test/config.json"]
+    finally:
+        server.shutdown()
+
+
+def test_checksum_mismatch_is_rejected():
+    server, endpoint = _serve()
+    try:
+        with tempfile.TemporaryDirectory() as models_dir:
+            partial = os.path.join(models_dir, "seed-vc/v2/cfm_small.pth.part")
+            os.makedirs(os.path.dirname(partial))
+            with open(partial, "wb") as f:
+                f.write(b"garbage" * 100)  # resumed onto a corrupted prefix
+            succeeded, total = download_models(
+                ["Plachta/Seed-VC"], endpoint=endpoint, models_dir=models_dir, mapping=MAPPING
+            )
+            assert (succeeded, total) == (1, 2)
+            assert not os.path.exists(partial)
+            assert not os.path.exists(os.path.join(models_dir, "seed-vc/v2/cfm_small.pth"))
+    finally:
+        server.shutdown()
+
+
+def run_tests():
+    test_parallel_download_resume_and_verify()
+    test_checksum_mismatch_is_rejected()
+    return True
+
+
+if __name__ == '__main__':
+    success = run_tests()
+    if success:
+        print("\n✅ 所有测试通过!")
+    else:
+        print("\n❌ 部分测试失败!")
@@ -0,0 +1,43 @@
+from services.framing import (
+    FLAG_END_OF_STREAM,
+    HEADER_SIZE,
+    FrameError,
+    FrameHeader,
+    decode_frame,
+    encode_frame,
+)
+
+
+def test_frame_roundtrip():
+    payload = bytes(range(256)) * 4
+    header = FrameHeader(seq=7, timestamp_us=1_700_000_000_123_456, sample_count=len(payload) // 2,
+                         flags=FLAG_END_OF_STREAM, processing_us=1234)
+    data = encode_frame(header, payload)
+    assert len(data) == HEADER_SIZE + len(payload)
+    decoded, decoded_payload = decode_frame(data)
+    assert decoded == header
+    assert decoded.end_of_stream
+    assert decoded_payload == payload
+
+
+def test_raw_pcm_is_rejected():
+    for data in (b"", b"\x00\x01" * 100, b"SVCF"):
+        try:
+            decode_frame(data)
+        except FrameError:
+            continue
+        raise AssertionError(f"decoded non-frame message {data[:8]!r}")
+
+
+def run_tests():
+    test_frame_roundtrip()
+    test_raw_pcm_is_rejected()
+    return True
+
+
+if __name__ == '__main__':
+    success = run_tests()
+    if success:
+        print("\n✅ 所有测试通过!")
+    else:
+        print("\n❌ 部分测试失败!")
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import numpy as np
+from starlette.websockets import WebSocketState
+
+from services.audio_codec import CodecError, PCMCodec
+from services.inference_rpc import InferenceServer, RemoteService
+from services.metrics import ServiceMetrics
+from services.vc_service import ConversionConfig, stream_conversion
+from services.voice_library import VoiceProfile
+
+
+class FakeSession:
+    """Echoes decoded PCM back at half volume, one output chunk per call."""
+
+    def __init__(self, log, source_sample_rate):
+        self.session_id = "fake"
+        self.codec = PCMCodec(source_sample_rate, 22050)
+        self.input_rate = source_sample_rate
+        self.output_rate = 22050
+        self.config = ConversionConfig(chunk_seconds=1.0)
+        self.log = log
+        self.events = []
+
+    def process_audio(self, audio_bytes):
+        self.log.append(type(audio_bytes).__name__)
+        wave = self.codec.decode(audio_bytes)
+        self.events.append({"event": "quality", "samples": int(wave.size)})
+        return [self.codec.encode(wave * 0.5)]
+
+    def flush(self):
+        return [b"\x01\x00" * 3, b""]
+
+    def pop_events(self):
+        events, self.events = self.events, []
+        return events
+
+    def close(self):
+        self.log.append("closed")
+
+
+class FakeService:
+    def __init__(self):
+        self.log = []
+        self.metrics = ServiceMetrics()
+
+    def list_voices(self):
+        return [VoiceProfile(id="s1p1", title="S1p1", path="/voices/s1p1.wav")]
+
+    def create_session(self, voice_id, source_sample_rate, overrides=None, metrics=None):
+        if voice_id != "s1p1":
+            raise KeyError(voice_id)
+        return FakeSession(self.log, source_sample_rate)
+
+
+def _serve(service, path):
+    server = InferenceServer(service, path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_sessions_round_trip_through_shared_buffers():
+    service = FakeService()
+    with tempfile.TemporaryDirectory() as tmp:
+        servers = [_serve(service, os.path.join(tmp, f"inference-{i}.sock")) for i in range(2)]
+        try:
+            remote = RemoteService([server.server_address for server in servers])
+            remote.wait_ready(timeout=5, poll=0.05)
+            assert [voice.id for voice in remote.list_voices()] == ["s1p1"]
+
+            first = remote.create_session("s1p1", 16000)
+            second = remote.create_session("s1p1", 16000)
+            assert remote.active == [1, 1]  # least-loaded worker first
+            assert first.output_rate == 22050 and first.config.chunk_seconds == 1.0
+            assert first.codec.sample_count(b"\0" * 64) == 32
+
+            pcm = (np.linspace(-0.5, 0.5, 16000) * 32767).astype("<i2").tobytes()
+            [output] = first.process_audio(pcm)
+            expected = PCMCodec(16000, 22050).encode(np.frombuffer(pcm, "<i2").astype(np.float32) / 32768.0 * 0.5)
+            assert output == expected
+            assert first.pop_events() == [{"event": "quality", "samples": 16000}]
+            assert service.log == ["memoryview"]  # decoded straight from the shared buffer
+
+            # larger than the shared buffer: sent inline instead
+            big = b"\0\0" * (first.slab_in.size // 2 + 10)
+            [output] = first.process_audio(big)
+            assert len(output) == len(big) and service.log[-1] == "bytes"
+
+            try:
+                first.process_audio(b"\0" * 3)
+                raise AssertionError("odd-length pcm accepted")
+            except CodecError:
+                pass  # the session stays usable
+
+            assert first.flush() == [b"\x01\x00" * 3, b""]
+            first.close()
+            second.close()
+            assert remote.active == [0, 0]
+            assert service.log.count("closed") == 2
+
+            try:
+                remote.create_session("missing", 16000)
+                raise AssertionError("unknown voice accepted")
+            except KeyError:
+                pass
+            assert remote.active == [0, 0]
+            assert "seedvc_active_sessions" in remote.worker_metrics(1)
+        finally:
+            for server in servers:
+                server.shutdown()
+                server.server_close()
+        assert not [name for name in os.listdir(tmp)]
+
+
+class FakeWebSocket:
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.sent = []
+        self.close_code = None
+        self.application_state = self.client_state = WebSocketState.CONNECTED
+
+    async def receive(self):
+        if self.messages:
+            return self.messages.pop(0)
+        await asyncio.sleep(3600)  # the client keeps the connection open
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self, code=1000):
+        self.close_code = code
+        self.application_state = self.client_state = WebSocketState.DISCONNECTED
+
+
+def test_failed_workers_are_marked_down_and_reported():
+    service = FakeService()
+    with tempfile.TemporaryDirectory() as tmp:
+        server = _serve(service, os.path.join(tmp, "inference-1.sock"))
+        try:
+            remote = RemoteService([os.path.join(tmp, "missing.sock"), server.server_address])
+            first = remote.create_session("s1p1", 16000)
+            assert first.path == server.server_address
+            assert remote.down_until[0] > time.monotonic() and remote.active == [0, 1]
+            # the unreachable worker is skipped although it has fewer sessions
+            second = remote.create_session("s1p1", 16000)
+            assert second.path == server.server_address
+            second.close()
+
+            # the worker hangs up in the middle of the session
+            first.sock.shutdown(socket.SHUT_RD)
+            websocket = FakeWebSocket([{"type": "websocket.receive", "bytes": b"\0\0" * 160}])
+            asyncio.run(stream_conversion(websocket, first))
+            assert websocket.sent[0]["event"] == "ready"
+            assert websocket.sent[-1]["event"] == "error" and "Conversion failed" in websocket.sent[-1]["message"]
+            assert websocket.close_code == 1011
+            assert remote.down_until[1] > time.monotonic() and remote.active == [0, 0]
+
+            remote.down_until = [0.0, 0.0]
+            remote.paths[1] = os.path.join(tmp, "gone.sock")
+            try:
+                remote.create_session("s1p1", 16000)
+                raise AssertionError("session opened without a reachable worker")
+            except OSError:
+                pass
+            assert all(until > time.monotonic() for until in remote.down_until) and remote.active == [0, 0]
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+def run_tests():
+    test_sessions_round_trip_through_shared_buffers()
+    test_failed_workers_are_marked_down_and_reported()
+    return True
+
+
+if __name__ == '__main__':
+    success = run_tests()
+    if success:
+        print("\n✅ 所有测试通过!")
+    else:
+        print("\n❌ 部分测试失败!")
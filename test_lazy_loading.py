@@ -0,0 +1,79 @@
+import threading
+import time
+
+from modules.lazy_loading import LazyComponents
+
+CAPABILITIES = {"timbre": ("cfm", "vocoder"), "style": ("cfm", "vocoder", "ar")}
+
+
+def _components(calls, delay=0.0):
+    def loader(group):
+        def load():
+            time.sleep(delay)
+            calls.append(group)
+        return load
+    return LazyComponents(CAPABILITIES, {group: loader(group) for group in ("cfm", "vocoder", "ar")})
+
+
+def test_loads_only_what_a_capability_needs():
+    calls = []
+    components = _components(calls)
+    components.ensure("timbre")
+    assert calls == ["cfm", "vocoder"]
+    assert not components.is_loaded("ar") and components.pending == {"ar"}
+    components.ensure("style")
+    components.ensure("style")
+    assert calls == ["cfm", "vocoder", "ar"]
+    try:
+        components.ensure("singing")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("unknown capability accepted")
+
+
+def test_failed_load_stays_pending():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("checkpoint not downloaded yet")
+
+    components = LazyComponents(CAPABILITIES, {"ar": flaky})
+    try:
+        components.load("ar")
+    except OSError:
+        pass
+    assert not components.is_loaded("ar")
+    components.load("ar")
+    assert components.is_loaded("ar") and len(attempts) == 2
+
+
+def test_prefetch_and_concurrent_use_load_once():
+    calls = []
+    components = _components(calls, delay=0.05)
+    thread = components.prefetch(["style"])
+    users = [threading.Thread(target=components.ensure, args=("style",)) for _ in range(4)]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    thread.join()
+    assert sorted(calls) == ["ar", "cfm", "vocoder"]
+    assert components.pending == set()
+
+
+def run_tests():
+    test_loads_only_what_a_capability_needs()
+    test_failed_load_stays_pending()
+    test_prefetch_and_concurrent_use_load_once()
+    return True
+
+
+if __name__ == '__main__':
+    success = run_tests()
+    if success:
+        print("\n✅ 所有测试通过!")
+    else:
+        print("\n❌ 部分测试失败!")
@@ -0,0 +1,120 @@
+import threading
+import time
+
+from modules.model_registry import ModelRegistry, model_key, private_view
+
+
+class FakeModel:
+    def __init__(self):
+        self.training = True
+        self.requires_grad = True
+
+    def eval(self):
+        self.training = False
+        return self
+
+    def requires_grad_(self, requires_grad=True):
+        self.requires_grad = requires_grad
+        return self
+
+
+def test_same_key_is_loaded_once_and_shared():
+    registry = ModelRegistry()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return FakeModel()
+
+    key = model_key(FakeModel, "campplus_cn_common.bin", "torch.float32", "cuda:0")
+    assert key == (f"{__name__}.FakeModel", "campplus_cn_common.bin", "torch.float32", "cuda:0")
+    first = registry.acquire(key, loader)
+    second = registry.acquire(key, loader)
+    assert first is second and len(loads) == 1
+    assert not first.training and not first.requires_grad
+    assert registry.refcount(key) == 2
+
+    other = registry.acquire(model_key(FakeModel, "campplus_cn_common.bin", "torch.float32", "cpu"), loader)
+    assert other is not first and len(loads) == 2 and len(registry) == 2
+
+    registry.release(key)
+    assert registry.refcount(key) == 1
+    registry.release(key)
+    assert registry.refcount(key) == 0 and key not in registry.keys()
+    assert registry.acquire(key, loader) is not first and len(loads) == 3
+
+
+def test_failed_load_is_not_cached():
+    registry = ModelRegistry()
+    key = model_key("modules.bigvgan.bigvgan.BigVGAN", "missing", "torch.float32", "cpu")
+
+    def broken():
+        raise FileNotFoundError("missing")
+
+    try:
+        registry.acquire(key, broken)
+    except FileNotFoundError:
+        pass
+    assert registry.refcount(key) == 0 and len(registry) == 0
+    assert isinstance(registry.acquire(key, FakeModel), FakeModel)
+
+
+def test_concurrent_acquire_loads_once():
+    registry = ModelRegistry()
+    loads = []
+
+    def slow_loader():
+        loads.append(1)
+        time.sleep(0.05)
+        return FakeModel()
+
+    key = model_key(FakeModel, "dit.pth", "torch.float16", "cuda:0")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.acquire(key, slow_loader))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1 and len(set(map(id, results))) == 1
+    assert registry.refcount(key) == 4
+
+
+class FakeModule:
+    def __init__(self, **children):
+        self._parameters = {"weight": object()}
+        self._buffers = {}
+        self._modules = dict(children)
+        self.profiler = None
+
+    def __getattr__(self, name):
+        modules = self.__dict__.get("_modules", {})
+        if name in modules:
+            return modules[name]
+        raise AttributeError(name)
+
+
+def test_private_view_keeps_shared_module_untouched():
+    transformer = FakeModule()
+    shared = FakeModule(transformer=transformer)
+    view = private_view(shared)
+    view.profiler = "profiler"
+    view._modules["transformer"] = "compiled"
+    assert shared.profiler is None and shared.transformer is transformer
+    assert view.transformer == "compiled"
+    assert view._parameters["weight"] is shared._parameters["weight"]
+
+
+def run_tests():
+    test_same_key_is_loaded_once_and_shared()
+    test_failed_load_is_not_cached()
+    test_concurrent_acquire_loads_once()
+    test_private_view_keeps_shared_module_untouched()
+    return True
+
+
+if __name__ == '__main__':
+    success = run_tests()
+    if success:
+        print("\n✅ 所有测试通过!")
+    else:
+        print("\n❌ 部分测试失败!")
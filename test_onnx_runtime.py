@@ -0,0 +1,101 @@
+import subprocess
+import sys
+
+import numpy as np
+import onnxruntime
+import torch
+import torchaudio
+
+from modules.audio import mel_spectrogram
+from modules.v2.cfm import CFM
+from modules.v2.dit_wrapper import DiT
+from modules.v2.onnx_runtime import MelSpectrogram, OnnxVoiceConversion, kaldi_fbank
+
+MEL_ARGS = dict(n_fft=1024, num_mels=80, sampling_rate=22050, hop_size=256, win_size=1024, fmin=0, fmax=8000)
+
+
+def _wave(seconds, sr, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    return (0.5 * np.sin(2 * np.pi * 220 * t) + 0.05 * rng.standard_normal(t.size)).astype(np.float32)
+
+
+def test_runtime_does_not_import_torch():
+    code = "import sys, modules.v2.onnx_runtime; sys.exit('torch' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
+
+
+def test_kaldi_fbank_matches_torchaudio():
+    wave = _wave(1.3, 16000)
+    expected = torchaudio.compliance.kaldi.fbank(
+        torch.from_numpy(wave)[None], num_mel_bins=80, dither=0, sample_frequency=16000
+    ).numpy()
+    actual = kaldi_fbank(wave)
+    assert actual.shape == expected.shape
+    assert np.abs(actual - expected).max() < 1e-3
+
+
+def test_mel_spectrogram_matches_modules_audio():
+    wave = _wave(1.1, 22050)
+    expected = mel_spectrogram(torch.from_numpy(wave)[None], **MEL_ARGS).numpy()
+    actual = MelSpectrogram(**MEL_ARGS)(wave)
+    assert actual.shape == expected.shape
+    assert np.abs(actual - expected).max() < 1e-3
+
+
+class TorchEstimatorRuntime(OnnxVoiceConversion):
+    """OnnxVoiceConversion whose estimator stage is the PyTorch DiT it would be exported from."""
+
+    def __init__(self, estimator, noise):
+        self.manifest = {"in_channels": estimator.in_channels}
+        self.estimator = estimator
+        self.noise = noise
+        self.rng = self
+        self._ort = onnxruntime
+
+    def standard_normal(self, shape):
+        assert shape == self.noise.shape
+        return self.noise.copy()
+
+    def run(self, stage, output=None, **inputs):
+        assert stage == "estimator"
+        inputs = {name: torch.from_numpy(np.ascontiguousarray(value)) for name, value in inputs.items()}
+        with torch.no_grad():
+            return self.estimator(**inputs).numpy()
+
+
+def test_cfm_inference_matches_cfm():
+    torch.manual_seed(0)
+    estimator = DiT(
+        time_as_token=True, style_as_token=True, uvit_skip_connection=False, block_size=256, depth=1,
+        num_heads=2, hidden_dim=16, in_channels=8, content_dim=16, style_encoder_dim=4,
+        class_dropout_prob=0.1, dropout_rate=0.0, attn_dropout_rate=0.0,
+    ).eval()
+    cfm = CFM(estimator).eval()
+    mu = torch.randn(1, 20, 16)
+    prompt = torch.randn(1, 8, 6)
+    style = torch.randn(1, 4)
+    for rates in ([0.7, 0.7], [0.0, 0.7], [0.7, 0.0], [0.0, 0.0]):
+        torch.manual_seed(1)
+        noise = torch.randn(1, 8, 20)
+        torch.manual_seed(1)
+        expected = cfm.inference(mu, torch.LongTensor([20]), prompt, style, 4, inference_cfg_rate=rates).numpy()
+        runtime = TorchEstimatorRuntime(estimator, noise.numpy())
+        actual = runtime.cfm_inference(mu.numpy(), 20, prompt.numpy(), style.numpy(), 4, inference_cfg_rate=rates)
+        assert np.abs(actual - expected).max() < 1e-4, rates
+
+
+def run_tests():
+    test_runtime_does_not_import_torch()
+    test_kaldi_fbank_matches_torchaudio()
+    test_mel_spectrogram_matches_modules_audio()
+    test_cfm_inference_matches_cfm()
+    return True
+
+
+if __name__ == '__main__':
+    success = run_tests()
+    if success:
+        print("\n✅ 所有测试通过!")
+    else:
+        print("\n❌ 部分测试失败!")
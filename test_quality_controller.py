@@ -0,0 +1,65 @@
+from services.quality import AdaptiveQualityController, build_quality_ladder
+from services.realtime_converter import RealtimeConfig, RealtimeConverter
+
+
+def test_ladder_gets_cheaper():
+    ladder = build_quality_ladder(10, [0.7, 0.7], extra_time=0.5)
+    assert ladder[0] == {"diffusion_steps": 10, "inference_cfg_rate": [0.7, 0.7], "extra_time": 0.5}
+    steps = [level["diffusion_steps"] for level in ladder]
+    assert steps == sorted(steps, reverse=True) and steps[-1] == 3
+    assert {"diffusion_steps": 5, "inference_cfg_rate": [0.0, 0.7], "extra_time": 0.5} in ladder
+    assert ladder[-1]["inference_cfg_rate"] == [0.0, 0.0]
+    assert ladder[-1]["extra_time"] < 0.5
+    assert all(a != b for a, b in zip(ladder, ladder[1:]))
+
+
+def test_controller_degrades_and_recovers():
+    controller = AdaptiveQualityController(0.25, build_quality_ladder(10, 0.7), degrade_after=2, upgrade_after=3)
+    assert controller.observe(0.3) is None
+    change = controller.observe(0.3)
+    assert change is not None and change.reason == "behind" and change.level == 1
+    assert change.as_event()["event"] == "quality"
+    assert controller.settings["diffusion_steps"] < 10
+    changes = [controller.observe(0.05) for _ in range(3)]
+    assert changes[:2] == [None, None]
+    assert changes[2].reason == "headroom" and controller.level == 0
+    assert controller.settings == {"diffusion_steps": 10, "inference_cfg_rate": 0.7}
+
+
+def test_hot_updates_keep_the_user_settings_on_top():
+    model_set = (None, None, None, None, None, {"sampling_rate": 22050, "hop_size": 256})
+    config = RealtimeConfig(diffusion_steps=10, inference_cfg_rate=0.7, adaptive_quality=True)
+    converter = RealtimeConverter(model_set, "cpu", config)
+    while converter.quality.level < len(converter.quality.ladder) - 1:
+        converter._adapt_quality(1.0)  # far behind the 0.25 s deadline
+    assert config.inference_cfg_rate == 0.0 and config.extra_time < 0.5
+
+    converter.update_settings(diffusion_steps=20)
+    assert config.diffusion_steps == 3  # applied by the processing thread, not the caller
+    converter._apply_pending_settings()
+    assert converter.quality.level == 0
+    assert converter.quality.settings == {"diffusion_steps": 20, "inference_cfg_rate": 0.7, "extra_time": 0.5}
+    assert (config.diffusion_steps, config.inference_cfg_rate, config.extra_time) == (20, 0.7, 0.5)
+
+
+def test_adaptive_quality_is_opt_in():
+    from services.vc_service import ConversionConfig
+
+    assert not RealtimeConfig().adaptive_quality
+    assert not ConversionConfig().adaptive_quality
+
+
+def run_tests():
+    test_ladder_gets_cheaper()
+    test_controller_degrades_and_recovers()
+    test_hot_updates_keep_the_user_settings_on_top()
+    test_adaptive_quality_is_opt_in()
+    return True
+
+
+if __name__ == '__main__':
+    success = run_tests()
+    if success:
+        print("\n✅ 所有测试通过!")
+    else:
+        print("\n❌ 部分测试失败!")
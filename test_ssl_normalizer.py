@@ -0,0 +1,49 @@
+import numpy as np
+import torch
+from transformers import Wav2Vec2FeatureExtractor
+
+from modules.astral_quantization.default_model import normalize_ssl_inputs
+
+
+def test_normalizer_matches_hf_extractor():
+    feature_extractor = Wav2Vec2FeatureExtractor(
+        feature_size=1,
+        sampling_rate=16000,
+        padding_value=0.0,
+        do_normalize=True,
+        return_attention_mask=True,
+    )
+    rng = np.random.default_rng(0)
+    lens = [16000, 5120, 321, 12345]
+    waves = [(rng.standard_normal(n) * rng.uniform(0.01, 0.5)).astype(np.float32) for n in lens]
+
+    expected = feature_extractor(
+        waves,
+        return_tensors='pt',
+        return_attention_mask=True,
+        padding=True,
+        sampling_rate=16000,
+    )
+    padded = torch.nn.utils.rnn.pad_sequence([torch.from_numpy(w) for w in waves], batch_first=True)
+    input_values, attention_mask = normalize_ssl_inputs(
+        padded,
+        lens,
+        do_normalize=feature_extractor.do_normalize,
+        padding_value=feature_extractor.padding_value,
+    )
+
+    assert torch.equal(attention_mask.long(), expected.attention_mask.long())
+    assert torch.allclose(input_values, expected.input_values, atol=1e-5)
+
+
+def run_tests():
+    test_normalizer_matches_hf_extractor()
+    return True
+
+
+if __name__ == '__main__':
+    success = run_tests()
+    if success:
+        print("\n✅ 所有测试通过!")
+    else:
+        print("\n❌ 部分测试失败!")
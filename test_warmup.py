@@ -0,0 +1,227 @@
+import asyncio
+import dataclasses
+import os
+import tempfile
+from functools import partial
+
+import numpy as np
+import soundfile as sf
+import torch
+
+from modules.audio import mel_spectrogram
+from modules.v2.cfm import CFM
+from modules.v2.dit_wrapper import DiT
+from modules.v2.length_regulator import InterpolateRegulator
+from modules.v2.vc_wrapper import VoiceConversionWrapper
+from services.vc_service import ConversionConfig, ConversionSession
+from services.voice_library import VoiceProfile
+from services.warmup import (
+    STATE_READY,
+    STATE_WARMING,
+    Readiness,
+    WarmupConfig,
+    run_warmup,
+    synthetic_speech,
+)
+
+
+class FakeVoice:
+    id = "s1p1"
+
+
+class FakeSession:
+    def __init__(self, log, overrides):
+        self.log = log
+        self.overrides = overrides
+
+    def process_audio(self, payload):
+        self.log.append(("process", self.overrides["chunk_seconds"], len(payload)))
+        return []
+
+    def flush(self):
+        self.log.append(("flush",))
+        return []
+
+    def close(self):
+        self.log.append(("close",))
+
+
+class FakeConfig:
+    chunk_seconds = 2.0
+
+
+class FakeService:
+    config_template = FakeConfig()
+
+    def __init__(self):
+        self.log = []
+        self.metrics = []
+
+    def list_voices(self):
+        return [FakeVoice()]
+
+    def create_session(self, voice_id, source_sample_rate, overrides=None, metrics=None):
+        assert voice_id == "s1p1" and source_sample_rate == 16000
+        assert overrides["vad"] == "off" and overrides["adaptive_quality"] is False
+        self.metrics.append(metrics)
+        return FakeSession(self.log, overrides)
+
+
+class TinyContentExtractor(torch.nn.Module):
+    """AstralQuantizer's SSL / quantizer interface at 50 Hz, with indices from frame energy."""
+
+    def extract_ssl_features(self, waves_16k, wave_lens):
+        frames = waves_16k.size(1) // 320
+        energy = waves_16k[:, :frames * 320].reshape(waves_16k.size(0), frames, 320).pow(2).mean(-1)
+        return energy.unsqueeze(1), (wave_lens // 320).clamp(max=frames)
+
+    def encode_ssl_features(self, hidden, lens):
+        indices = (hidden[:, 0].sqrt() * 100).long().clamp(0, 31)
+        return None, indices, lens
+
+
+class TinyStyleEncoder(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.proj = torch.nn.Linear(80, 4)
+
+    def forward(self, feat, feat_lens):
+        return self.proj(feat.mean(1))
+
+
+class TinyVocoder(torch.nn.Module):
+    def forward(self, mel):
+        return mel.mean(1, keepdim=True).repeat_interleave(256, dim=-1).tanh()
+
+
+def tiny_wrapper():
+    """VoiceConversionWrapper with the real CFM / DiT / length regulator at toy sizes."""
+    torch.manual_seed(0)
+    estimator = DiT(
+        time_as_token=True, style_as_token=True, uvit_skip_connection=False, block_size=1024, depth=1,
+        num_heads=2, hidden_dim=16, in_channels=8, content_dim=16, style_encoder_dim=4,
+        class_dropout_prob=0.1, dropout_rate=0.0, attn_dropout_rate=0.0,
+    )
+    wrapper = VoiceConversionWrapper(
+        sr=22050,
+        hop_size=256,
+        mel_fn=partial(mel_spectrogram, n_fft=1024, num_mels=8, sampling_rate=22050, hop_size=256,
+                       win_size=1024, fmin=0, fmax=None),
+        cfm=CFM(estimator),
+        cfm_length_regulator=InterpolateRegulator(channels=16, sampling_ratios=[1], is_discrete=True, codebook_size=32),
+        content_extractor_narrow=None,
+        content_extractor_wide=TinyContentExtractor(),
+        ar_length_regulator=None,
+        ar=None,
+        style_encoder=TinyStyleEncoder(),
+        vocoder=TinyVocoder(),
+    )
+    return wrapper.eval()
+
+
+class SessionService:
+    """Hands out real ConversionSessions on a wrapper, like VCService does."""
+
+    def __init__(self, wrapper, voice):
+        self.wrapper = wrapper
+        self.voice = voice
+        self.config_template = ConversionConfig(diffusion_steps=3, chunk_seconds=1.0)
+
+    def list_voices(self):
+        return [self.voice]
+
+    def create_session(self, voice_id, source_sample_rate, overrides=None, metrics=None):
+        config = ConversionConfig(**{**dataclasses.asdict(self.config_template), **(overrides or {})})
+        return ConversionSession(
+            voice=self.voice, wrapper=self.wrapper, device=torch.device("cpu"), dtype=torch.float32,
+            source_sample_rate=source_sample_rate, config=config, metrics=metrics,
+        )
+
+
+def test_synthetic_speech_is_loud_enough_for_every_stage():
+    wave = synthetic_speech(0.5, 16000)
+    assert wave.dtype == np.float32 and wave.size == 8000
+    assert 0.01 < np.sqrt(np.mean(wave ** 2)) < 0.5 and np.abs(wave).max() <= 1.0
+
+
+def test_warmup_runs_every_chunk_length():
+    service = FakeService()
+    results = run_warmup(service, WarmupConfig(chunk_seconds=(0.5, 1.0), iterations=2))
+    assert [(r["chunk_seconds"], r["iteration"]) for r in results] == [(0.5, 0), (0.5, 1), (1.0, 0), (1.0, 1)]
+    processed = [entry for entry in service.log if entry[0] == "process"]
+    assert processed[0] == ("process", 0.5, 16000) and processed[-1] == ("process", 1.0, 32000)
+    assert service.log.count(("close",)) == 4
+    # warmup sessions never report into the service's own metrics
+    assert all(metrics is not None for metrics in service.metrics)
+
+    default = run_warmup(FakeService(), WarmupConfig(iterations=1))
+    assert [r["chunk_seconds"] for r in default] == [2.0]
+
+
+def test_readiness_snapshot():
+    readiness = Readiness()
+    assert not readiness.ready and readiness.snapshot()["status"] == "starting"
+    readiness.set(STATE_WARMING)
+    readiness.set(STATE_READY)
+    snapshot = readiness.snapshot()
+    assert readiness.ready and snapshot["status"] == "ready" and "startup_seconds" in snapshot
+    readiness.fail(RuntimeError("no voices"))
+    assert not readiness.ready and readiness.snapshot()["error"] == "RuntimeError: no voices"
+
+
+def test_warmup_converts_through_real_sessions():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "voice.wav")
+        sf.write(path, synthetic_speech(1.0, 22050, seed=1), 22050)
+        service = SessionService(tiny_wrapper(), VoiceProfile(id="voice", title="Voice", path=path))
+        results = run_warmup(service, WarmupConfig(chunk_seconds=(1.0,), iterations=1, convert_style=False))
+    assert [r["chunk_seconds"] for r in results] == [1.0]
+
+
+def _ready_sample():
+    import svc_backend
+
+    response = asyncio.run(svc_backend.metrics())
+    assert response.status_code == 200
+    return [line for line in response.body.decode().splitlines() if line.startswith("seedvc_ready")]
+
+
+def test_metrics_are_served_while_loading():
+    import svc_backend
+
+    class LoadingService:
+        """Stands in for a RemoteService whose inference workers are still loading."""
+
+        def wait_ready(self):
+            self.while_loading = _ready_sample()
+
+    service = LoadingService()
+    create_service = svc_backend._create_service
+    svc_backend._create_service = lambda: service
+    try:
+        assert _ready_sample() == ["seedvc_ready 0.0"]
+        svc_backend._start_service(WarmupConfig(enabled=False))
+        assert service.while_loading == ["seedvc_ready 0.0"]
+        assert _ready_sample() == ["seedvc_ready 1.0"]
+    finally:
+        svc_backend._create_service = create_service
+        del svc_backend.app.state.vc_service
+        svc_backend.app.state.readiness = Readiness()
+        svc_backend.app.state.metrics = svc_backend.ServiceMetrics()
+
+
+def run_tests():
+    test_synthetic_speech_is_loud_enough_for_every_stage()
+    test_warmup_runs_every_chunk_length()
+    test_warmup_converts_through_real_sessions()
+    test_readiness_snapshot()
+    test_metrics_are_served_while_loading()
+    return True
+
+
+if __name__ == '__main__':
+    success = run_tests()
+    if success:
+        print("\n✅ 所有测试通过!")
+    else:
+        print("\n❌ 部分测试失败!")
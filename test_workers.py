@@ -0,0 +1,83 @@
+import os
+import signal
+import socket
+import time
+
+from services.metrics import ServiceMetrics
+from services.workers import PreforkServer, threads_per_worker, worker_count
+
+
+def _serve_one_at_a_time(sock, index):
+    # a worker busy with one connection cannot take another, like a GIL-bound session
+    while True:
+        conn, _ = sock.accept()
+        conn.sendall(f"{index} {os.getpid()}\n".encode())
+        conn.recv(1)  # hold the connection until the client closes it
+        conn.close()
+
+
+def _connect(address):
+    conn = socket.create_connection(address, timeout=10)
+    index, pid = conn.makefile().readline().split()
+    return conn, int(index), int(pid)
+
+
+def test_connections_spread_over_workers_and_crashed_workers_restart():
+    server = PreforkServer(_serve_one_at_a_time, workers=3, host="127.0.0.1", port=0, respawn_delay=0.0)
+    server.start()
+    try:
+        connections = [_connect(server.address) for _ in range(3)]
+        assert sorted(index for _, index, _ in connections) == [0, 1, 2]
+        assert {pid for _, _, pid in connections} == set(server.pids)
+        for conn, _, _ in connections:
+            conn.close()
+
+        crashed = next(pid for pid, index in server.pids.items() if index == 1)
+        os.kill(crashed, signal.SIGKILL)
+        deadline = time.monotonic() + 10
+        while crashed in server.pids and time.monotonic() < deadline:
+            server.reap(block=False)
+            time.sleep(0.01)
+        assert crashed not in server.pids
+        assert sorted(server.pids.values()) == [0, 1, 2]
+    finally:
+        server.stop(timeout=5)
+    assert not server.pids
+
+
+def test_worker_count_and_threads():
+    os.environ.pop("SEED_VC_WORKERS", None)
+    assert worker_count() == 1
+    assert worker_count(4) == 4
+    os.environ["SEED_VC_WORKERS"] = "auto"
+    try:
+        assert worker_count() == (os.cpu_count() or 1)
+    finally:
+        del os.environ["SEED_VC_WORKERS"]
+    assert threads_per_worker(os.cpu_count() or 1) == 1
+    assert threads_per_worker(10 ** 6) == 1
+
+
+def test_worker_label_on_every_sample():
+    metrics = ServiceMetrics()
+    metrics.observe_chunk("s1", 0.05, 0.5, 100)
+    metrics.registry.const_labels["worker"] = "2"
+    samples = [line for line in metrics.render().splitlines() if not line.startswith("#")]
+    assert samples and all('worker="2"' in line for line in samples)
+    assert 'seedvc_chunk_latency_seconds_bucket{worker="2",le="0.1"} 1' in samples
+    assert 'seedvc_session_rtf{worker="2",session="s1"} 0.1' in samples
+
+
+def run_tests():
+    test_connections_spread_over_workers_and_crashed_workers_restart()
+    test_worker_count_and_threads()
+    test_worker_label_on_every_sample()
+    return True
+
+
+if __name__ == '__main__':
+    success = run_tests()
+    if success:
+        print("\n✅ 所有测试通过!")
+    else:
+        print("\n❌ 部分测试失败!")
@@ -0,0 +1,174 @@
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+
+class AudioRingBuffer:
+    """
+    Single-producer / single-consumer ring buffer of float32 mono samples.
+
+    The producer only advances the write counter and the consumer only advances the
+    read counter, so neither side takes a lock; this keeps the audio callback free of
+    blocking calls when it is one of the two ends.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = int(capacity)
+        self._buffer = np.zeros(self.capacity, dtype=np.float32)
+        self._written = 0
+        self._read = 0
+
+    def available(self) -> int:
+        """Number of samples ready to be read."""
+        return self._written - self._read
+
+    def free(self) -> int:
+        """Number of samples that can be written without overwriting unread data."""
+        return self.capacity - self.available()
+
+    def write(self, data: np.ndarray) -> int:
+        """Append samples; samples that do not fit are dropped. Returns the number written."""
+        n = min(len(data), self.free())
+        if n <= 0:
+            return 0
+        start = self._written % self.capacity
+        first = min(n, self.capacity - start)
+        self._buffer[start:start + first] = data[:first]
+        self._buffer[:n - first] = data[first:n]
+        self._written += n
+        return n
+
+    def read(self, n: int) -> Optional[np.ndarray]:
+        """Pop exactly n samples, or return None if fewer are available."""
+        if self.available() < n:
+            return None
+        start = self._read % self.capacity
+        first = min(n, self.capacity - start)
+        out = np.empty(n, dtype=np.float32)
+        out[:first] = self._buffer[start:start + first]
+        out[first:] = self._buffer[:n - first]
+        self._read += n
+        return out
+
+
+class JitterStats:
+    """Per-block processing time and jitter-buffer health counters."""
+
+    def __init__(self, block_duration: float, history: int = 1000):
+        self.block_duration = block_duration
+        self.history = history
+        self.reset()
+
+    def reset(self) -> None:
+        self.processing_times = []
+        self.blocks = 0
+        self.deadline_misses = 0
+        self.underruns = 0
+        self.overruns = 0
+        self.min_output_fill = None
+
+    def record_processing(self, seconds: float) -> None:
+        self.blocks += 1
+        if seconds > self.block_duration:
+            self.deadline_misses += 1
+        self.processing_times.append(seconds)
+        if len(self.processing_times) > self.history:
+            self.processing_times = self.processing_times[-self.history:]
+
+    def record_output_fill(self, samples: int) -> None:
+        if self.min_output_fill is None or samples < self.min_output_fill:
+            self.min_output_fill = samples
+
+    def summary(self) -> Dict[str, float]:
+        times = np.asarray(self.processing_times, dtype=np.float64) * 1000.0
+        return {
+            "blocks": self.blocks,
+            "block_ms": self.block_duration * 1000.0,
+            "processing_ms_mean": float(times.mean()) if times.size else 0.0,
+            "processing_ms_p95": float(np.percentile(times, 95)) if times.size else 0.0,
+            "processing_ms_max": float(times.max()) if times.size else 0.0,
+            "jitter_ms": float(times.std()) if times.size else 0.0,
+            "deadline_misses": self.deadline_misses,
+            "underruns": self.underruns,
+            "overruns": self.overruns,
+            "min_output_fill": self.min_output_fill or 0,
+        }
+
+
+class RealtimeAudioPipeline:
+    """
+    Producer/consumer bridge between an audio device callback and a block processor.
+
+    The device callback only calls `push` (enqueue captured samples) and `pull`
+    (dequeue ready output, silence on underrun). A dedicated worker thread takes
+    `block_size` samples at a time, runs `process_fn` and enqueues the result.
+    `prefill_blocks` blocks of silence are queued up front so that processing may
+    take up to that many block periods before the output runs dry.
+    """
+
+    def __init__(
+        self,
+        process_fn: Callable[[np.ndarray], np.ndarray],
+        block_size: int,
+        sample_rate: int,
+        prefill_blocks: int = 1,
+        queue_blocks: int = 8,
+    ):
+        self.process_fn = process_fn
+        self.block_size = int(block_size)
+        self.sample_rate = sample_rate
+        self.prefill_blocks = max(0, int(prefill_blocks))
+        capacity = self.block_size * max(queue_blocks, self.prefill_blocks + 2)
+        self.input_ring = AudioRingBuffer(capacity)
+        self.output_ring = AudioRingBuffer(capacity)
+        self.stats = JitterStats(self.block_size / sample_rate)
+        self._input_ready = threading.Event()
+        self._running = False
+        self._thread = None
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self.stats.reset()
+        self.output_ring.write(np.zeros(self.block_size * self.prefill_blocks, dtype=np.float32))
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="vc-inference-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._running = False
+        self._input_ready.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+
+    def push(self, samples: np.ndarray) -> None:
+        """Called from the audio callback with captured mono samples."""
+        written = self.input_ring.write(samples)
+        if written < len(samples):
+            self.stats.overruns += 1
+        if self.input_ring.available() >= self.block_size:
+            self._input_ready.set()
+
+    def pull(self, frames: int) -> np.ndarray:
+        """Called from the audio callback; returns `frames` samples, zero-filled on underrun."""
+        self.stats.record_output_fill(self.output_ring.available())
+        out = self.output_ring.read(frames)
+        if out is None:
+            self.stats.underruns += 1
+            return np.zeros(frames, dtype=np.float32)
+        return out
+
+    def _run(self) -> None:
+        while self._running:
+            block = self.input_ring.read(self.block_size)
+            if block is None:
+                self._input_ready.wait(timeout=0.1)
+                self._input_ready.clear()
+                continue
+            start = time.perf_counter()
+            out = self.process_fn(block)
+            self.stats.record_processing(time.perf_counter() - start)
+            self.output_ring.write(np.asarray(out, dtype=np.float32).reshape(-1)[:self.block_size])
@@ -0,0 +1,85 @@
+"""
+Prebuild the torch.compile cache used by the V2 backend.
+
+Builds VCService with compilation on and the given cache directory, then converts
+synthetic audio at every chunk length the deployment serves, so inductor writes the
+compiled graphs, autotuning results and Triton kernels for exactly those shapes. The
+resulting directory (one subdirectory per torch version / GPU / dtype / model config, see
+modules/compile_cache.py) can be baked into the replica image; replicas started with the
+same SEED_VC_COMPILE and SEED_VC_COMPILE_CACHE then load the kernels instead of compiling.
+
+Run it on the same GPU type, torch build and model config as the replicas.
+
+Example:
+    python warm_compile_cache.py --cache-dir /opt/seed-vc/compile_cache --chunk-seconds 1.0 2.0
+    SEED_VC_COMPILE=ar SEED_VC_COMPILE_CACHE=/opt/seed-vc/compile_cache uvicorn svc_backend:app
+"""
+import argparse
+import json
+import time
+
+from modules.v2.vc_wrapper import CAPABILITIES
+from services.vc_service import VCService
+from services.warmup import WarmupConfig, run_warmup
+
+
+def main(args):
+    if not (args.compile_ar or args.compile_cfm):
+        raise SystemExit("Nothing to compile: pass --compile-ar and/or --compile-cfm")
+    start = time.perf_counter()
+    service = VCService(
+        voice_root=args.voice_root,
+        ar_checkpoint_path=args.ar_checkpoint_path,
+        cfm_checkpoint_path=args.cfm_checkpoint_path,
+        bundle_path=args.bundle_path,
+        capabilities=tuple(CAPABILITIES),
+        compile_ar=args.compile_ar,
+        compile_cfm=args.compile_cfm,
+        compile_cache=args.cache_dir,
+    )
+    cache = service.compile_cache
+    if cache.is_warm and not args.force:
+        print(f"{cache.path} is already warm (use --force to rebuild it):")
+        print(json.dumps(cache.read_manifest(), indent=2))
+        return
+
+    for convert_style in (False, True):
+        # timbre-only and style conversion run different graphs, warm both
+        warmup = WarmupConfig(
+            chunk_seconds=args.chunk_seconds,
+            iterations=args.iterations,
+            voice_id=args.voice_id,
+            convert_style=convert_style,
+        )
+        results = run_warmup(service, warmup)
+        for result in results:
+            print(f"convert_style={convert_style} chunk={result['chunk_seconds']}s "
+                  f"pass {result['iteration']}: {result['seconds']:.2f}s")
+    manifest = cache.write_manifest(
+        device=str(service.device),
+        dtype=str(service.dtype),
+        compiled=[name for name, enabled in (("ar", args.compile_ar), ("cfm", args.compile_cfm)) if enabled],
+        chunk_seconds=list(args.chunk_seconds) or [service.config_template.chunk_seconds],
+        seconds=round(time.perf_counter() - start, 2),
+    )
+    service.close()
+    print(f"Compile cache written to {cache.path}")
+    print(json.dumps(manifest, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompile the V2 model into a persistent torch.compile cache")
+    parser.add_argument("--cache-dir", type=str, required=True, help="Root directory of the compile cache")
+    parser.add_argument("--chunk-seconds", type=float, nargs="*", default=[],
+                        help="Chunk lengths served by the backend (default: the service default)")
+    parser.add_argument("--iterations", type=int, default=2, help="Conversions per chunk length")
+    parser.add_argument("--compile-ar", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--compile-cfm", action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the cache is already warm")
+    parser.add_argument("--voice-root", type=str, default="examples/reference")
+    parser.add_argument("--voice-id", type=str, default=None, help="Reference voice (default: first voice)")
+    parser.add_argument("--ar-checkpoint-path", type=str, default=None)
+    parser.add_argument("--cfm-checkpoint-path", type=str, default=None)
+    parser.add_argument("--bundle-path", type=str, default=None,
+                        help="safetensors bundle from convert_bundle.py (replaces both checkpoint paths)")
+    main(parser.parse_args())